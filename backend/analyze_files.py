@@ -1,25 +1,39 @@
 import os
 import json
-import csv
 import argparse
 import time
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
-from collections import Counter
 import sys
+from contextlib import nullcontext
 
-from modules.io_loader import read_file
-from modules.analyzer import analyze_text, detailed_analyze_text
+from modules.io_loader import DEFAULT_LOADER, LOADERS
+from modules.io_backends import DEFAULT_IO_BACKEND, IO_BACKENDS, make_io_pool
+from modules.analyzer import DEFAULT_ENGINE, ENGINES
 from modules.utils import params_from_nim
+from modules.batching import plan_batches
+from modules.pipeline import Aggregator, stream_analyze, stream_batches, stream_shared
+from modules.writers import ResultWriter
+from modules.columnar import ColumnarWriter
+from modules.cache import DEFAULT_CACHE_MB, ResultCache
+from modules.incremental import IncrementalState
+from modules.trace import Tracer
+from modules.protocol import open_result_stream
+from modules.manifest import load_manifest
+from modules.pack import analyze_blocks, load_pack, plan_pack_batches, time_blocks
+from modules.autotune import DEFAULT_AUTOTUNE_PATH, tune
+from modules.baseline import BASELINE_MODES, DEFAULT_BASELINE_PATH, format_speedup, measure_baseline
+from modules.ranges import (analyze_part, as_partial, auto_ranges, finish_partial,
+                            merge_partials, read_range, split_ranges)
 
 
-def list_text_files(folder='data'):
-    for name in sorted(os.listdir(folder)):
-        if name.lower().endswith('.txt'):
-            yield os.path.join(folder, name)
+class AnalysisCancelled(Exception):
+    """Raised by `main` when its `cancel` event is set mid-run."""
 
 
-def main(folder='data', max_workers_io=16, max_workers_cpu=None, detailed=False, top_k=20, write_files=False, limit_data=None):
-    files = list(list_text_files(folder))
+def select_files(folder, limit_data=None, manifest=None):
+    """The .txt files of `folder` in name order, taken from its corpus manifest."""
+    if manifest is None:
+        manifest = load_manifest(folder)
+    files = manifest.paths()
     # apply optional NIM limit
     data_limit = globals().get('_NIM_DATA_COUNT', None)
     if data_limit is not None:
@@ -27,138 +41,423 @@ def main(folder='data', max_workers_io=16, max_workers_cpu=None, detailed=False,
     # apply explicit CLI limit if provided
     if limit_data is not None:
         files = files[:limit_data]
-    print(f"Found {len(files)} .txt files in '{folder}'")
-
-    # --- Sequential baseline: run single-threaded single-process pass for timing
-    print('\nRunning sequential baseline (single-process, single-thread) for timing...')
-    seq_start = time.perf_counter()
-    seq_results = {}
-    if detailed:
-        analyzer_seq = detailed_analyze_text
+    return files
+
+
+def run_incremental(state_path, folder='data', max_workers_io=16, max_workers_cpu=None, detailed=False, top_k=20,
+                    limit_data=None, engine=DEFAULT_ENGINE, max_inflight=None, loader=DEFAULT_LOADER, quiet=False,
+                    state=None, manifest=None):
+    """Bring the aggregate persisted in `state_path` up to date with `folder`.
+
+    Only files added or changed since the previous run are analyzed; deleted
+    and changed files are subtracted from the totals first. The state is
+    saved only if something changed, and with `quiet` nothing is printed
+    either. A caller that keeps the IncrementalState and folder manifest
+    between runs (see watch) passes them as `state` and `manifest`.
+    """
+    if state is None:
+        state = IncrementalState.load(state_path, detailed, top_k)
+    start = time.perf_counter()
+    if manifest is None:
+        manifest = load_manifest(folder)
+    files = select_files(folder, limit_data, manifest)
+    todo, keys, deleted = state.diff(files)
+    if quiet and not todo and not deleted:
+        return state
+
+    for path in deleted:
+        state.forget(path)
+    for path, r, err in stream_analyze(todo, max_workers_io, max_workers_cpu, detailed, top_k,
+                                       engine, max_inflight, loader):
+        if err is not None:
+            print(f"Failed to process {path}: {err}")
+            state.forget(path)  # its old result is stale now
+            continue
+        state.update(path, keys[path], r)
+    if todo or deleted:
+        state.save(state_path)
+    elapsed = time.perf_counter() - start
+
+    agg = state.summary()
+    print(f"\nIncremental update of '{folder}': {len(todo)} added/changed, {len(deleted)} deleted, "
+          f"{len(files) - len(todo)} unchanged ({elapsed:.3f}s)")
+    print(json.dumps(agg, indent=2))
+    overall_top = state.aggregator.word_counter.most_common(1) if detailed else []
+    if overall_top:
+        print(f"  Top word: '{overall_top[0][0]}' (count: {overall_top[0][1]})")
+    return state
+
+
+def watch(interval, state_path, **kwargs):
+    """Poll the folder every `interval` seconds and apply changes as they appear.
+
+    The state stays in memory and is saved after each change. Every poll
+    stats the files to find the added, changed and deleted ones; the folder
+    is only listed again when its own signature changed (see
+    modules.manifest).
+    """
+    folder = kwargs.get('folder', 'data')
+    print(f"Watching '{folder}' every {interval}s (Ctrl+C to stop)")
+    state = IncrementalState.load(state_path, kwargs.get('detailed', False), kwargs.get('top_k', 20))
+    manifest = load_manifest(folder)
+    run_incremental(state_path, state=state, manifest=manifest, **kwargs)
+    try:
+        while True:
+            time.sleep(interval)
+            if not manifest.is_current():
+                manifest = load_manifest(folder)
+            run_incremental(state_path, quiet=True, state=state, manifest=manifest, **kwargs)
+    except KeyboardInterrupt:
+        print('\nStopped watching')
+
+
+def analyze_large_file(path, ranges=None, max_workers_io=16, max_workers_cpu=None, detailed=False, top_k=20,
+                       engine=DEFAULT_ENGINE, max_inflight=None, baseline='off', log=print):
+    """Analyze one (huge) file as whitespace-aligned byte ranges in parallel.
+
+    Threads read the ranges, processes analyze them, and the partial results
+    are merged into exactly what analyzing the whole text at once returns.
+    Any `baseline` other than 'off' times all ranges sequentially.
+    """
+    size = os.path.getsize(path)
+    if ranges is None:
+        ranges = auto_ranges(size, max_workers_cpu or os.cpu_count())
+    spans = [(path, start, end) for start, end in split_ranges(path, ranges)]
+    log(f"Analyzing '{path}' ({size} bytes) as {len(spans)} byte ranges")
+
+    # Sequential baseline over the same ranges, so memory stays bounded
+    seq_time = None
+    if baseline != 'off':
+        log('\nRunning sequential baseline (single-process, single-thread) for timing...')
+        seq_start = time.perf_counter()
+        for span in spans:
+            analyze_part(read_range(span), detailed, top_k, engine)
+        seq_time = max(time.perf_counter() - seq_start, 1e-6)
+        log(f'Sequential baseline time: {seq_time:.3f}s')
+
+    par_start = time.perf_counter()
+    parts = {}
+    for span, r, err in stream_analyze(spans, max_workers_io, max_workers_cpu, detailed, top_k,
+                                       engine, max_inflight, reader=read_range):
+        if err is not None:
+            raise RuntimeError(f'range {span[1]}-{span[2]} of {path}: {err}')
+        parts[span[1]] = as_partial(r)
+    # merging in file order keeps ties in top_words identical to a whole-file run
+    result = finish_partial(merge_partials([parts[s] for _, s, _ in spans]), top_k)
+    par_time = max(time.perf_counter() - par_start, 1e-6)
+
+    log('\nResult:')
+    log(json.dumps(result, indent=2, ensure_ascii=False))
+    log('\nPerformance:')
+    log(f'  Threads (I/O workers): {max_workers_io}')
+    log(f'  Processes (CPU workers): {max_workers_cpu or os.cpu_count()}')
+    if seq_time is not None:
+        log(f'  Sequential time: {seq_time:.3f}s')
+    log(f'  Parallel time:   {par_time:.3f}s')
+    log(f'  Read throughput: {size / par_time / 1e6:.2f} MB/s')
+    if seq_time is not None:
+        log(f'  Speedup: {seq_time / par_time:.2f}x')
+    return result
+
+
+def main(folder='data', max_workers_io=16, max_workers_cpu=None, detailed=False, top_k=20, write_files=False, limit_data=None,
+         batch=False, batch_bytes=None, compare_per_file=False, engine=DEFAULT_ENGINE, max_inflight=None,
+         loader=DEFAULT_LOADER, transport='pickle', cache_path=None, cache_max_mb=DEFAULT_CACHE_MB,
+         word_sketch=None, log=print, pools=None, progress=None, cancel=None,
+         baseline='off', baseline_path=DEFAULT_BASELINE_PATH, trace_path=None, records=None,
+         output_format='json', pack_path=None, io_backend=DEFAULT_IO_BACKEND, trace=False):
+    """Run the whole analysis and return its metrics as a dict.
+
+    Human-readable progress and the report go through `log` (print by
+    default). `pools` may hold a long-lived (ThreadPoolExecutor,
+    ProcessPoolExecutor) pair to run on instead of creating new pools.
+    Without them the read stage runs on an executor of `io_backend`
+    (modules.io_backends): a thread pool, or reads batched from an asyncio
+    event loop with `max_workers_io` as its read concurrency.
+
+    `progress(phase, done, total)` is called as files complete, phase being
+    'baseline' or 'analysis'. Setting the `cancel` threading.Event stops the
+    run with AnalysisCancelled.
+
+    `baseline` is one of modules.baseline.BASELINE_MODES; with 'off' no
+    sequential pass runs and speedup/efficiency are None.
+
+    With `trace` or `trace_path`, per-stage timings, queue depth, worker
+    utilization and IPC bytes of the parallel pass are collected and
+    returned under 'trace' (None otherwise); with `trace_path` the
+    individual spans are also written there as Chrome trace JSON (open in
+    chrome://tracing or ui.perfetto.dev).
+
+    A `records` ResultStream (modules.protocol) with per_file set gets a
+    'file' record for every analyzed or failed file.
+
+    With `write_files`, `output_format` 'json' writes results.json and
+    results.csv, 'columnar' the results.cols directory (modules.columnar).
+
+    With `pack_path` the corpus is read from that pack directory
+    (modules.pack) instead of `folder`: workers get batches of blocks and
+    read them with `loader` I/O, results keep the files' original paths.
+    The result cache does not apply to packs and any `baseline` other than
+    'off' times every block sequentially.
+    """
+    tpool, ppool = pools if pools is not None else (None, None)
+    pack = blocks = manifest = None
+    if pack_path:
+        pack = load_pack(pack_path)
+        data_limit = globals().get('_NIM_DATA_COUNT', None)
+        limits = [n for n in (data_limit, limit_data) if n is not None]
+        blocks = pack.blocks(min(limits) if limits else None)
+        files = [path for block in blocks for path, _, _ in block.members]
+        log(f"Found {len(files)} packed files in '{pack_path}' ({len(blocks)} blocks, {pack.codec})")
     else:
-        analyzer_seq = analyze_text
+        manifest = load_manifest(folder)
+        files = select_files(folder, limit_data, manifest)
+        log(f"Found {len(files)} .txt files in '{folder}'")
 
-    for path in files:
-        try:
-            text = read_file(path)
-            seq_results[path] = analyzer_seq(text)
-        except Exception as e:
-            seq_results[path] = {'error': str(e)}
-    seq_end = time.perf_counter()
-    seq_time = seq_end - seq_start
-    print(f'Sequential baseline time: {seq_time:.3f}s')
+    # --- Sequential baseline (opt-in): only needed to report speedup
+    def tick(done):
+        if cancel is not None and cancel.is_set():
+            raise AnalysisCancelled()
+        if progress:
+            progress('baseline', done, len(files))
 
-    results = {}
-    word_counter = Counter()
-    len_hist = Counter()
+    if pack is None:
+        baseline_info = measure_baseline(baseline, files, engine, detailed, top_k, loader,
+                                         baseline_path, tick, log, manifest.stat)
+    elif baseline != 'off':
+        log('\nRunning sequential baseline over the pack blocks (single-process, single-thread)...')
+        baseline_info = {'seconds': sum(time_blocks(blocks, engine, detailed, top_k, loader, tick)),
+                         'ci': None, 'source': 'measured', 'files_timed': len(files)}
+    else:
+        baseline_info = None
+    seq_time = baseline_info['seconds'] if baseline_info else None
+    if baseline_info:
+        log(f"Sequential baseline time: {seq_time:.3f}s ({baseline_info['source']})")
+
+    # Results are aggregated and written out as they arrive; nothing per-file
+    # is kept in memory, and at most `max_inflight` texts are in flight.
+    aggregator = Aggregator(detailed, word_sketch)
+    writer = None
+    if write_files:
+        writer = ColumnarWriter(detailed=detailed) if output_format == 'columnar' else ResultWriter()
+    io_stats = {}
+    tracer = Tracer(events=trace_path is not None) if trace or trace_path else None
 
-    # Streaming pipeline: read -> immediately submit analysis to process pool
     par_start = time.perf_counter()
-    with ThreadPoolExecutor(max_workers=max_workers_io) as tpool, ProcessPoolExecutor(max_workers=max_workers_cpu) as ppool:
-        read_futures = {tpool.submit(read_file, path): path for path in files}
-        analyze_futures = {}
-
-        for read_fut in as_completed(read_futures):
-            path = read_futures[read_fut]
-            try:
-                text = read_fut.result()
-            except Exception as e:
-                print(f"Failed to read {path}: {e}")
-                continue
-
-            # choose analyzer
-            if detailed:
-                fut = ppool.submit(detailed_analyze_text, text, top_k)
-            else:
-                fut = ppool.submit(analyze_text, text)
-
-            analyze_futures[fut] = path
-
-        # collect analysis results
-        for fut in as_completed(analyze_futures):
-            path = analyze_futures[fut]
-            try:
-                r = fut.result()
-            except Exception as e:
-                print(f"Analysis failed for {path}: {e}")
-                continue
-
-            results[path] = r
-            if detailed:
-                # aggregate top words and len hist
-                for w, c in r.get('top_words', []):
-                    word_counter[w] += c
-                len_hist.update(r.get('len_histogram', {}))
-            else:
-                # no per-token info, skip
-                pass
 
+    # Serve unchanged files from the result cache; only the rest is analyzed
+    if cache_path and pack is not None:
+        log('Result cache is not used with a pack')
+        cache_path = None
+    cache = ResultCache(cache_path, cache_max_mb * 1024 * 1024) if cache_path else None
+    cache_keys = {}
+    todo = files
+    corpus = saved = None
+    if cache and writer is None and not (records is not None and records.per_file):
+        # nothing needs the files one by one: the aggregate of an earlier run
+        # over the same unchanged files is the whole answer
+        corpus = cache.corpus_key(files)
+        if corpus is not None:
+            saved = cache.get_aggregate(corpus, detailed, top_k, word_sketch)
+    if saved is not None:
+        aggregator.merge(saved)
+        todo = []
+        log('Reusing the cached aggregate of this corpus')
+        if progress:
+            progress('analysis', len(files), len(files))
+    elif cache:
+        def on_hit(path, r):
+            if records is not None and records.per_file:
+                records.file(path, r)
+            aggregator.add(r)
+            if writer:
+                writer.add(path, r)
+        todo, cache_keys = cache.partition(files, detailed, top_k, on_hit)
+
+    batches = []
+    used_batch_bytes = batch_bytes
+    read_pool = tpool
+    if read_pool is None and todo and pack is None and (transport == 'shm' or not batch):
+        # the read stage runs in this process, on an executor of the chosen backend
+        read_pool = make_io_pool(io_backend, max_workers_io)
+    # word counts are merged in the workers, one partial per task; only files
+    # that go into the cache need their own full counts
+    words = aggregator.add_words if cache is None else None
+    if not todo:
+        stream = iter(())
+    elif pack is not None:
+        # one task per batch of blocks; workers read and inflate the blocks themselves
+        batches, used_batch_bytes = plan_pack_batches(blocks, max_workers_cpu, batch_bytes)
+        stream = stream_batches(batches, max_workers_cpu, detailed, top_k, engine, max_inflight,
+                                loader, io_stats, ppool, tracer, analyze_blocks, words, word_sketch)
+    elif transport == 'shm':
+        # reader threads fill shared memory segments, one per batch
+        batches, used_batch_bytes = plan_batches(
+            todo, max_workers_cpu, batch_bytes, manifest.size_map())
+        stream = stream_shared(batches, used_batch_bytes, max_workers_io, max_workers_cpu,
+                               detailed, top_k, engine, max_inflight, io_stats, read_pool, ppool, tracer,
+                               words, word_sketch)
+    elif batch:
+        batches, used_batch_bytes = plan_batches(
+            todo, max_workers_cpu, batch_bytes, manifest.size_map())
+        stream = stream_batches(batches, max_workers_cpu, detailed, top_k,
+                                engine, max_inflight, loader, io_stats, ppool, tracer,
+                                words=words, word_sketch=word_sketch)
+    else:
+        stream = stream_analyze(todo, max_workers_io, max_workers_cpu, detailed, top_k,
+                                engine, max_inflight, loader, io_stats, read_pool, ppool, tracer=tracer,
+                                words=words, word_sketch=word_sketch)
+    failed = 0
+    try:
+        for path, r, err in stream:
+            if cancel is not None and cancel.is_set():
+                raise AnalysisCancelled()
+            if records is not None and records.per_file:
+                records.file(path, r, err)
+            if err is not None:
+                log(f"Failed to process {path}: {err}")
+                failed += 1
+            else:
+                agg_start = time.perf_counter()
+                aggregator.add(r)
+                if writer:
+                    writer.add(path, r)
+                if path in cache_keys:
+                    cache.put(cache_keys[path], detailed, top_k, r)
+                if tracer is not None:
+                    tracer.span('aggregate', agg_start, time.perf_counter())
+            if progress:
+                progress('analysis', aggregator.files + failed, len(files))
+        if corpus is not None and saved is None and failed == 0:
+            cache.put_aggregate(corpus, detailed, top_k, word_sketch, aggregator.partial())
+    finally:
+        # on cancel this drops the queued tasks of the stream
+        if hasattr(stream, 'close'):
+            stream.close()
+        if read_pool is not None and read_pool is not tpool:
+            read_pool.shutdown()
+        if cache:
+            cache.close()
     par_end = time.perf_counter()
     par_time = par_end - par_start
 
+    # Optionally time the per-file pipeline too so batching can be judged
+    per_file_time = None
+    if (batch or transport == 'shm') and compare_per_file and pack is None:
+        log('\nRunning per-file pipeline for comparison...')
+        pf_start = time.perf_counter()
+        with nullcontext(tpool) if tpool is not None else make_io_pool(io_backend, max_workers_io) as pf_pool:
+            # word partials are merged the same way, only not kept
+            for _ in stream_analyze(files, max_workers_io, max_workers_cpu, detailed, top_k,
+                                    engine, max_inflight, loader, tpool=pf_pool, ppool=ppool,
+                                    words=lambda partial: None, word_sketch=word_sketch):
+                pass
+        per_file_time = time.perf_counter() - pf_start
+
     # Aggregate summary
-    total_files = len(results)
-    agg = {'files': total_files, 'words': 0, 'vowels': 0,
-           'digits': 0, 'symbols': 0, 'avg_len': 0}
-    avg_lens = []
-    for r in results.values():
-        agg['words'] += r.get('words', 0)
-        agg['vowels'] += r.get('vowels', 0)
-        agg['digits'] += r.get('digits', 0)
-        agg['symbols'] += r.get('symbols', 0)
-        avg_lens.append(r.get('avg_len', 0))
-
-    agg['avg_len'] = sum(avg_lens) / len(avg_lens) if avg_lens else 0
-
-    print('\nAggregate statistics:')
-    print(json.dumps(agg, indent=2))
+    agg = aggregator.summary()
+    total_files = agg['files']
+
+    log('\nAggregate statistics:')
+    log(json.dumps(agg, indent=2))
 
     # Performance metrics
     cpu_workers = max_workers_cpu if max_workers_cpu is not None else os.cpu_count()
     par_time = max(par_time, 1e-6)
-    seq_time = max(seq_time, 1e-6)
     throughput = total_files / par_time
-    speedup = seq_time / par_time
-    efficiency = speedup / float(cpu_workers) if cpu_workers else 0.0
-
-    print('\nPerformance:')
-    print(f'  Threads (I/O workers): {max_workers_io}')
-    print(f'  Processes (CPU workers): {cpu_workers}')
-    print(f'  Sequential time: {seq_time:.3f}s')
-    print(f'  Parallel time:   {par_time:.3f}s')
-    print(f'  Throughput: {throughput:.2f} files/s')
-    print(f'  Speedup: {speedup:.2f}x')
-    print(f'  Efficiency: {efficiency:.3f}')
+    byte_throughput = io_stats.get('bytes_read', 0) / par_time
+    speedup = efficiency = None
+    if seq_time is not None:
+        speedup = seq_time / par_time
+        efficiency = speedup / float(cpu_workers) if cpu_workers else 0.0
+
+    log('\nPerformance:')
+    log(f'  Threads (I/O workers): {max_workers_io}')
+    log(f'  Processes (CPU workers): {cpu_workers}')
+    log(f'  I/O backend: {io_backend}')
+    log(f'  Engine: {engine}')
+    log(f'  Loader: {loader}')
+    if pack is not None:
+        log(f'  Pack: {pack_path} ({pack.codec}, {pack.stored_bytes} bytes stored)')
+    else:
+        log(f'  Transport: {transport}')
+    if baseline_info:
+        log(f"  Sequential time: {seq_time:.3f}s ({baseline_info['source']})")
+    else:
+        log('  Sequential time: n/a (baseline off, use --baseline)')
+    log(f'  Parallel time:   {par_time:.3f}s')
+    log(f'  Throughput: {throughput:.2f} files/s')
+    log(f'  Read throughput: {byte_throughput / 1e6:.2f} MB/s')
+    if baseline_info:
+        log(f'  Speedup: {format_speedup(baseline_info, par_time)}')
+        log(f'  Efficiency: {efficiency:.3f}')
+    if pack is not None:
+        log(f'  Batches: {len(batches)} of {len(blocks)} blocks (~{used_batch_bytes} bytes each)')
+    elif batch or transport == 'shm':
+        log(f'  Batches: {len(batches)} (~{used_batch_bytes} bytes each)')
+    if cache:
+        log(f'  Cache: {cache.hits} hits, {cache.misses} misses'
+            + (', aggregate reused' if cache.aggregate_hit else ''))
+    if transport == 'shm' and 'ipc_payload_bytes' in io_stats:
+        log(f"  IPC bytes saved: {io_stats['ipc_payload_bytes'] - io_stats['ipc_descriptor_bytes']} "
+            f"({io_stats['ipc_descriptor_bytes']} descriptor bytes sent instead of {io_stats['ipc_payload_bytes']})")
+    if per_file_time is not None:
+        log(f'  Per-file pipeline time: {per_file_time:.3f}s')
+        log(
+            f'  Speedup vs per-file: {per_file_time / par_time:.2f}x')
+    trace = None
+    if tracer is not None:
+        trace = tracer.summary(par_time)
+        tracer.report(log)
+        log(f"  IPC bytes: {trace['ipc_bytes'].get('to_workers', 0)} to workers, "
+            f"{trace['ipc_bytes'].get('from_workers', 0)} from workers")
+    if trace_path:
+        tracer.write_chrome_trace(trace_path)
+        log(f'  Trace written to {trace_path}')
 
     # add overall top-K if detailed
-    overall_top = word_counter.most_common(top_k) if detailed else []
+    overall_top = aggregator.word_counter.most_common(top_k) if detailed else []
 
     # Example output: top-1 word (if available) and brief metrics
-    print('\nExample analysis result:')
-    print(f"  Total files processed: {total_files}")
-    print(f"  Total words: {agg['words']}")
+    log('\nExample analysis result:')
+    log(f"  Total files processed: {total_files}")
+    log(f"  Total words: {agg['words']}")
     if overall_top:
         top_word, top_count = overall_top[0]
-        print(f"  Top word: '{top_word}' (count: {top_count})")
+        log(f"  Top word: '{top_word}' (count: {top_count})")
+        if word_sketch:
+            log(f"  Word counts from a {word_sketch}-word sketch, "
+                f"each may be low by at most {aggregator.word_counter.error}")
     else:
-        print('  Top word: n/a (detailed analysis not enabled)')
+        log('  Top word: n/a (detailed analysis not enabled)')
 
     # Optionally write results to files. By default we only print to terminal.
-    if write_files:
-        with open('results.json', 'w', encoding='utf-8') as f:
-            json.dump({'aggregate': agg, 'per_file': results, 'top_words': overall_top,
-                      'len_histogram': dict(len_hist)}, f, ensure_ascii=False, indent=2)
+    if writer:
+        writer.close(agg, overall_top, dict(aggregator.len_hist))
+        log('\nWrote ' + ('results.cols/' if output_format == 'columnar' else 'results.json and results.csv'))
 
-        # CSV (per-file basic metrics)
-        with open('results.csv', 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['file', 'words', 'vowels',
-                            'digits', 'symbols', 'avg_len'])
-            for path, r in results.items():
-                writer.writerow([os.path.basename(path), r.get('words', 0), r.get(
-                    'vowels', 0), r.get('digits', 0), r.get('symbols', 0), r.get('avg_len', 0)])
-
-        print('\nWrote results.json and results.csv')
+    return {
+        'files_processed': total_files,
+        'files_failed': failed,
+        'total_words': agg['words'],
+        'aggregate': agg,
+        'top_words': overall_top,
+        'len_histogram': dict(aggregator.len_hist),
+        'sequential_time': seq_time,
+        'sequential_ci': baseline_info['ci'] if baseline_info else None,
+        'baseline_source': baseline_info['source'] if baseline_info else None,
+        'parallel_time': par_time,
+        'throughput': throughput,
+        'bytes_read': io_stats.get('bytes_read', 0),
+        'byte_throughput': byte_throughput,
+        'speedup': speedup,
+        'efficiency': efficiency,
+        'cpu_workers': cpu_workers,
+        'io_backend': io_backend,
+        'cache': cache.summary() if cache else None,
+        'per_file_time': per_file_time,
+        'trace': trace,
+    }
 
 
 def build_parser():
@@ -166,6 +465,9 @@ def build_parser():
         description='Parallel File Analyzer: threads for I/O, processes for CPU-bound analysis')
     p.add_argument('--folder', default='data',
                    help='Folder containing .txt files')
+    p.add_argument('--rescan', action='store_true',
+                   help='Stat every file of the folder again instead of trusting the stored corpus manifest while '
+                        'the folder itself is unchanged (catches files rewritten in place)')
     p.add_argument('--io-workers', type=int, default=16,
                    help='Number of threads for I/O')
     p.add_argument('--cpu-workers', type=int, default=None,
@@ -182,6 +484,65 @@ def build_parser():
                    help='Process only first N files')
     p.add_argument('--write-files', action='store_true',
                    help='Write results.json and results.csv (default: print only)')
+    p.add_argument('--output-format', choices=('json', 'columnar'), default='json',
+                   help='With --write-files: results.json + results.csv, or a results.cols/ directory of binary '
+                        'columns written in row groups and memory-mapped back by modules.columnar.load_columns')
+    p.add_argument('--batch', action='store_true',
+                   help='Send batches of file paths to the worker processes instead of one task per file')
+    p.add_argument('--batch-bytes', type=int, default=None,
+                   help='Target bytes per batch (default: picked from corpus size and worker count)')
+    p.add_argument('--compare-per-file', action='store_true',
+                   help='With --batch or --transport shm, also time the per-file pipeline and report the speedup against it')
+    p.add_argument('--io-backend', choices=IO_BACKENDS, default=DEFAULT_IO_BACKEND,
+                   help='Read stage: a pool of --io-workers threads (thread), or an asyncio event loop that batches '
+                        'up to --io-workers concurrent reads onto a few threads (asyncio)')
+    p.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE,
+                   help='Analysis engine: single-pass byte classifier (fast) or the reference generator scans (python)')
+    p.add_argument('--loader', choices=LOADERS, default=DEFAULT_LOADER,
+                   help='File reader: decode to str (text) or hand raw bytes from a memory map to the analyzers (mmap)')
+    p.add_argument('--transport', choices=('pickle', 'shm'), default='pickle',
+                   help='How file contents reach the worker processes: pickled per task, or through shared memory segments (shm)')
+    p.add_argument('--cache', default=None, metavar='PATH',
+                   help='SQLite file caching per-file results; unchanged files are not re-analyzed')
+    p.add_argument('--cache-max-mb', type=int, default=DEFAULT_CACHE_MB,
+                   help='Size limit of the result cache, least recently used entries are evicted')
+    p.add_argument('--incremental', default=None, metavar='STATE',
+                   help='Keep the aggregate in STATE and only analyze files added, changed or deleted since the last run')
+    p.add_argument('--watch', type=float, default=None, metavar='SECONDS',
+                   help='With --incremental, keep running and apply folder changes every SECONDS')
+    p.add_argument('--word-sketch', type=int, default=None, metavar='N',
+                   help='Keep global word counts in a Misra-Gries summary of N words (bounded memory, reported error bound) instead of exact counts')
+    p.add_argument('--max-inflight', type=int, default=None,
+                   help='Max files (or batches with --batch) read but not yet analyzed; bounds memory use')
+    p.add_argument('--baseline', choices=BASELINE_MODES, default='off',
+                   help='Sequential baseline for speedup: none (off), time every file (full), a sample with a 95%% '
+                        'confidence interval (sample), or reuse one stored for this corpus/analyzer/machine (cached)')
+    p.add_argument('--baseline-file', default=DEFAULT_BASELINE_PATH,
+                   help='Where measured baselines are stored for --baseline full/cached')
+    p.add_argument('--autotune', action='store_true',
+                   help='Pick I/O workers, CPU workers and batching from short calibration probes on the corpus '
+                        '(cached per machine and corpus profile); overrides --io-workers/--cpu-workers/--batch')
+    p.add_argument('--retune', action='store_true',
+                   help='With --autotune, probe again even if a cached configuration exists')
+    p.add_argument('--autotune-file', default=DEFAULT_AUTOTUNE_PATH,
+                   help='Where tuned configurations are cached')
+    p.add_argument('--trace', default=None, metavar='PATH',
+                   help='Write the spans of the parallel pass as Chrome trace JSON (chrome://tracing, ui.perfetto.dev); '
+                        'implies --stage-timings')
+    p.add_argument('--stage-timings', action='store_true',
+                   help='Time every pipeline stage and count IPC bytes, and report them under Performance')
+    p.add_argument('--result-stream', default=None, metavar='PATH',
+                   help="Write the result as JSON lines (modules/protocol.py) to PATH; '-' uses stdout "
+                        "and moves the human-readable report to stderr")
+    p.add_argument('--stream-files', action='store_true',
+                   help='With --result-stream, also emit one record per file')
+    p.add_argument('--file', default=None, metavar='PATH',
+                   help='Analyze this single (large) file split into byte ranges instead of a folder')
+    p.add_argument('--ranges', type=int, default=None,
+                   help='With --file, number of byte ranges (default: from file size and worker count)')
+    p.add_argument('--pack', default=None, metavar='PATH',
+                   help='Read the corpus from a pack directory made by pack_corpus.py instead of --folder; '
+                        '--loader picks sequential reads (text) or mmap for its segments')
     return p
 
 
@@ -208,6 +569,10 @@ if __name__ == '__main__':
             print('Or run the same via analyze_files.py:')
             print('    mpiexec -n 4 python .\\analyze_files.py --mpi --write-files')
             sys.exit(1)
+    # Open the result stream first so that, on stdout, nothing else is printed there
+    records = open_result_stream(args.result_stream, args.stream_files) if args.result_stream else None
+    if records:
+        records.start('analyze_files', vars(args))
     # If NIM provided, derive parameters and trim file list accordingly
     if args.nim:
         try:
@@ -223,5 +588,47 @@ if __name__ == '__main__':
         except Exception as e:
             print(f"Failed to derive params from NIM: {e}")
 
-    main(folder=args.folder, max_workers_io=args.io_workers,
-         max_workers_cpu=args.cpu_workers, detailed=args.detailed, top_k=args.top_k, write_files=args.write_files, limit_data=args.limit_data)
+    if args.pack and (args.file or args.incremental or args.autotune):
+        parser.error('--pack cannot be combined with --file, --incremental or --autotune')
+
+    if args.rescan and not (args.pack or args.file):
+        load_manifest(args.folder, refresh=True)  # later loads in this run reuse it
+
+    if args.file:
+        result = analyze_large_file(args.file, args.ranges, args.io_workers, args.cpu_workers, args.detailed,
+                                    args.top_k, args.engine, args.max_inflight, args.baseline)
+        if records:
+            records.summary({'file': args.file, 'result': result})
+            records.close()
+        sys.exit(0)
+
+    if args.incremental:
+        options = dict(folder=args.folder, max_workers_io=args.io_workers, max_workers_cpu=args.cpu_workers,
+                       detailed=args.detailed, top_k=args.top_k, limit_data=args.limit_data, engine=args.engine,
+                       max_inflight=args.max_inflight, loader=args.loader)
+        if args.watch:
+            watch(args.watch, args.incremental, **options)
+        else:
+            run_incremental(args.incremental, **options)
+        sys.exit(0)
+
+    if args.autotune:
+        manifest = load_manifest(args.folder)
+        config = tune(select_files(args.folder, args.limit_data, manifest), args.engine, args.detailed,
+                      args.top_k, args.loader, args.autotune_file, args.retune, sizes=manifest.size_map())
+        args.io_workers = config['io_workers']
+        args.cpu_workers = config['cpu_workers']
+        args.batch = config['batch']
+        args.batch_bytes = config['batch_bytes']
+
+    summary = main(folder=args.folder, max_workers_io=args.io_workers,
+                   max_workers_cpu=args.cpu_workers, detailed=args.detailed, top_k=args.top_k, write_files=args.write_files, limit_data=args.limit_data,
+                   batch=args.batch, batch_bytes=args.batch_bytes, compare_per_file=args.compare_per_file,
+                   engine=args.engine, max_inflight=args.max_inflight,
+                   loader=args.loader, transport=args.transport,
+                   cache_path=args.cache, cache_max_mb=args.cache_max_mb,
+                   word_sketch=args.word_sketch, baseline=args.baseline, baseline_path=args.baseline_file,
+                   trace_path=args.trace, trace=args.stage_timings, records=records, output_format=args.output_format, pack_path=args.pack, io_backend=args.io_backend, progress=records.progress if records else None)
+    if records:
+        records.summary(summary)
+        records.close()
@@ -1,55 +1,404 @@
 from mpi4py import MPI
 from mpi4py.futures import MPIPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 import os
 import argparse
+import io
+import csv
 import time
 import json
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from array import array
 from collections import Counter
-from modules.io_loader import read_file
-from modules.analyzer import analyze_text, detailed_analyze_text
+
+import numpy as np
+from modules.io_loader import DEFAULT_LOADER, LOADERS
+from modules.io_backends import DEFAULT_IO_BACKEND, IO_BACKENDS, make_io_pool
+from modules.analyzer import DEFAULT_ENGINE, ENGINES
 from modules.utils import params_from_nim
+from modules.pipeline import Aggregator, stream_analyze, stream_batches, stream_shared
+from modules.batching import auto_batch_bytes, balance_by_bytes, file_size, make_batches, plan_batches
+from modules.cache import DEFAULT_CACHE_MB, ResultCache
+from modules.wordcount import MisraGries, pack_counter, unpack_counter
+from modules.writers import CSV_HEADER, csv_row, without_counts
+from modules.baseline import (BASELINE_MODES, DEFAULT_BASELINE_PATH, BaselineStore, baseline_key,
+                              choose_sample, extrapolate, format_speedup, time_files)
+from modules.protocol import PROGRESS_INTERVAL, open_result_stream, reserve_stdout
+from modules.manifest import load_manifest, stat_file
+from modules.pack import analyze_blocks, block_sizes, load_pack, time_blocks
+from modules.ranges import analyze_part, auto_ranges, finish_partial, merge_partials, read_range, split_ranges
+
+
+class ChunkQueue:
+    """Self-scheduling work queue shared by all ranks.
+
+    Every rank holds the same list of chunks; the index of the next
+    unclaimed chunk lives in an MPI window on rank 0 and is claimed with an
+    atomic Fetch_and_op, so ranks pull work as fast as they finish it with
+    no master rank and no messages to wait for.
+    """
+
+    def __init__(self, comm, chunks):
+        self.chunks = chunks
+        self.claimed = 0
+        itemsize = MPI.INT64_T.Get_size()
+        self.win = MPI.Win.Allocate(itemsize if comm.Get_rank() == 0 else 0, itemsize, comm=comm)
+        if comm.Get_rank() == 0:
+            self.win.Lock(0)
+            self.win.Put(array('q', [0]), 0)
+            self.win.Unlock(0)
+        comm.Barrier()
+
+    def next_index(self):
+        one = array('q', [1])
+        out = array('q', [0])
+        self.win.Lock(0, MPI.LOCK_SHARED)
+        self.win.Fetch_and_op(one, out, 0, 0, MPI.SUM)
+        self.win.Unlock(0)
+        return out[0]
+
+    def __iter__(self):
+        while True:
+            i = self.next_index()
+            if i >= len(self.chunks):
+                return
+            self.claimed += 1
+            yield self.chunks[i]
+
+    def free(self):
+        self.win.Free()
+
+
+class DoneCounter:
+    """Number of files finished on all ranks, kept in an MPI window on rank 0.
 
+    Ranks `add` what they finished with an atomic Accumulate, a batch at a
+    time; rank 0 reads the running total to emit progress records while it
+    works through its own share.
+    """
 
-def list_text_files(folder='data'):
-    return sorted([os.path.join(folder, n) for n in os.listdir(folder) if n.lower().endswith('.txt')])
+    def __init__(self, comm):
+        itemsize = MPI.INT64_T.Get_size()
+        self.win = MPI.Win.Allocate(itemsize if comm.Get_rank() == 0 else 0, itemsize, comm=comm)
+        if comm.Get_rank() == 0:
+            self.win.Lock(0)
+            self.win.Put(array('q', [0]), 0)
+            self.win.Unlock(0)
+        comm.Barrier()
 
+    def add(self, n):
+        """Add `n` finished files and return the total over all ranks so far."""
+        out = array('q', [0])
+        self.win.Lock(0, MPI.LOCK_SHARED)
+        self.win.Fetch_and_op(array('q', [n]), out, 0, 0, MPI.SUM)
+        self.win.Unlock(0)
+        return out[0] + n
 
-def local_analyze(files, io_workers=2, cpu_workers=2, detailed=False, top_k=20):
-    """Hybrid local analysis using threads + processes"""
-    results = {}
-    word_counter = Counter()
+    def free(self):
+        self.win.Free()
 
-    with ThreadPoolExecutor(max_workers=io_workers) as tpool, ProcessPoolExecutor(max_workers=cpu_workers) as ppool:
-        read_futures = {tpool.submit(read_file, f): f for f in files}
-        analyze_futures = {}
 
-        for rf in as_completed(read_futures):
-            f = read_futures[rf]
-            try:
-                text = rf.result()
-            except Exception as e:
-                results[os.path.basename(f)] = {"error": str(e)}
+def plan_chunks(files, ranks, chunk_bytes=None, chunks_per_rank=8, sizes=None):
+    """Byte-weighted chunks for dynamic scheduling, largest files first.
+
+    Handing out the big files first keeps a late large file from becoming
+    the tail that every other rank waits on. `sizes` maps path -> size
+    (from the corpus manifest); without it the files are stat'ed.
+    Returns (chunks, chunk_bytes).
+    """
+    if sizes is None:
+        sizes = {path: file_size(path) for path in files}
+    if not chunk_bytes:
+        chunk_bytes = auto_batch_bytes(sum(sizes.values()), ranks, chunks_per_rank)
+    ordered = sorted(files, key=sizes.__getitem__, reverse=True)
+    return make_batches(ordered, chunk_bytes, sizes), chunk_bytes
+
+
+def local_analyze(chunks, io_workers=2, cpu_workers=2, detailed=False, top_k=20, engine=DEFAULT_ENGINE, max_inflight=None,
+                  loader=DEFAULT_LOADER, stats=None, transport='pickle', cache=None, word_sketch=None,
+                  segment_bytes=None, sink=None, pack=False, io_backend=DEFAULT_IO_BACKEND, progress=None):
+    """Hybrid local analysis using threads + processes
+
+    `chunks` is an iterable of lists of paths and is consumed lazily, so it
+    can be a ChunkQueue that claims more work only when the pipeline has
+    room for it. With the shm transport every chunk is one segment of
+    `segment_bytes`. With `pack` the chunks hold modules.pack blocks and
+    each one is a single task for the process pool. Reads in this process
+    run on an executor of `io_backend` (modules.io_backends). Results are folded into a local Aggregator and, if
+    given, passed to `sink(path, result)`; nothing per-file is kept. Word
+    counts are merged per task in the workers (cut to `word_sketch` words
+    there if given), except with a `cache`, which keeps every file's own.
+    `progress(done)` is called with the number of files finished (cached,
+    analyzed or failed) after each one.
+
+    Returns (aggregator, failed).
+    """
+    aggregator = Aggregator(detailed, word_sketch)
+    failed = 0
+
+    def collect(f, r):
+        aggregator.add(r)
+        if sink:
+            sink(f, r)
+        if progress:
+            progress(aggregator.files + failed)
+
+    cache_keys = {}
+    # word counts are merged per task in the workers unless the cache needs them per file
+    words = aggregator.add_words if cache is None else None
+
+    def todo_chunks():
+        for chunk in chunks:
+            if cache is not None:
+                chunk, keys = cache.partition(chunk, detailed, top_k, collect)
+                cache_keys.update(keys)
+            if chunk:
+                yield chunk
+
+    # bounded read -> analyze pipeline, texts are dropped as soon as analyzed
+    # pack blocks are read by the worker processes, there is no read stage here
+    with nullcontext() if pack else make_io_pool(io_backend, io_workers) as tpool:
+        if pack:
+            stream = stream_batches(chunks, cpu_workers, detailed, top_k, engine, max_inflight,
+                                    loader, stats, task=analyze_blocks, words=words, word_sketch=word_sketch)
+        elif transport == 'shm':
+            stream = stream_shared(todo_chunks(), segment_bytes, io_workers, cpu_workers, detailed, top_k,
+                                   engine, max_inflight, stats, tpool, words=words, word_sketch=word_sketch)
+        else:
+            files = (f for chunk in todo_chunks() for f in chunk)
+            stream = stream_analyze(files, io_workers, cpu_workers, detailed, top_k,
+                                    engine, max_inflight, loader, stats, tpool, words=words,
+                                    word_sketch=word_sketch)
+        for f, r, err in stream:
+            if err is not None:
+                print(f"Failed to process {f}: {err}")
+                failed += 1
+                if progress:
+                    progress(aggregator.files + failed)
                 continue
+            if f in cache_keys:
+                cache.put(cache_keys[f], detailed, top_k, r)
+            collect(f, r)
+
+    return aggregator, failed
+
+
+def _merge_words(a, b, datatype=None):
+    """Reduction op for word counts: packed exact counters or MisraGries summaries."""
+    if isinstance(a, MisraGries):
+        a.merge(b)
+        return a
+    counter = unpack_counter(a)
+    counter.update(unpack_counter(b))
+    return pack_counter(counter)
+
+
+MERGE_WORDS = MPI.Op.Create(_merge_words, commute=True)
+
+
+def reduce_words(comm, word_counter, root=0):
+    """Tree-reduce every rank's word counts to `root`.
+
+    The custom op merges pairs of ranks on the way up, so no rank ever
+    holds more than two counters at once and rank 0 receives log2(size)
+    messages instead of one per rank. Exact counters travel packed.
+    """
+    if isinstance(word_counter, MisraGries):
+        return comm.reduce(word_counter, op=MERGE_WORDS, root=root)
+    packed = comm.reduce(pack_counter(word_counter), op=MERGE_WORDS, root=root)
+    return unpack_counter(packed) if packed is not None else None
+
+
+# Ranks hold consecutive byte ranges, so a reduction in rank order merges the
+# partial results in file order (see modules.ranges)
+MERGE_PARTS = MPI.Op.Create(lambda a, b, datatype=None: merge_partials([a, b]), commute=False)
+
+
+def analyze_file_ranges(comm, path, spans, cpu_workers=2, detailed=False, top_k=20, engine=DEFAULT_ENGINE):
+    """Analyze this rank's share of the byte ranges of one large file.
+
+    Rank r gets the r-th consecutive block of `spans`. The ranges are read
+    with collective MPI-IO reads, one per round, so the MPI library can
+    merge the requests of all ranks; a rank that has run out of ranges
+    still joins each round with an empty read. Reads overlap with analysis
+    in the local process pool. Returns this rank's merged partial.
+    """
+    rank, size = comm.Get_rank(), comm.Get_size()
+    mine = spans[rank * len(spans) // size:(rank + 1) * len(spans) // size]
+    rounds = -(-len(spans) // size)
+    futures = []
+    fh = MPI.File.Open(comm, path, MPI.MODE_RDONLY)
+    try:
+        with ProcessPoolExecutor(max_workers=cpu_workers) as ppool:
+            for k in range(rounds):
+                start, end = mine[k] if k < len(mine) else (0, 0)
+                buf = bytearray(end - start)
+                fh.Read_at_all(start, buf)
+                if k < len(mine):
+                    futures.append(ppool.submit(analyze_part, bytes(buf), detailed, top_k, engine))
+            parts = [fut.result() for fut in futures]
+    finally:
+        fh.Close()
+    return merge_partials(parts)
+
+
+def run_file(comm, args, records=None):
+    """--file mode: split one large file into byte ranges across all ranks."""
+    rank, size = comm.Get_rank(), comm.Get_size()
+    if rank == 0:
+        file_size = os.path.getsize(args.file)
+        n = args.ranges or auto_ranges(file_size, size * args.cpu_workers)
+        spans = split_ranges(args.file, n)
+    else:
+        file_size, spans = None, None
+    file_size, spans = comm.bcast((file_size, spans), root=0)
+
+    comm.Barrier()
+    start = time.perf_counter()
+    partial = analyze_file_ranges(comm, args.file, spans, args.cpu_workers, args.detailed, 20, args.engine)
+    merged = comm.reduce(partial, op=MERGE_PARTS, root=0)
+    elapsed = np.zeros(1)
+    comm.Reduce(np.array([time.perf_counter() - start]), elapsed, op=MPI.MAX, root=0)
+
+    # any baseline mode but 'off' times every range, spread over the ranks
+    seq_time = None
+    if args.baseline != 'off':
+        seq_start = time.perf_counter()
+        for begin, end in spans[rank::size]:
+            analyze_part(read_range((args.file, begin, end)), args.detailed, 20, args.engine)
+        seq_time = np.zeros(1)
+        comm.Reduce(np.array([time.perf_counter() - seq_start]), seq_time, op=MPI.SUM, root=0)
+        seq_time = float(seq_time[0])
+
+    if rank == 0:
+        result = finish_partial(merged)
+        total_time = float(elapsed[0])
+        baseline = {'seconds': seq_time, 'ci': None, 'source': 'measured'} if seq_time is not None else None
+
+        print("\n=== MPI Hybrid Analysis Results ===")
+        print(f"Ranks: {size}")
+        print(f"CPU Processes per Rank: {args.cpu_workers}")
+        print(f"Engine: {args.engine}")
+        print(f"File: {args.file} ({file_size} bytes, {len(spans)} byte ranges)")
+        print(f"Result: {json.dumps(result, ensure_ascii=False)}")
+        print_timing(baseline, total_time, size * args.cpu_workers)
+        print(f"Read throughput: {file_size / max(total_time, 1e-9) / 1e6:.2f} MB/s")
+        print("===============================")
+        if records:
+            records.summary({'file': args.file, 'result': result, 'ranks': size, 'bytes_read': file_size,
+                             'byte_throughput': file_size / max(total_time, 1e-9),
+                             **timing_stats(baseline, total_time, size * args.cpu_workers)})
+
+
+def measure_baseline_mpi(comm, mode, files, args, stat=stat_file):
+    """Sequential baseline timed on all ranks at once.
+
+    Every rank times its own slice of the files single-threaded and the
+    times are summed, so the baseline costs about 1/size of a sequential
+    pass instead of keeping all other ranks waiting on rank 0. Ranks that
+    share cores slow each other down, so use one rank per core for it.
+    Returns the baseline dict of modules.baseline on rank 0 (None on the
+    other ranks and for 'off').
+    """
+    if mode == 'off':
+        return None
+    rank, size = comm.Get_rank(), comm.Get_size()
+    store = key = cached = None
+    if rank == 0 and mode in ('full', 'cached'):
+        store = BaselineStore(args.baseline_file)
+        key = baseline_key(files, args.engine, args.detailed, 20, args.loader, stat)
+        if mode == 'cached':
+            cached = store.get(key)
+    cached = comm.bcast(cached, root=0)
+    if cached is not None:
+        return {'seconds': cached, 'ci': None, 'source': 'cached', 'files_timed': 0} if rank == 0 else None
+
+    todo = comm.bcast((choose_sample(files) if mode == 'sample' else files) if rank == 0 else None, root=0)
+    if rank == 0:
+        print(f"\nTiming sequential baseline on {len(todo)} files across {size} ranks...")
+    times = time_files(todo[rank::size], args.engine, args.detailed, 20, args.loader)
+
+    if mode == 'sample':
+        # the sample is small, so its per-file times can go to rank 0
+        all_times = comm.gather(times, root=0)
+        if rank != 0:
+            return None
+        estimate, half = extrapolate([t for part in all_times for t in part], len(files))
+        return {'seconds': estimate, 'ci': (max(estimate - half, 0.0), estimate + half),
+                'source': 'sampled', 'files_timed': len(todo)}
+    total = np.zeros(1)
+    comm.Reduce(np.array([sum(times)]), total, op=MPI.SUM, root=0)
+    if rank != 0:
+        return None
+    seconds = float(total[0])
+    store.put(key, seconds, len(files))
+    return {'seconds': seconds, 'ci': None, 'source': 'measured', 'files_timed': len(files)}
+
+
+def measure_pack_baseline_mpi(comm, mode, blocks, args):
+    """Sequential baseline of a pack: every rank times its share of the blocks.
+
+    Any `mode` but 'off' times all blocks (`blocks` is only needed on rank
+    0). Returns the baseline dict on rank 0, None elsewhere.
+    """
+    if mode == 'off':
+        return None
+    rank, size = comm.Get_rank(), comm.Get_size()
+    blocks = comm.bcast(blocks, root=0)
+    times = time_blocks(blocks[rank::size], args.engine, args.detailed, 20, args.loader)
+    total = np.zeros(1)
+    comm.Reduce(np.array([sum(times)]), total, op=MPI.SUM, root=0)
+    if rank != 0:
+        return None
+    return {'seconds': float(total[0]), 'ci': None, 'source': 'measured',
+            'files_timed': sum(len(block.members) for block in blocks)}
+
+
+def timing_stats(baseline, total_time, total_workers):
+    """The timing fields of the result record, at full precision."""
+    speedup = efficiency = None
+    if baseline and total_time > 0:
+        speedup = baseline['seconds'] / total_time
+        efficiency = speedup / total_workers if total_workers > 0 else 0.0
+    return {
+        'sequential_time': baseline['seconds'] if baseline else None,
+        'sequential_ci': baseline['ci'] if baseline else None,
+        'baseline_source': baseline['source'] if baseline else None,
+        'parallel_time': total_time,
+        'speedup': speedup,
+        'efficiency': efficiency,
+    }
+
 
-            if detailed:
-                fut = ppool.submit(detailed_analyze_text, text, top_k)
-            else:
-                fut = ppool.submit(analyze_text, text)
-            analyze_futures[fut] = f
+def print_timing(baseline, total_time, total_workers):
+    """Print the sequential/parallel time, speedup and efficiency lines of the report."""
+    if baseline:
+        print(f"Sequential time: {baseline['seconds']:.3f}s ({baseline['source']})")
+    else:
+        print("Sequential time: n/a (baseline off, use --baseline)")
+    print(f"Parallel wall time: {total_time:.3f}s")
+    if baseline and total_time > 0:
+        speedup = baseline['seconds'] / total_time
+        print(f"Speedup: {format_speedup(baseline, total_time)}")
+        print(f"Efficiency: {speedup / total_workers if total_workers > 0 else 0:.3f}")
 
-        for af in as_completed(analyze_futures):
-            f = analyze_futures[af]
-            try:
-                r = af.result()
-                results[os.path.basename(f)] = r
-                if detailed:
-                    for w, c in r.get("top_words", []):
-                        word_counter[w] += c
-            except Exception as e:
-                results[os.path.basename(f)] = {"error": str(e)}
 
-    return results, word_counter
+def write_ordered(comm, path, data):
+    """Collectively write every rank's `data` bytes into one file, in rank order (MPI-IO)."""
+    size = np.array([len(data)], dtype=np.int64)
+    offset = np.zeros(1, dtype=np.int64)
+    total = np.zeros(1, dtype=np.int64)
+    comm.Exscan(size, offset, op=MPI.SUM)
+    comm.Allreduce(size, total, op=MPI.SUM)
+    if comm.Get_rank() == 0:
+        offset[0] = 0  # Exscan leaves rank 0's buffer undefined
+    fh = MPI.File.Open(comm, path, MPI.MODE_WRONLY | MPI.MODE_CREATE)
+    try:
+        fh.Write_at_all(int(offset[0]), data)
+        # cut off whatever a longer previous file left behind
+        fh.Set_size(int(total[0]))
+    finally:
+        fh.Close()
 
 
 def main():
@@ -57,6 +406,8 @@ def main():
         description="Hybrid MPI + Threads + Processes Analyzer")
     parser.add_argument('--folder', default='data',
                         help='Folder containing .txt files')
+    parser.add_argument('--rescan', action='store_true',
+                        help='Stat every file again instead of trusting the stored corpus manifest')
     parser.add_argument('--io-workers', type=int, default=2,
                         help='Number of I/O threads per rank')
     parser.add_argument('--cpu-workers', type=int, default=2,
@@ -67,12 +418,59 @@ def main():
                         help='NIM to derive parameters automatically')
     parser.add_argument('--detailed', action='store_true',
                         help='Enable detailed analysis (top words)')
+    parser.add_argument('--io-backend', choices=IO_BACKENDS, default=DEFAULT_IO_BACKEND,
+                        help='Read stage per rank: --io-workers threads (thread), or an asyncio event loop batching '
+                             'up to --io-workers concurrent reads onto a few threads (asyncio)')
+    parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE,
+                        help='Analysis engine: single-pass byte classifier (fast) or reference (python)')
+    parser.add_argument('--loader', choices=LOADERS, default=DEFAULT_LOADER,
+                        help='File reader: decoded text or raw bytes from a memory map (mmap)')
+    parser.add_argument('--transport', choices=('pickle', 'shm'), default='pickle',
+                        help='Hand file contents to the process pool pickled or via shared memory segments (shm)')
+    parser.add_argument('--cache', default=None, metavar='PATH',
+                        help='SQLite file caching per-file results (shared by all ranks)')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_CACHE_MB,
+                        help='Size limit of the result cache')
+    parser.add_argument('--word-sketch', type=int, default=None, metavar='N',
+                        help='Merge word counts as Misra-Gries summaries of N words (bounded memory, reported error bound) instead of exactly')
+    parser.add_argument('--max-inflight', type=int, default=None,
+                        help='Max files read but not yet analyzed per rank; bounds memory use')
+    parser.add_argument('--schedule', choices=('static', 'dynamic'), default='dynamic',
+                        help='Split files into byte-balanced parts up front (static) or let ranks claim byte-weighted chunks as they go (dynamic)')
+    parser.add_argument('--write-files', action='store_true',
+                        help='Write per-file results to results.csv and results.jsonl (parallel MPI-IO writes)')
+    parser.add_argument('--baseline', choices=BASELINE_MODES, default='off',
+                        help='Sequential baseline for speedup, timed on all ranks in parallel: none (off), every file (full), '
+                             'a sample with a 95%% confidence interval (sample), or a stored one if available (cached)')
+    parser.add_argument('--baseline-file', default=DEFAULT_BASELINE_PATH,
+                        help='Where measured baselines are stored for --baseline full/cached')
+    parser.add_argument('--file', default=None, metavar='PATH',
+                        help='Analyze this single (large) file as byte ranges spread over all ranks (MPI-IO reads)')
+    parser.add_argument('--ranges', type=int, default=None,
+                        help='With --file, number of byte ranges (default: from file size and total workers)')
+    parser.add_argument('--pack', default=None, metavar='PATH',
+                        help='Read the corpus from a pack directory made by pack_corpus.py; ranks claim its blocks '
+                             'and read them with --loader I/O (sequential reads or mmap)')
+    parser.add_argument('--chunk-bytes', type=int, default=None,
+                        help='Bytes per chunk for the dynamic schedule (default: derived from corpus size and ranks)')
+    parser.add_argument('--result-stream', default=None, metavar='PATH',
+                        help="Rank 0 writes the result as JSON lines (modules/protocol.py) to PATH; '-' uses stdout "
+                             "and moves the human-readable report of all ranks to stderr")
     args = parser.parse_args()
 
     comm = MPI.COMM_WORLD
     rank = comm.Get_rank()
     size = comm.Get_size()
 
+    records = None
+    if args.result_stream:
+        if rank == 0:
+            records = open_result_stream(args.result_stream)
+            records.start('analyze_mpi', {**vars(args), 'ranks': size})
+        elif args.result_stream == '-':
+            # mpiexec merges the stdout of all ranks
+            reserve_stdout()
+
     if args.nim:
         try:
             threads, processes, data_count = params_from_nim(args.nim)
@@ -89,78 +487,211 @@ def main():
             if rank == 0:
                 print(f"Failed to derive NIM parameters: {e}")
 
+    if args.file:
+        run_file(comm, args, records)
+        if records:
+            records.close()
+        return
+
+    # rank 0 lists the corpus once, from its manifest, with the sizes for partitioning.
+    # A pack is listed as its blocks, which then stand in for the files everywhere.
+    manifest = files = sizes = None
     if rank == 0:
-        files = list_text_files(args.folder)
-        if args.limit_data:
-            files = files[:args.limit_data]
-        chunks = [files[i::size] for i in range(size)]
+        if args.pack:
+            files = load_pack(args.pack).blocks(args.limit_data or None)
+            sizes = block_sizes(files)
+        else:
+            manifest = load_manifest(args.folder, refresh=args.rescan)
+            files = manifest.paths(args.limit_data or None)
+            sizes = manifest.size_map(args.limit_data or None)
+
+    queue = None
+    if args.schedule == 'dynamic':
+        # every rank gets the whole plan; the shared counter decides who does what
+        plan = plan_chunks(files, size, args.chunk_bytes, sizes=sizes) if rank == 0 else None
+        chunks, segment_bytes = comm.bcast(plan, root=0)
+        queue = ChunkQueue(comm, chunks)
+        my_chunks = queue
     else:
-        chunks = None
+        parts = None
+        if rank == 0:
+            parts = [(part, {path: sizes[path] for path in part})
+                     for part in balance_by_bytes(files, sizes, size)]
+        my_files, my_sizes = comm.scatter(parts, root=0)
+        my_chunks, segment_bytes = plan_batches(my_files, args.cpu_workers, sizes=my_sizes)
 
-    my_files = comm.scatter(chunks, root=0)
+    # per-file output stays on its rank until the collective write at the end
+    csv_out = io.StringIO()
+    json_out = io.StringIO()
+    rows = csv.writer(csv_out)
+    if args.write_files and rank == 0:
+        rows.writerow(CSV_HEADER)
 
+    def write_record(f, r):
+        rows.writerow(csv_row(f, r))
+        json_out.write(json.dumps([f, without_counts(r)], ensure_ascii=False) + '\n')
+
+    # ranks add their finished files to a shared counter now and then;
+    # rank 0 turns the running total into progress records
+    done_counter = DoneCounter(comm) if args.result_stream else None
+    if rank == 0:
+        file_count = sum(len(block.members) for block in files) if args.pack else len(files)
+    flushed = 0
+    last_flush = 0.0
+
+    def report_progress(done, final=False):
+        nonlocal flushed, last_flush
+        now = time.monotonic()
+        if not final and now - last_flush < PROGRESS_INTERVAL:
+            return
+        total_done = done_counter.add(done - flushed)
+        flushed, last_flush = done, now
+        if records:
+            records.progress('analysis', total_done, file_count)
+
+    io_stats = {}
+    # cached results are keyed by file stat, which packed files do not have
+    cache = ResultCache(args.cache, args.cache_max_mb * 1024 * 1024) if args.cache and not args.pack else None
     start = time.perf_counter()
-    local_results, local_words = local_analyze(
-        my_files,
+    aggregator, failed = local_analyze(
+        my_chunks,
         io_workers=args.io_workers,
         cpu_workers=args.cpu_workers,
-        detailed=args.detailed
+        detailed=args.detailed,
+        engine=args.engine,
+        max_inflight=args.max_inflight,
+        loader=args.loader,
+        stats=io_stats,
+        transport=args.transport,
+        cache=cache,
+        word_sketch=args.word_sketch,
+        segment_bytes=segment_bytes,
+        sink=write_record if args.write_files else None,
+        pack=bool(args.pack),
+        io_backend=args.io_backend,
+        progress=report_progress if done_counter else None
     )
+    if cache:
+        cache.close()
     elapsed = time.perf_counter() - start
+    if queue:
+        queue.free()
+    if done_counter:
+        report_progress(aggregator.files + failed, final=True)
+        done_counter.free()
 
-    all_results = comm.gather(local_results, root=0)
-    all_words = comm.gather(local_words, root=0)
-    total_time = comm.reduce(elapsed, op=MPI.MAX, root=0)
+    # Integer totals go through one buffer-based SUM reduction
+    local_totals = np.array([
+        aggregator.files, failed, aggregator.words, aggregator.vowels, aggregator.digits,
+        aggregator.symbols, io_stats.get('bytes_read', 0),
+        io_stats.get('ipc_payload_bytes', 0) - io_stats.get('ipc_descriptor_bytes', 0),
+        cache.hits if cache else 0, cache.misses if cache else 0], dtype=np.int64)
+    totals = np.zeros_like(local_totals)
+    comm.Reduce(local_totals, totals, op=MPI.SUM, root=0)
+    avg_len_sum = np.zeros(1)
+    comm.Reduce(np.array([aggregator.avg_len_sum]), avg_len_sum, op=MPI.SUM, root=0)
+    total_time = np.zeros(1)
+    comm.Reduce(np.array([elapsed]), total_time, op=MPI.MAX, root=0)
+    total_time = float(total_time[0])
 
-    if rank == 0:
-        merged = {}
-        global_words = Counter()
-        for part, words in zip(all_results, all_words):
-            merged.update(part)
-            global_words.update(words)
+    # busy time per rank; the gap to the slowest rank is time spent idle
+    load = np.array([elapsed, aggregator.files + failed, io_stats.get('bytes_read', 0),
+                     queue.claimed if queue else -1], dtype=np.float64)
+    rank_loads = np.zeros((size, len(load))) if rank == 0 else None
+    comm.Gather(load, rank_loads, root=0)
 
-        total_files = len(merged)
+    global_words = reduce_words(comm, aggregator.word_counter) if args.detailed else Counter()
+    len_hist = None
+    if args.detailed:
+        # the dense histograms reduce as one fixed-size buffer, the rare long words as objects
+        dense = np.zeros(len(aggregator.hist), dtype=np.int64)
+        comm.Reduce(np.array(aggregator.hist, dtype=np.int64), dense, op=MPI.SUM, root=0)
+        overflow = comm.reduce(aggregator.hist_overflow, op=MPI.SUM, root=0)
+        if rank == 0:
+            len_hist = {n: c for n, c in enumerate(dense.tolist()) if c}
+            len_hist.update(overflow)
+
+    if args.write_files:
+        write_ordered(comm, 'results.csv', csv_out.getvalue().encode('utf-8'))
+        write_ordered(comm, 'results.jsonl', json_out.getvalue().encode('utf-8'))
+
+    if args.pack:
+        baseline = measure_pack_baseline_mpi(comm, args.baseline, files, args)
+    else:
+        baseline = measure_baseline_mpi(comm, args.baseline, files, args, manifest.stat if manifest else stat_file)
+
+    if rank == 0:
+        (ok_files, failed, words, vowels, digits, symbols,
+         total_bytes, ipc_saved, cache_hits, cache_misses) = totals.tolist()
+        total_files = ok_files + failed
+        if records:
+            # the other ranks may still have been running at rank 0's last report
+            records.progress('analysis', total_files, file_count)
+        agg = {'files': ok_files, 'words': words, 'vowels': vowels, 'digits': digits,
+               'symbols': symbols, 'avg_len': avg_len_sum[0] / ok_files if ok_files else 0}
         overall_top = global_words.most_common(1)
         top_str = f"'{overall_top[0][0]}' (count: {overall_top[0][1]})" if overall_top else "n/a"
 
-        # Run sequential baseline for speedup calculation
-        print("\nRunning sequential baseline for speedup calculation...")
-        if args.limit_data:
-            all_files = list_text_files(args.folder)[:args.limit_data]
-        else:
-            all_files = list_text_files(args.folder)
-        
-        seq_start = time.perf_counter()
-        if args.detailed:
-            analyzer = detailed_analyze_text
-        else:
-            analyzer = analyze_text
-        
-        for f in all_files:
-            try:
-                text = read_file(f)
-                analyzer(text)
-            except:
-                pass
-        seq_time = time.perf_counter() - seq_start
-
         throughput = total_files / total_time if total_time > 0 else 0
-        speedup = seq_time / total_time if total_time > 0 else 0
-        total_workers = size * args.cpu_workers
-        efficiency = speedup / total_workers if total_workers > 0 else 0
+        byte_throughput = total_bytes / total_time if total_time > 0 else 0
 
         print("\n=== MPI Hybrid Analysis Results ===")
         print(f"Ranks: {size}")
         print(f"I/O Threads per Rank: {args.io_workers}")
         print(f"CPU Processes per Rank: {args.cpu_workers}")
+        print(f"I/O backend: {args.io_backend}")
+        print(f"Engine: {args.engine}")
+        print(f"Loader: {args.loader}")
+        if args.pack:
+            print(f"Pack: {args.pack}")
+        else:
+            print(f"Transport: {args.transport}")
         print(f"Total files processed: {total_files}")
+        if failed:
+            print(f"Failed files: {failed}")
+        print(f"Aggregate: {json.dumps(agg)}")
         print(f"Top word: {top_str}")
-        print(f"Sequential time: {seq_time:.3f}s")
-        print(f"Parallel wall time: {total_time:.3f}s")
-        print(f"Speedup: {speedup:.2f}x")
+        if args.word_sketch:
+            print(f"Word counts may be low by at most {global_words.error}")
+        print_timing(baseline, total_time, size * args.cpu_workers)
         print(f"Throughput: {throughput:.2f} files/s")
-        print(f"Efficiency: {efficiency:.3f}")
+        print(f"Read throughput: {byte_throughput / 1e6:.2f} MB/s")
+        if args.transport == 'shm':
+            print(f"IPC bytes saved: {ipc_saved}")
+        if args.cache and not args.pack:
+            print(f"Cache: {cache_hits} hits, {cache_misses} misses")
+        print(f"Schedule: {args.schedule}" +
+              (f" ({len(queue.chunks)} chunks of ~{segment_bytes} bytes)" if queue else ""))
+        busy = rank_loads[:, 0]
+        for r, (b, n, nbytes, claimed) in enumerate(rank_loads):
+            extra = f", {int(claimed)} chunks" if claimed >= 0 else ""
+            print(f"  Rank {r}: busy {b:.3f}s, idle {total_time - b:.3f}s, {int(n)} files, {int(nbytes)} bytes{extra}")
+        print(f"Load imbalance (max/mean busy): {busy.max() / max(busy.mean(), 1e-9):.2f}")
         print("===============================")
+        if records:
+            records.summary({
+                'files_processed': total_files,
+                'files_failed': failed,
+                'total_words': words,
+                'aggregate': agg,
+                'top_words': global_words.most_common(20),
+                'len_histogram': len_hist,
+                'throughput': throughput,
+                'bytes_read': total_bytes,
+                'byte_throughput': byte_throughput,
+                'ranks': size,
+                'cpu_workers': size * args.cpu_workers,
+                'io_backend': args.io_backend,
+                'ipc_bytes_saved': ipc_saved if args.transport == 'shm' else None,
+                'cache': {'hits': cache_hits, 'misses': cache_misses} if args.cache and not args.pack else None,
+                'schedule': args.schedule,
+                'rank_loads': [{'busy': b, 'files': int(n), 'bytes': int(nbytes),
+                                'chunks': int(claimed) if claimed >= 0 else None}
+                               for b, n, nbytes, claimed in rank_loads.tolist()],
+                'load_imbalance': float(busy.max() / max(busy.mean(), 1e-9)),
+                **timing_stats(baseline, total_time, size * args.cpu_workers),
+            })
+            records.close()
 
 
 if __name__ == '__main__':
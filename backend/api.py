@@ -5,16 +5,41 @@ Menyediakan REST API untuk menjalankan analisis Thread+Process dan MPI
 """
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-import subprocess
+from contextlib import asynccontextmanager
+import asyncio
 import json
 import os
 import time
 from pathlib import Path
 
-app = FastAPI(title="Hybrid Computing Analyzer API")
+from engine import AnalysisEngine
+from jobs import JobManager
+from analyze_files import AnalysisCancelled, select_files
+from modules.autotune import tune
+from modules.utils import params_from_nim
+from modules.analyzer import DEFAULT_ENGINE
+from modules.manifest import load_manifest
+
+# Engine dengan pool thread/process yang tetap hidup antar request
+engine = AnalysisEngine()
+
+# Antrian job: berapa analisis yang boleh berjalan bersamaan
+MAX_CONCURRENT_JOBS = int(os.environ.get("ANALYZER_MAX_JOBS", "1"))
+jobs = JobManager(concurrency=MAX_CONCURRENT_JOBS)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Pre-warm pool untuk konfigurasi default (3 thread / 2 process)
+    await asyncio.get_running_loop().run_in_executor(None, engine.warm_up, 3, 2)
+    yield
+    await jobs.shutdown()
+    engine.shutdown()
+
+app = FastAPI(title="Hybrid Computing Analyzer API", lifespan=lifespan)
 
 # CORS middleware untuk Next.js
 app.add_middleware(
@@ -27,10 +52,14 @@ app.add_middleware(
 
 # Path ke scripts
 BASE_DIR = Path(__file__).parent
-ANALYZE_FILES_SCRIPT = BASE_DIR / "analyze_files.py"
 ANALYZE_MPI_SCRIPT = BASE_DIR / "analyze_mpi.py"
 DATA_DIR = BASE_DIR.parent / "data"
 VENV_PYTHON = BASE_DIR / "venv" / "bin" / "python3"
+CACHE_PATH = BASE_DIR / ".analysis_cache.sqlite"
+BASELINE_PATH = BASE_DIR / ".baseline.json"
+AUTOTUNE_PATH = BASE_DIR / ".autotune.json"
+# Batas panjang satu record JSON dari --result-stream
+RESULT_LINE_LIMIT = 16 * 1024 * 1024
 
 # Use venv python if available, otherwise use system python3
 PYTHON_CMD = str(VENV_PYTHON) if VENV_PYTHON.exists() else "python3"
@@ -42,6 +71,15 @@ class ThreadProcessRequest(BaseModel):
     limit_data: int = 810
     detailed: bool = True
     nim: Optional[str] = None
+    use_cache: bool = False
+    # off | full | sample | cached (lihat modules/baseline.py)
+    baseline: str = "cached"
+    # pilih io/cpu workers dan batching otomatis (mengabaikan io_workers/cpu_workers)
+    autotune: bool = False
+    # thread | asyncio (lihat modules/io_backends.py)
+    io_backend: str = "thread"
+    # statistik per tahap (modules/trace.py) di stats["trace"]; default mati karena menambah overhead
+    stage_timings: bool = False
 
 class MPIRequest(BaseModel):
     mpi_ranks: int = 4
@@ -50,6 +88,9 @@ class MPIRequest(BaseModel):
     limit_data: int = 810
     detailed: bool = True
     nim: Optional[str] = None
+    use_cache: bool = False
+    baseline: str = "cached"
+    io_backend: str = "thread"
 
 # Model untuk response
 class AnalysisResult(BaseModel):
@@ -82,11 +123,13 @@ def get_status():
                 "message": "Data directory not found. Please run main.py to generate sample files."
             }
         
-        txt_files = list(DATA_DIR.glob("*.txt"))
+        # manifest tersimpan dipakai selama isi folder tidak bertambah/berkurang
+        manifest = load_manifest(str(DATA_DIR))
         return {
             "data_dir_exists": True,
-            "file_count": len(txt_files),
-            "message": f"Found {len(txt_files)} text files ready for analysis."
+            "file_count": len(manifest),
+            "total_bytes": manifest.total_bytes,
+            "message": f"Found {len(manifest)} text files ready for analysis."
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -94,81 +137,84 @@ def get_status():
 @app.post("/api/analyze/thread-process", response_model=AnalysisResult)
 async def analyze_thread_process(request: ThreadProcessRequest):
     """
-    Run Thread + ProcessPool analysis
+    Run Thread + ProcessPool analysis (in-process, pooled workers)
     """
+    return await run_thread_process(request)
+
+async def run_thread_process(request: ThreadProcessRequest, job=None) -> AnalysisResult:
+    """Jalankan analisis Thread+Process; `job` (opsional) menerima progress dan sinyal cancel"""
+    io_workers = request.io_workers
+    cpu_workers = request.cpu_workers
+    limit_data = request.limit_data
+    detailed = request.detailed
+    if request.nim:
+        io_workers, cpu_workers, limit_data = params_from_nim(request.nim)
+        detailed = True
+    
     try:
-        # Build command
-        cmd = [
-            "python3",
-            str(ANALYZE_FILES_SCRIPT),
-            "--folder", str(DATA_DIR),
-            "--io-workers", str(request.io_workers),
-            "--cpu-workers", str(request.cpu_workers),
-            "--limit-data", str(request.limit_data)
-        ]
-        
-        # Use venv python if available
-        if VENV_PYTHON.exists():
-            cmd[0] = str(VENV_PYTHON)
-        
-        if request.detailed:
-            cmd.append("--detailed")
-        
-        if request.nim:
-            cmd = [
-                PYTHON_CMD,
-                str(ANALYZE_FILES_SCRIPT),
-                "--folder", str(DATA_DIR),
-                "--nim", request.nim,
-                "--detailed"
-            ]
-        
-        # Execute
         start_time = time.time()
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            cwd=str(BASE_DIR)
+        tuned = None
+        tune_log = []
+        if request.autotune:
+            # probe singkat di thread terpisah; hasilnya di-cache per mesin + profil korpus
+            manifest = load_manifest(str(DATA_DIR))
+            files = select_files(str(DATA_DIR), limit_data, manifest)
+            tuned = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: tune(files, DEFAULT_ENGINE, detailed, path=str(AUTOTUNE_PATH), log=tune_log.append,
+                                   sizes=manifest.size_map()))
+            io_workers, cpu_workers = tuned["io_workers"], tuned["cpu_workers"]
+        summary, output = await engine.run(
+            io_workers, cpu_workers, request.io_backend,
+            folder=str(DATA_DIR),
+            detailed=detailed,
+            limit_data=limit_data,
+            batch=bool(tuned and tuned["batch"]),
+            batch_bytes=tuned["batch_bytes"] if tuned else None,
+            cache_path=str(CACHE_PATH) if request.use_cache else None,
+            baseline=request.baseline,
+            baseline_path=str(BASELINE_PATH),
+            trace=request.stage_timings,
+            progress=job.progress if job else None,
+            cancel=job.cancel_event if job else None
         )
         execution_time = time.time() - start_time
-        
-        if result.returncode != 0:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Analysis failed: {result.stderr}"
-            )
-        
-        # Parse output
-        output = result.stdout
-        stats = parse_analysis_output(output)
-        
-        return AnalysisResult(
-            success=True,
-            execution_time=execution_time,
-            speedup=stats.get("speedup"),
-            throughput=stats.get("throughput"),
-            efficiency=stats.get("efficiency"),
-            output=output,
-            config={
-                "io_workers": request.io_workers,
-                "cpu_workers": request.cpu_workers,
-                "limit_data": request.limit_data,
-                "detailed": request.detailed
-            },
-            stats=stats
-        )
-        
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=408, detail="Analysis timed out")
+        output = "\n".join(tune_log + [output])
+    except AnalysisCancelled:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
+    
+    return AnalysisResult(
+        success=True,
+        execution_time=execution_time,
+        speedup=summary["speedup"],
+        throughput=summary["throughput"],
+        efficiency=summary["efficiency"],
+        output=output,
+        config={
+            "io_workers": io_workers,
+            "cpu_workers": cpu_workers,
+            "limit_data": limit_data,
+            "detailed": detailed,
+            "use_cache": request.use_cache,
+            "baseline": request.baseline,
+            "autotune": tuned,
+            "io_backend": request.io_backend
+        },
+        stats=summary
+    )
 
 @app.post("/api/analyze/mpi", response_model=AnalysisResult)
 async def analyze_mpi(request: MPIRequest):
     """
     Run MPI + ProcessPool analysis
     """
+    return await run_mpi(request)
+
+async def run_mpi(request: MPIRequest, job=None) -> AnalysisResult:
+    """Jalankan analyze_mpi.py lewat mpiexec; proses disimpan di `job` agar bisa di-cancel"""
     try:
         # Build command with --oversubscribe flag to allow more processes than available cores
         cmd = [
@@ -198,26 +244,42 @@ async def analyze_mpi(request: MPIRequest):
                 "--detailed"
             ]
         
-        # Execute
+        if request.use_cache:
+            cmd += ["--cache", str(CACHE_PATH)]
+        cmd += ["--baseline", request.baseline, "--baseline-file", str(BASELINE_PATH)]
+        cmd += ["--io-backend", request.io_backend]
+        # stdout membawa record JSON (modules/protocol.py), laporan teks lewat stderr
+        cmd += ["--result-stream", "-"]
+        
+        # Execute without blocking the event loop
         start_time = time.time()
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            cwd=str(BASE_DIR)
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=str(BASE_DIR),
+            limit=RESULT_LINE_LIMIT
         )
+        if job:
+            job.proc = proc
+            if job.cancel_event.is_set():
+                proc.terminate()
+        # record dibaca satu per satu selagi proses berjalan
+        report = asyncio.create_task(proc.stderr.read())
+        stats = await read_result_stream(proc.stdout, job)
+        stderr = await report
+        await proc.wait()
         execution_time = time.time() - start_time
         
-        if result.returncode != 0:
+        if job and job.cancel_event.is_set():
+            raise AnalysisCancelled()
+        output = stderr.decode(errors='replace')
+        if proc.returncode != 0 or stats is None:
             raise HTTPException(
                 status_code=500,
-                detail=f"MPI Analysis failed: {result.stderr}"
+                detail=f"MPI Analysis failed: {output}"
             )
         
-        # Parse output
-        output = result.stdout
-        stats = parse_mpi_output(output)
-        
         return AnalysisResult(
             success=True,
             execution_time=execution_time,
@@ -230,111 +292,107 @@ async def analyze_mpi(request: MPIRequest):
                 "io_workers": request.io_workers,
                 "cpu_workers": request.cpu_workers,
                 "limit_data": request.limit_data,
-                "detailed": request.detailed
+                "detailed": request.detailed,
+                "use_cache": request.use_cache,
+                "baseline": request.baseline,
+                "io_backend": request.io_backend
             },
             stats=stats
         )
         
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=408, detail="MPI Analysis timed out")
+    except (HTTPException, AnalysisCancelled):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def parse_analysis_output(output: str) -> Dict[str, Any]:
-    """Parse output dari analyze_files.py"""
-    stats = {}
-    
-    try:
-        # Parse speedup
-        for line in output.split('\n'):
-            if "Speedup:" in line:
-                speedup_str = line.split("Speedup:")[1].strip().replace('x', '')
-                stats["speedup"] = float(speedup_str)
-            
-            if "Throughput:" in line:
-                throughput_str = line.split("Throughput:")[1].strip().split()[0]
-                stats["throughput"] = float(throughput_str)
-            
-            if "Efficiency:" in line:
-                efficiency_str = line.split("Efficiency:")[1].strip()
-                stats["efficiency"] = float(efficiency_str)
-            
-            if "Sequential time:" in line:
-                seq_time = line.split("Sequential time:")[1].strip().replace('s', '')
-                stats["sequential_time"] = float(seq_time)
-            
-            if "Parallel time:" in line:
-                par_time = line.split("Parallel time:")[1].strip().replace('s', '')
-                stats["parallel_time"] = float(par_time)
-            
-            if "Total files processed:" in line:
-                files = line.split("Total files processed:")[1].strip()
-                stats["files_processed"] = int(files)
-            
-            if "Total words:" in line:
-                words = line.split("Total words:")[1].strip()
-                stats["total_words"] = int(words)
-    
-    except Exception as e:
-        print(f"Error parsing output: {e}")
-    
-    return stats
+async def read_result_stream(stdout, job=None) -> Optional[Dict[str, Any]]:
+    """Baca record protokol hasil (JSON lines) dari `stdout`; kembalikan record summary"""
+    summary = None
+    async for line in stdout:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # baris non-JSON (mis. pesan dari mpiexec) bukan bagian protokol; lewati
+            continue
+        if not isinstance(record, dict):
+            continue
+        if record.get("type") == "progress" and job:
+            job.progress(record["phase"], record["done"], record["total"])
+        elif record.get("type") == "summary":
+            summary = {k: v for k, v in record.items() if k != "type"}
+    return summary
 
-def parse_mpi_output(output: str) -> Dict[str, Any]:
-    """Parse output dari analyze_mpi.py"""
-    stats = {}
-    
-    try:
-        # MPI output biasanya dari rank 0
-        lines = output.split('\n')
-        
-        for line in lines:
-            if "Speedup:" in line:
-                speedup_str = line.split("Speedup:")[1].strip().replace('x', '')
-                try:
-                    stats["speedup"] = float(speedup_str)
-                except:
-                    pass
-            
-            if "Throughput:" in line:
-                throughput_str = line.split("Throughput:")[1].strip().split()[0]
-                try:
-                    stats["throughput"] = float(throughput_str)
-                except:
-                    pass
-            
-            if "Efficiency:" in line:
-                efficiency_str = line.split("Efficiency:")[1].strip()
-                try:
-                    stats["efficiency"] = float(efficiency_str)
-                except:
-                    pass
-            
-            if "Sequential time:" in line:
-                seq_time = line.split("Sequential time:")[1].strip().replace('s', '')
-                try:
-                    stats["sequential_time"] = float(seq_time)
-                except:
-                    pass
-            
-            if "Parallel wall time:" in line:
-                par_time = line.split("Parallel wall time:")[1].strip().replace('s', '')
-                try:
-                    stats["parallel_time"] = float(par_time)
-                except:
-                    pass
-            
-            if "Total files processed:" in line:
-                files = line.split("Total files processed:")[1].strip()
-                try:
-                    stats["files_processed"] = int(files)
-                except:
-                    pass
-    
-    except Exception as e:
-        print(f"Error parsing MPI output: {e}")
-    
-    return stats
+# ---------------------------------------------------------------------------
+# Job API: submit langsung dapat id, progress via SSE, bisa di-cancel
+# ---------------------------------------------------------------------------
+
+def get_job_or_404(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.post("/api/jobs/thread-process")
+async def submit_thread_process(request: ThreadProcessRequest):
+    """Submit analisis Thread+Process sebagai job; langsung mengembalikan id job"""
+    job = jobs.submit("thread-process", request.model_dump(),
+                      lambda job: run_thread_process(request, job))
+    return job.to_dict()
+
+@app.post("/api/jobs/mpi")
+async def submit_mpi(request: MPIRequest):
+    """Submit analisis MPI sebagai job; rank 0 melaporkan progress jumlah file lewat result stream"""
+    job = jobs.submit("mpi", request.model_dump(),
+                      lambda job: run_mpi(request, job))
+    return job.to_dict()
+
+@app.get("/api/jobs")
+def list_jobs():
+    return [job.to_dict() for job in jobs.list()]
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    return get_job_or_404(job_id).to_dict()
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Stream progress job sebagai Server-Sent Events sampai job selesai"""
+    job = get_job_or_404(job_id)
+
+    async def events():
+        last = None
+        while True:
+            state = job.to_dict()
+            # files_per_s / eta_s berubah terus; kirim hanya bila progress berubah
+            key = (state["status"], state["phase"], state["files_done"])
+            if key != last:
+                last = key
+                yield f"event: progress\ndata: {json.dumps(state)}\n\n"
+            if job.finished:
+                yield f"event: {job.status}\ndata: {json.dumps(state)}\n\n"
+                return
+            await asyncio.sleep(0.25)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/jobs/{job_id}/result", response_model=AnalysisResult)
+def get_job_result(job_id: str):
+    job = get_job_or_404(job_id)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status}")
+    return job.result
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancel job yang masih antre atau berjalan"""
+    if jobs.cancel(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return jobs.get(job_id).to_dict()
 
 @app.get("/api/presets")
 def get_presets():
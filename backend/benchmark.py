@@ -0,0 +1,375 @@
+"""
+Benchmark harness for the analyzers.
+
+Sweeps io_workers x cpu_workers x MPI ranks (x I/O backends) over
+generated corpora of different sizes and file-size distributions. Every configuration gets
+warmup runs and then timed repeats; the report holds medians and
+percentiles, strong- and weak-scaling fits of the serial fraction, and is
+written as JSON (full detail) and CSV (one row per configuration).
+
+Example:
+    python benchmark.py --io 2,4 --cpu 1,2,4 --files 200,800 --sizes fixed,mixed --repeats 5
+    python benchmark.py --ranks 1,2,4 --cpu 2 --compare bench_old.json
+    python benchmark.py --io 4,16,64 --cpu 4 --io-backends thread,asyncio
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import shlex
+import argparse
+import platform
+import statistics
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import analyze_files
+from modules.analyzer import ANALYZER_VERSION, DEFAULT_ENGINE, ENGINES
+from modules.baseline import machine_id, time_files
+from modules.io_backends import DEFAULT_IO_BACKEND, IO_BACKENDS, make_io_pool
+from modules.protocol import read_records
+from modules.utils import generate_random_assignment_files
+
+
+# Sentences per file for each named size distribution (~110 bytes each)
+SIZE_DISTRIBUTIONS = {
+    'fixed': 20,
+    'small': 5,
+    'large': 200,
+    'mixed': (2, 400),
+}
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ANALYZE_MPI_SCRIPT = os.path.join(BASE_DIR, 'analyze_mpi.py')
+
+
+def _ints(text):
+    return [int(x) for x in text.split(',') if x]
+
+
+def corpus_folder(root, files, sizes, seed):
+    """Generate (once) and return the folder of a corpus."""
+    folder = os.path.join(root, f'{files}_{sizes}_{seed}')
+    marker = os.path.join(folder, '.complete')
+    if not os.path.exists(marker):
+        generate_random_assignment_files(folder, files, seed, SIZE_DISTRIBUTIONS[sizes])
+        open(marker, 'w').close()
+    return folder
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) with linear interpolation."""
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    pos = (len(values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def summarize(times):
+    return {
+        'median': statistics.median(times),
+        'p10': percentile(times, 10),
+        'p90': percentile(times, 90),
+        'min': min(times),
+        'max': max(times),
+        'mean': statistics.fmean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def run_in_process(folder, io_workers, cpu_workers, detailed, engine, warmup, repeats,
+                   io_backend=DEFAULT_IO_BACKEND):
+    """Time `analyze_files.main` on pools that live across the repeats."""
+    times = []
+    with make_io_pool(io_backend, io_workers) as tpool, \
+            ProcessPoolExecutor(max_workers=cpu_workers) as ppool:
+        for i in range(warmup + repeats):
+            summary = analyze_files.main(folder=folder, max_workers_io=io_workers, max_workers_cpu=cpu_workers,
+                                         detailed=detailed, engine=engine, log=lambda *a: None,
+                                         pools=(tpool, ppool), baseline='off', io_backend=io_backend)
+            if i >= warmup:
+                times.append(summary['parallel_time'])
+    return times
+
+
+def run_mpi(folder, ranks, io_workers, cpu_workers, detailed, engine, warmup, repeats, mpiexec,
+            io_backend=DEFAULT_IO_BACKEND):
+    """Time `analyze_mpi.py` under mpiexec; returns the reported parallel wall times."""
+    cmd = shlex.split(mpiexec) + ['-n', str(ranks), sys.executable, ANALYZE_MPI_SCRIPT,
+                                  '--folder', folder, '--io-workers', str(io_workers),
+                                  '--cpu-workers', str(cpu_workers), '--engine', engine, '--baseline', 'off',
+                                  '--io-backend', io_backend, '--result-stream', '-']
+    if detailed:
+        cmd.append('--detailed')
+    times = []
+    for i in range(warmup + repeats):
+        out = subprocess.run(cmd, capture_output=True, text=True, cwd=BASE_DIR)
+        summary = next((r for r in read_records(out.stdout.splitlines()) if r['type'] == 'summary'), None)
+        if out.returncode != 0 or summary is None:
+            raise RuntimeError(f'mpiexec run failed ({out.returncode}): {out.stderr.strip()[-500:]}')
+        if i >= warmup:
+            times.append(summary['parallel_time'])
+    return times
+
+
+def fit_amdahl(points):
+    """Least-squares serial fraction f of Amdahl's law S(p) = 1 / (f + (1 - f) / p).
+
+    `points` are (p, speedup) pairs. Rewritten as 1/S - 1/p = f * (1 - 1/p)
+    the fit is linear in f. Values above 1 mean the parallel run is slower
+    than the sequential one (overhead dominates).
+    """
+    xs = [1 - 1 / p for p, _ in points]
+    ys = [1 / s - 1 / p for p, s in points]
+    den = sum(x * x for x in xs)
+    if den == 0:
+        return None
+    return sum(x * y for x, y in zip(xs, ys)) / den
+
+
+def fit_gustafson(points):
+    """Least-squares serial fraction f of Gustafson's law S(p) = p - f * (p - 1).
+
+    `points` are (p, scaled speedup) pairs from weak scaling runs.
+    """
+    xs = [p - 1 for p, _ in points]
+    ys = [p - s for p, s in points]
+    den = sum(x * x for x in xs)
+    if den == 0:
+        return None
+    return sum(x * y for x, y in zip(xs, ys)) / den
+
+
+def scaling_fits(results, serial_times):
+    """Strong scaling per corpus and weak scaling per size distribution.
+
+    Strong: speedup of every config against the sequential time of the
+    same corpus. Weak: configs whose corpus grew with the worker count
+    (files = base_files * p) against the smallest corpus on one worker.
+    Each I/O backend is fitted on its own.
+    """
+    fits = {'strong': [], 'weak': []}
+    by_corpus = {}
+    for r in results:
+        by_corpus.setdefault((r['files'], r['sizes'], r['io_backend']), []).append(r)
+    for (files, sizes, io_backend), rows in sorted(by_corpus.items()):
+        serial = serial_times[(files, sizes)]
+        points = [(r['workers'], serial / r['time']['median']) for r in rows]
+        fits['strong'].append({
+            'files': files, 'sizes': sizes, 'io_backend': io_backend, 'serial_time': serial,
+            'points': [{'workers': p, 'speedup': s} for p, s in sorted(points)],
+            'serial_fraction': fit_amdahl([pt for pt in points if pt[0] > 1]),
+        })
+
+    for sizes, io_backend in sorted({(r['sizes'], r['io_backend']) for r in results}):
+        rows = [r for r in results if r['sizes'] == sizes and r['io_backend'] == io_backend]
+        base_files = min(r['files'] for r in rows)
+        base = [r for r in rows if r['files'] == base_files and r['workers'] == 1]
+        if not base:
+            continue
+        t1 = min(r['time']['median'] for r in base)
+        points = [(r['workers'], r['workers'] * t1 / r['time']['median'])
+                  for r in rows if r['workers'] > 1 and r['files'] == base_files * r['workers']]
+        if points:
+            fits['weak'].append({
+                'sizes': sizes, 'io_backend': io_backend, 'base_files': base_files,
+                'points': [{'workers': p, 'scaled_speedup': s} for p, s in sorted(points)],
+                'serial_fraction': fit_gustafson(points),
+            })
+    return fits
+
+
+def compare_backends(results):
+    """Median time of every non-default I/O backend relative to the thread pool on the same config."""
+    by_config = {}
+    for r in results:
+        key = (r['files'], r['sizes'], r['ranks'], r['io_workers'], r['cpu_workers'])
+        by_config.setdefault(key, {})[r['io_backend']] = r['time']['median']
+    rows = []
+    for (files, sizes, ranks, io_workers, cpu_workers), medians in sorted(by_config.items()):
+        base = medians.get(DEFAULT_IO_BACKEND)
+        for backend, median in sorted(medians.items()):
+            if backend == DEFAULT_IO_BACKEND or base is None:
+                continue
+            rows.append({'files': files, 'sizes': sizes, 'ranks': ranks, 'io_workers': io_workers,
+                         'cpu_workers': cpu_workers, 'io_backend': backend, 'median': median,
+                         'thread_median': base, 'ratio': median / base})
+    return rows
+
+
+def compare(results, previous_path, threshold):
+    """Configs whose median time got worse by more than `threshold` (a fraction)."""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = {r['config']: r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        old = previous.get(r['config'])
+        if old is None:
+            continue
+        change = r['time']['median'] / old['time']['median'] - 1
+        if change > threshold:
+            regressions.append({'config': r['config'], 'old_median': old['time']['median'],
+                                'new_median': r['time']['median'], 'change': change})
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=BASE_DIR).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def write_csv(path, results):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['config', 'files', 'sizes', 'bytes', 'ranks', 'io_workers', 'io_backend', 'cpu_workers', 'workers',
+                    'median_s', 'p10_s', 'p90_s', 'stdev_s', 'files_per_s', 'mb_per_s', 'speedup'])
+        for r in results:
+            t = r['time']
+            w.writerow([r['config'], r['files'], r['sizes'], r['bytes'], r['ranks'], r['io_workers'],
+                        r['io_backend'], r['cpu_workers'], r['workers'], f"{t['median']:.6f}", f"{t['p10']:.6f}",
+                        f"{t['p90']:.6f}", f"{t['stdev']:.6f}", f"{r['files_per_s']:.2f}",
+                        f"{r['mb_per_s']:.3f}", f"{r['speedup']:.3f}"])
+
+
+def main():
+    p = argparse.ArgumentParser(description='Benchmark sweep for the parallel file analyzers')
+    p.add_argument('--io', type=_ints, default=[4], help='Comma-separated I/O worker counts')
+    p.add_argument('--cpu', type=_ints, default=[1, 2, 4], help='Comma-separated CPU worker counts')
+    p.add_argument('--io-backends', default=DEFAULT_IO_BACKEND,
+                   help=f"Comma-separated read backends to compare: {', '.join(IO_BACKENDS)}")
+    p.add_argument('--ranks', type=_ints, default=[0],
+                   help='Comma-separated MPI rank counts; 0 runs analyze_files in-process without MPI')
+    p.add_argument('--files', type=_ints, default=[800], help='Comma-separated corpus sizes (file counts)')
+    p.add_argument('--sizes', default='fixed', help=f"Comma-separated file size distributions: {', '.join(SIZE_DISTRIBUTIONS)}")
+    p.add_argument('--weak', action='store_true',
+                   help='Also run each config on a corpus of (smallest --files) x workers files, for weak scaling')
+    p.add_argument('--seed', type=int, default=237006081)
+    p.add_argument('--corpus-dir', default='bench_corpora', help='Where generated corpora are kept and reused')
+    p.add_argument('--detailed', action='store_true')
+    p.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE)
+    p.add_argument('--warmup', type=int, default=1)
+    p.add_argument('--repeats', type=int, default=5)
+    p.add_argument('--mpiexec', default='mpiexec --oversubscribe', help='Launcher command for --ranks > 0')
+    p.add_argument('--out', default='benchmark', help='Output prefix: writes PREFIX.json and PREFIX.csv')
+    p.add_argument('--compare', default=None, metavar='JSON', help='Earlier benchmark JSON to check for regressions')
+    p.add_argument('--threshold', type=float, default=0.10, help='Slowdown that counts as a regression (0.10 = 10%%)')
+    args = p.parse_args()
+
+    sizes = [s for s in args.sizes.split(',') if s]
+    for s in sizes:
+        if s not in SIZE_DISTRIBUTIONS:
+            p.error(f"unknown size distribution '{s}'")
+    backends = [b for b in args.io_backends.split(',') if b]
+    for b in backends:
+        if b not in IO_BACKENDS:
+            p.error(f"unknown I/O backend '{b}'")
+
+    plan = []
+    for s in sizes:
+        for n in args.files:
+            for ranks in args.ranks:
+                for io_workers in args.io:
+                    for cpu_workers in args.cpu:
+                        for b in backends:
+                            plan.append((n, s, ranks, io_workers, cpu_workers, b))
+        if args.weak:
+            base = min(args.files)
+            for ranks in args.ranks:
+                for io_workers in args.io:
+                    for cpu_workers in args.cpu:
+                        n = base * max(1, ranks) * cpu_workers
+                        if n not in args.files:
+                            for b in backends:
+                                plan.append((n, s, ranks, io_workers, cpu_workers, b))
+
+    results = []
+    serial_times = {}
+    for n, s, ranks, io_workers, cpu_workers, io_backend in plan:
+        folder = corpus_folder(args.corpus_dir, n, s, args.seed)
+        files = analyze_files.select_files(folder)
+        if (n, s) not in serial_times:
+            serial_times[(n, s)] = statistics.median(
+                sum(time_files(files, args.engine, args.detailed)) for _ in range(max(1, min(args.repeats, 3))))
+        if ranks:
+            times = run_mpi(folder, ranks, io_workers, cpu_workers, args.detailed, args.engine,
+                            args.warmup, args.repeats, args.mpiexec, io_backend)
+        else:
+            times = run_in_process(folder, io_workers, cpu_workers, args.detailed, args.engine,
+                                   args.warmup, args.repeats, io_backend)
+        nbytes = sum(os.path.getsize(f) for f in files)
+        stats = summarize(times)
+        workers = max(1, ranks) * cpu_workers
+        config = f'files={n},sizes={s},ranks={ranks},io={io_workers},cpu={cpu_workers}'
+        if io_backend != DEFAULT_IO_BACKEND:
+            # thread pool configs keep their old names, so --compare still matches them
+            config += f',io_backend={io_backend}'
+        results.append({
+            'config': config, 'files': n, 'sizes': s, 'bytes': nbytes, 'ranks': ranks,
+            'io_workers': io_workers, 'io_backend': io_backend, 'cpu_workers': cpu_workers, 'workers': workers,
+            'times': times, 'time': stats,
+            'files_per_s': n / stats['median'], 'mb_per_s': nbytes / stats['median'] / 1e6,
+            'speedup': serial_times[(n, s)] / stats['median'],
+        })
+        print(f"{config}: median {stats['median']:.3f}s (p10 {stats['p10']:.3f}, p90 {stats['p90']:.3f}), "
+              f"speedup {results[-1]['speedup']:.2f}x")
+
+    fits = scaling_fits(results, serial_times)
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_revision': git_revision(),
+            'machine': machine_id(),
+            'platform': platform.platform(),
+            'analyzer_version': ANALYZER_VERSION,
+            'engine': args.engine,
+            'detailed': args.detailed,
+            'warmup': args.warmup,
+            'repeats': args.repeats,
+            'seed': args.seed,
+        },
+        'results': results,
+        'fits': fits,
+        'io_backends': compare_backends(results),
+    }
+    if args.compare:
+        report['regressions'] = compare(results, args.compare, args.threshold)
+
+    with open(f'{args.out}.json', 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    write_csv(f'{args.out}.csv', results)
+
+    print('\nStrong scaling (Amdahl serial fraction):')
+    for fit in fits['strong']:
+        frac = f"{fit['serial_fraction']:.3f}" if fit['serial_fraction'] is not None else 'n/a'
+        print(f"  {fit['files']} files, {fit['sizes']}, {fit['io_backend']}: f = {frac}")
+    if fits['weak']:
+        print('Weak scaling (Gustafson serial fraction):')
+        for fit in fits['weak']:
+            frac = f"{fit['serial_fraction']:.3f}" if fit['serial_fraction'] is not None else 'n/a'
+            print(f"  {fit['sizes']}, {fit['io_backend']} from {fit['base_files']} files/worker: f = {frac}")
+    if report['io_backends']:
+        print('I/O backends (median time relative to the thread pool):')
+        for row in report['io_backends']:
+            print(f"  files={row['files']},sizes={row['sizes']},ranks={row['ranks']},io={row['io_workers']},"
+                  f"cpu={row['cpu_workers']} {row['io_backend']}: {row['median']:.3f}s vs {row['thread_median']:.3f}s "
+                  f"({row['ratio']:.2f}x)")
+    print(f'\nWrote {args.out}.json and {args.out}.csv')
+
+    if args.compare:
+        regressions = report['regressions']
+        for r in regressions:
+            print(f"REGRESSION {r['config']}: {r['old_median']:.3f}s -> {r['new_median']:.3f}s ({r['change']:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions over {args.threshold:.0%} against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+In-process analysis engine for the API.
+
+Keeps thread/process pools alive between requests so a run does not pay for
+interpreter startup, imports and pool creation, and runs the blocking
+analysis on driver threads so the event loop stays free.
+"""
+
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import analyze_files
+from modules.io_backends import DEFAULT_IO_BACKEND, make_io_pool
+
+
+def _ping(delay):
+    time.sleep(delay)
+
+
+class AnalysisEngine:
+    """Long-lived, pre-warmed executor pools for running analyses in-process.
+
+    Pools are kept per (io_workers, cpu_workers, io_backend) so a request
+    still runs on exactly the worker counts and read backend it asked for.
+    Once more than `max_pool_sets` pairs exist, the least recently used idle
+    pair is shut down; a pair whose process pool broke (a worker died) is
+    dropped and built again. `max_concurrent_runs` analyses can run at the
+    same time.
+    """
+
+    def __init__(self, max_pool_sets=4, max_concurrent_runs=4):
+        self.max_pool_sets = max_pool_sets
+        self._pools = OrderedDict()  # (io, cpu, io_backend) -> [tpool, ppool, users]
+        self._lock = threading.Lock()
+        self._driver = ThreadPoolExecutor(max_workers=max_concurrent_runs,
+                                          thread_name_prefix='analysis')
+
+    @contextmanager
+    def lease(self, io_workers, cpu_workers, io_backend=DEFAULT_IO_BACKEND):
+        """Borrow the (read executor, ProcessPoolExecutor) pair for a config."""
+        key = (io_workers, cpu_workers, io_backend)
+        with self._lock:
+            entry = self._pools.get(key)
+            if entry is None:
+                entry = [make_io_pool(io_backend, io_workers),
+                         ProcessPoolExecutor(max_workers=cpu_workers), 0]
+                self._pools[key] = entry
+            self._pools.move_to_end(key)
+            entry[2] += 1
+            self._evict_idle()
+        try:
+            yield entry[0], entry[1]
+        finally:
+            with self._lock:
+                entry[2] -= 1
+                retired = entry[2] == 0 and self._pools.get(key) is not entry
+            if retired:
+                entry[0].shutdown(wait=False)
+
+    def _discard(self, key, ppool):
+        """Drop the pair of a broken `ppool`; its read executor goes with its last user."""
+        with self._lock:
+            entry = self._pools.get(key)
+            if entry is not None and entry[1] is ppool:
+                del self._pools[key]
+        ppool.shutdown(wait=False)
+
+    def _evict_idle(self):
+        for key in list(self._pools):
+            if len(self._pools) <= self.max_pool_sets:
+                return
+            tpool, ppool, users = self._pools[key]
+            if users == 0:
+                del self._pools[key]
+                tpool.shutdown(wait=False)
+                ppool.shutdown(wait=False)
+
+    def warm_up(self, io_workers, cpu_workers):
+        """Create the pools for a config and start all its worker processes."""
+        with self.lease(io_workers, cpu_workers) as (_, ppool):
+            # processes are spawned on demand, so keep them all busy at once
+            futures = [ppool.submit(_ping, 0.05) for _ in range(cpu_workers)]
+            for fut in futures:
+                fut.result()
+
+    async def run(self, io_workers, cpu_workers, io_backend=DEFAULT_IO_BACKEND, **kwargs):
+        """Run `analyze_files.main` on pooled workers without blocking the loop.
+
+        Returns (summary, output): the metrics dict and the report text the
+        CLI would have printed.
+        """
+        lines = []
+
+        def job(retry=True):
+            key = (io_workers, cpu_workers, io_backend)
+            with self.lease(*key) as pools:
+                try:
+                    return analyze_files.main(max_workers_io=io_workers, max_workers_cpu=cpu_workers,
+                                              log=lines.append, pools=pools, io_backend=io_backend, **kwargs)
+                except BrokenProcessPool:
+                    self._discard(key, pools[1])
+                    if not retry:
+                        raise
+            # the pool broke before or during this run: once more on a fresh pair
+            lines.clear()
+            return job(retry=False)
+
+        loop = asyncio.get_running_loop()
+        summary = await loop.run_in_executor(self._driver, job)
+        return summary, '\n'.join(lines)
+
+    def shutdown(self):
+        with self._lock:
+            entries = list(self._pools.values())
+            self._pools.clear()
+        for tpool, ppool, _ in entries:
+            tpool.shutdown(wait=False)
+            ppool.shutdown(wait=False)
+        self._driver.shutdown(wait=False)
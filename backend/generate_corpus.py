@@ -0,0 +1,52 @@
+"""
+Generate a large random corpus for scale testing (see modules/utils.py).
+
+Files are made on a process pool with NumPy, each from its own seed, so
+the output is the same for any --workers. The corpus can be written as
+files, straight into a pack for --pack, or into one large file for --file.
+
+Example:
+    python generate_corpus.py --folder big --count 1000000 --distribution pareto --output pack
+    python generate_corpus.py --folder big --count 500000 --mean-bytes 4096 --output single
+"""
+
+import time
+import argparse
+
+from modules.pack import CODECS
+from modules.utils import CORPUS_DISTRIBUTIONS, CORPUS_OUTPUTS, generate_corpus
+
+
+def build_parser():
+    p = argparse.ArgumentParser(description='Generate a random text corpus in parallel')
+    p.add_argument('--folder', default='data',
+                   help='Folder of the generated files (with --output pack, the folder the pack reports them in)')
+    p.add_argument('--count', type=int, default=810,
+                   help='Number of files')
+    p.add_argument('--seed', type=int, default=237006081,
+                   help='Seed; file n is made from (seed, n)')
+    p.add_argument('--distribution', choices=CORPUS_DISTRIBUTIONS, default='lognormal',
+                   help='File size distribution')
+    p.add_argument('--mean-bytes', type=int, default=2200,
+                   help='Mean file size in bytes')
+    p.add_argument('--max-bytes', type=int, default=None,
+                   help='Cap on the size of a single file')
+    p.add_argument('--output', choices=CORPUS_OUTPUTS, default='files',
+                   help='Write separate files, a pack directory (pack_corpus.py format) or one large file (single)')
+    p.add_argument('--path', default=None,
+                   help='Pack directory or single file to write (default: the folder name plus .pack or .txt)')
+    p.add_argument('--compress', choices=CODECS, default='none',
+                   help='With --output pack, compress every block (zlib)')
+    p.add_argument('--workers', type=int, default=None,
+                   help='Worker processes (default: cpu_count)')
+    return p
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    start = time.perf_counter()
+    total = generate_corpus(args.folder, args.count, args.seed, args.distribution, args.mean_bytes,
+                            args.max_bytes, args.output, args.path, args.compress, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Generated {args.count} files ({total} bytes, {args.distribution}) as {args.output} "
+          f"in {elapsed:.2f}s ({total / max(elapsed, 1e-9) / 1e6:.1f} MB/s)")
@@ -0,0 +1,151 @@
+"""
+Background job queue for the API.
+
+A submitted analysis becomes a Job that runs in the background; the client
+gets its id immediately and can poll it, follow its progress over SSE,
+cancel it and fetch the result once it is done.
+"""
+
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+
+from analyze_files import AnalysisCancelled
+
+
+STATUSES = ('queued', 'running', 'done', 'failed', 'cancelled')
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+class Job:
+    """One submitted analysis and everything the client can ask about it."""
+
+    def __init__(self, kind, config):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.config = config
+        self.status = 'queued'
+        self.phase = None
+        self.files_done = 0
+        self.files_total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.proc = None  # set by runners that spawn a subprocess
+        self._phase_start = None
+        self._task = None
+
+    def progress(self, phase, done, total):
+        """Progress hook for `analyze_files.main`; called from the worker thread."""
+        if phase != self.phase:
+            self.phase = phase
+            self._phase_start = time.perf_counter()
+        self.files_done = done
+        self.files_total = total
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def to_dict(self):
+        rate = eta = None
+        if self._phase_start is not None and self.files_done:
+            elapsed = time.perf_counter() - self._phase_start
+            rate = self.files_done / max(elapsed, 1e-6)
+            if self.files_total is not None:
+                eta = (self.files_total - self.files_done) / rate
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'config': self.config,
+            'phase': self.phase,
+            'files_done': self.files_done,
+            'files_total': self.files_total,
+            'files_per_s': rate,
+            'eta_s': eta,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobManager:
+    """Runs submitted jobs in the background, at most `concurrency` at a time.
+
+    Jobs beyond the limit wait in 'queued' so simultaneous runs do not fight
+    over the same cores (and spoil each other's timings). Only the last
+    `keep` finished jobs are remembered.
+    """
+
+    def __init__(self, concurrency=1, keep=100):
+        self.concurrency = concurrency
+        self.keep = keep
+        self._jobs = OrderedDict()
+        self._slots = None
+
+    def submit(self, kind, config, runner):
+        """Queue `runner(job)`, an async callable returning the job result."""
+        if self._slots is None:
+            # created lazily so it belongs to the running event loop
+            self._slots = asyncio.Semaphore(self.concurrency)
+        job = Job(kind, config)
+        self._jobs[job.id] = job
+        self._forget_old()
+        job._task = asyncio.create_task(self._run(job, runner))
+        return job
+
+    async def _run(self, job, runner):
+        try:
+            async with self._slots:
+                if job.cancel_event.is_set():
+                    raise AnalysisCancelled()
+                job.status = 'running'
+                job.started_at = time.time()
+                job.result = await runner(job)
+            job.status = 'done'
+        except (AnalysisCancelled, asyncio.CancelledError):
+            job.status = 'cancelled'
+        except Exception as e:
+            if job.cancel_event.is_set():
+                job.status = 'cancelled'
+            else:
+                job.status = 'failed'
+                job.error = getattr(e, 'detail', None) or str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def _forget_old(self):
+        finished = [j.id for j in self._jobs.values() if j.finished]
+        for job_id in finished[:max(0, len(finished) - self.keep)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """Ask a job to stop. Returns the job, or None if the id is unknown."""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_event.set()
+        if job.status == 'queued':
+            job._task.cancel()
+        elif job.proc is not None and job.proc.returncode is None:
+            job.proc.terminate()
+        return job
+
+    async def shutdown(self):
+        for job in list(self._jobs.values()):
+            self.cancel(job.id)
+        tasks = [j._task for j in self._jobs.values() if j._task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,7 +1,25 @@
 import string
+import functools
+from itertools import repeat
+
+from modules.wordcount import pack_counter
+from modules.records import compact as _compact
+
+
+# Bump whenever the numbers any analyzer returns change, so cached results
+# computed by an older version are not reused.
+ANALYZER_VERSION = 2
+
+
+def _as_text(text):
+    """Decode bytes-like input (from the mmap loader) to str."""
+    if isinstance(text, str):
+        return text
+    return bytes(text).decode('utf-8')
 
 
 def analyze_text(text):
+    text = _as_text(text)
     words = text.split()
     vowels = sum(c in 'aeiouAEIOU' for c in text)
     digits = sum(c.isdigit() for c in text)
@@ -16,7 +34,7 @@ def analyze_text(text):
     }
 
 
-def detailed_analyze_text(text, top_k=20):
+def detailed_analyze_text(text, top_k=20, counts=False, into=None):
     """Return detailed analysis including token frequencies and word-length histogram.
 
     Output shape:
@@ -29,8 +47,15 @@ def detailed_analyze_text(text, top_k=20):
       'top_words': [(word, count), ...],
       'len_histogram': {length: count, ...}
     }
+
+    With `counts` the full word frequencies are added as well, packed with
+    `modules.wordcount.pack_counter` under 'word_counts', so callers can
+    build exact corpus-wide counts instead of summing truncated top lists.
+    With `into` (a Counter) the words are counted into it instead, so a
+    worker can merge the counts of all files of a task before sending any.
     """
     import collections
+    text = _as_text(text)
     words = [w.strip(string.punctuation).lower()
              for w in text.split() if w.strip(string.punctuation)]
     vowels = sum(c in 'aeiouAEIOU' for c in text)
@@ -43,7 +68,7 @@ def detailed_analyze_text(text, top_k=20):
 
     len_hist = collections.Counter(len(w) for w in words)
 
-    return {
+    result = {
         'words': len(words),
         'vowels': vowels,
         'digits': digits,
@@ -52,3 +77,139 @@ def detailed_analyze_text(text, top_k=20):
         'top_words': top_words,
         'len_histogram': dict(len_hist)
     }
+    if counts:
+        result['word_counts'] = pack_counter(counter)
+    if into is not None:
+        into.update(words)
+    return result
+
+
+# --- Fast engine -----------------------------------------------------------
+#
+# For ASCII input every character class we count (vowel, digit, punctuation,
+# whitespace) is decided by the byte value alone, so one `bytes.translate`
+# through a 256-entry table classifies the whole text and C-level `count`
+# calls read the totals off the result. Non-ASCII text falls back to the
+# reference implementation above because `str.isdigit` and `str.split`
+# know about Unicode digits and spaces. Both functions also accept the bytes
+# handed out by the mmap loader; ASCII bytes are counted without decoding.
+
+VOWELS = 'aeiouAEIOU'
+ENGINES = ('fast', 'python')
+DEFAULT_ENGINE = 'fast'
+
+
+def _build_class_table():
+    table = bytearray(b'o' * 256)
+    # everything str.split() treats as a separator in the ASCII range
+    for c in string.whitespace + '\x1c\x1d\x1e\x1f':
+        table[ord(c)] = ord(' ')
+    for c in VOWELS:
+        table[ord(c)] = ord('v')
+    for c in string.digits:
+        table[ord(c)] = ord('d')
+    for c in string.punctuation:
+        table[ord(c)] = ord('p')
+    return bytes(table)
+
+
+_CLASS_TABLE = _build_class_table()
+
+
+def _words(text):
+    """The stripped, lowercased words of ASCII `text`, as detailed_analyze_text has them.
+
+    Lowercasing the whole text first is the same as lowercasing each word
+    (it does not touch punctuation), and map/filter run the strip of every
+    token in C: one strip per token instead of two, no Python-level loop.
+    """
+    return list(filter(None, map(str.strip, text.lower().split(), repeat(string.punctuation))))
+
+
+def _class_counts(data):
+    """Return (vowels, digits, symbols, non_space, words) for ASCII bytes."""
+    classes = data.translate(_CLASS_TABLE)
+    non_space = len(data) - classes.count(b' ')
+    return (classes.count(b'v'), classes.count(b'd'), classes.count(b'p'),
+            non_space, len(classes.split()))
+
+
+def _ascii_bytes(text):
+    """Return `text` as bytes if it is pure ASCII, else None."""
+    if isinstance(text, str):
+        return text.encode('ascii') if text.isascii() else None
+    data = bytes(text) if not isinstance(text, bytes) else text
+    return data if data.isascii() else None
+
+
+def fast_analyze_text(text):
+    """Same result as `analyze_text`, computed in a single classification pass."""
+    data = _ascii_bytes(text)
+    if data is None:
+        return analyze_text(text)
+    vowels, digits, symbols, non_space, words = _class_counts(data)
+    return {
+        'words': words,
+        'vowels': vowels,
+        'digits': digits,
+        'symbols': symbols,
+        'avg_len': non_space / words if words else 0
+    }
+
+
+def fast_detailed_analyze_text(text, top_k=20, counts=False, into=None):
+    """Same result as `detailed_analyze_text` with single-pass character counts.
+
+    Words come from `_words` in text order and both counters are built by
+    Counter's C loop, so counts and the order of ties match exactly.
+    """
+    import collections
+    data = _ascii_bytes(text)
+    if data is None:
+        return detailed_analyze_text(text, top_k, counts, into)
+    vowels, digits, symbols, _, _ = _class_counts(data)
+
+    words = _words(data.decode('ascii'))
+    counter = collections.Counter(words)
+    len_hist = collections.Counter(map(len, words))
+    avg_len = sum(n * c for n, c in len_hist.items()) / len(words) if words else 0
+
+    result = {
+        'words': len(words),
+        'vowels': vowels,
+        'digits': digits,
+        'symbols': symbols,
+        'avg_len': avg_len,
+        'top_words': counter.most_common(top_k),
+        'len_histogram': dict(len_hist)
+    }
+    if counts:
+        result['word_counts'] = pack_counter(counter)
+    if into is not None:
+        # Counter.update of a list counts in C; updating from `counter` would loop in Python
+        into.update(words)
+    return result
+
+
+def get_analyzer(engine=DEFAULT_ENGINE, detailed=False, counts=False, compact=False, into=None):
+    """Return the analysis function for `engine`.
+
+    Detailed analyzers are called as f(text, top_k), basic ones as f(text).
+    With `counts`, detailed results also carry the packed 'word_counts'.
+    With `into` (a Counter), detailed analyzers add every file's words to
+    it. With `compact` they return a modules.records.FileRecord instead of
+    a dict.
+    """
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Unknown engine '{engine}', expected one of {', '.join(ENGINES)}")
+    if engine == 'fast':
+        fn = fast_detailed_analyze_text if detailed else fast_analyze_text
+    else:
+        fn = detailed_analyze_text if detailed else analyze_text
+    if detailed and (counts or into is not None):
+        # a partial of a module-level function still pickles for the pool
+        fn = functools.partial(fn, counts=counts, into=into)
+    if compact:
+        fn = functools.partial(_compact, fn)
+    return fn
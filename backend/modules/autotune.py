@@ -0,0 +1,161 @@
+import os
+import json
+import math
+import time
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.analyzer import ANALYZER_VERSION, get_analyzer
+from modules.baseline import machine_id
+from modules.batching import MAX_BATCH_BYTES, MIN_BATCH_BYTES, file_size
+from modules.io_loader import get_reader, payload_size
+
+
+# Calibration: time reads, analysis and a process-pool round trip on a small
+# sample of the corpus, then size the pipeline from those costs. The choice
+# is cached per machine and corpus profile, so later runs on a similar
+# corpus skip the probes.
+
+DEFAULT_AUTOTUNE_PATH = '.autotune.json'
+PROBE_FILES = 24
+MAX_IO_WORKERS = 32
+# a task should carry at least this many times its fixed IPC cost in work
+BATCH_OVERHEAD_RATIO = 10
+
+
+def corpus_profile(files, sizes=None):
+    """Coarse shape of a corpus: file count and mean size, bucketed by powers of two.
+
+    Corpora with the same profile get the same tuned configuration. `sizes`
+    may map path -> size (e.g. from the corpus manifest).
+    """
+    sizes = [sizes[path] if sizes and path in sizes else file_size(path) for path in files]
+    mean = sum(sizes) / len(sizes) if sizes else 0
+    return {
+        'files_bucket': 2 ** math.ceil(math.log2(max(1, len(sizes)))),
+        'mean_size_bucket': 2 ** math.ceil(math.log2(max(1, mean))),
+        'files': len(sizes),
+        'mean_size': mean,
+    }
+
+
+def _task_size(text):
+    """Process-pool probe task: returns right away, so timing it measures the IPC."""
+    return len(text)
+
+
+def probe(files, engine, detailed=False, top_k=20, loader='text', sample=PROBE_FILES, seed=0):
+    """Measure per-file read, analyze and IPC costs on a sample of `files`.
+
+    Returns seconds per file for 'read', 'analyze' and 'ipc' (a pickled
+    round trip of the file contents through a worker process), plus
+    'task_overhead', the round trip of an empty task.
+    """
+    files = random.Random(seed).sample(list(files), min(sample, len(files)))
+    reader = get_reader(loader)
+    analyzer = get_analyzer(engine, detailed)
+
+    read_times, analyze_times, texts = [], [], []
+    for path in files:
+        start = time.perf_counter()
+        text = reader(path)
+        read_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        analyzer(text, top_k) if detailed else analyzer(text)
+        analyze_times.append(time.perf_counter() - start)
+        texts.append(text)
+
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        pool.submit(_task_size, '').result()  # start the worker
+        start = time.perf_counter()
+        for _ in texts:
+            pool.submit(_task_size, '').result()
+        overhead = (time.perf_counter() - start) / max(1, len(texts))
+        start = time.perf_counter()
+        for text in texts:
+            pool.submit(_task_size, text).result()
+        ipc = (time.perf_counter() - start) / max(1, len(texts))
+
+    return {
+        'read': statistics.median(read_times) if read_times else 0.0,
+        'analyze': statistics.median(analyze_times) if analyze_times else 0.0,
+        'ipc': ipc,
+        'task_overhead': overhead,
+        'mean_bytes': sum(payload_size(t) for t in texts) / max(1, len(texts)),
+        'files_probed': len(texts),
+    }
+
+
+def choose(costs, n_files, cpu_count=None):
+    """Pick worker counts and batching from probe costs.
+
+    - cpu_workers: all cores, but no more than the work can use; a corpus
+      whose total analysis is shorter than starting the pool runs on one.
+    - io_workers: enough readers to feed them (Little's law: readers =
+      workers * read time / analyze time), at least one per worker for
+      cheap reads and at most MAX_IO_WORKERS.
+    - batching: when the fixed cost of a task is not small next to the
+      work in it, files are sent in batches big enough to amortize it.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    analyze = max(costs['analyze'], 1e-7)
+    total_work = analyze * n_files
+    startup = costs['task_overhead'] * 50  # rough cost of spawning and warming a pool
+
+    cpu_workers = max(1, min(cpu_count, n_files))
+    if total_work < startup:
+        cpu_workers = 1
+    per_file_cost = analyze + costs['read'] + costs['ipc']
+    io_workers = math.ceil(cpu_workers * costs['read'] / per_file_cost) if per_file_cost else 1
+    io_workers = max(1, min(MAX_IO_WORKERS, max(io_workers, min(cpu_workers, 4))))
+
+    files_per_task = math.ceil(BATCH_OVERHEAD_RATIO * costs['task_overhead'] / analyze)
+    batch = files_per_task > 1
+    batch_bytes = None
+    if batch:
+        # keep at least a few batches per worker so the tail stays balanced
+        files_per_task = min(files_per_task, max(1, n_files // (cpu_workers * 4)))
+        batch_bytes = int(min(MAX_BATCH_BYTES, max(MIN_BATCH_BYTES, files_per_task * costs['mean_bytes'])))
+        batch = files_per_task > 1
+    return {'io_workers': io_workers, 'cpu_workers': cpu_workers,
+            'batch': batch, 'batch_bytes': batch_bytes if batch else None}
+
+
+def _load(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def tune(files, engine, detailed=False, top_k=20, loader='text', path=DEFAULT_AUTOTUNE_PATH,
+         retune=False, log=print, sizes=None):
+    """Return a tuned {'io_workers', 'cpu_workers', 'batch', 'batch_bytes'} for `files`.
+
+    A configuration cached in `path` for this machine and corpus profile is
+    reused unless `retune`. The returned dict also says where it came from
+    ('source') and carries the probe costs.
+    """
+    profile = corpus_profile(files, sizes)
+    mode = f'detailed:{top_k}' if detailed else 'basic'
+    key = (f"{machine_id()}|v{ANALYZER_VERSION}:{engine}:{loader}:{mode}|"
+           f"{profile['files_bucket']}x{profile['mean_size_bucket']}B")
+    entries = _load(path)
+    if not retune and key in entries:
+        config = dict(entries[key], source='cached')
+        log(f"Auto-tune: using cached configuration from '{path}'")
+    else:
+        log(f'Auto-tune: probing {min(PROBE_FILES, len(files))} files...')
+        costs = probe(files, engine, detailed, top_k, loader)
+        config = dict(choose(costs, len(files)), costs=costs, tuned_at=time.time())
+        entries[key] = config
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp, path)
+        config = dict(config, source='probed')
+    log(f"Auto-tune: io_workers={config['io_workers']}, cpu_workers={config['cpu_workers']}, "
+        + (f"batches of ~{config['batch_bytes']} bytes" if config['batch'] else 'one task per file'))
+    return config
@@ -0,0 +1,159 @@
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import platform
+
+from modules.analyzer import ANALYZER_VERSION, get_analyzer
+from modules.io_loader import get_reader
+from modules.manifest import stat_file
+
+
+# The sequential baseline only exists to compute speedup, so it is opt-in:
+#   off     no baseline, speedup is not reported
+#   full    time every file single-threaded and store the result
+#   sample  time a random subset and extrapolate, with a 95% interval
+#   cached  reuse a stored full baseline for the same corpus, analyzer
+#           and machine; measure (and store) it only when there is none
+BASELINE_MODES = ('off', 'full', 'sample', 'cached')
+DEFAULT_BASELINE_PATH = '.baseline.json'
+SAMPLE_FRACTION = 0.1
+SAMPLE_MIN_FILES = 30
+Z_95 = 1.96
+
+
+def corpus_fingerprint(files, stat=stat_file):
+    """Hash of the names, sizes and mtimes of `files`; changes when the corpus does."""
+    h = hashlib.sha1()
+    for path in sorted(files):
+        try:
+            size, mtime_ns = stat(path)
+        except OSError:
+            continue
+        h.update(f'{os.path.abspath(path)}\0{size}\0{mtime_ns}\n'.encode())
+    return h.hexdigest()
+
+
+def machine_id():
+    return f'{platform.node()}/{platform.machine()}/{os.cpu_count()}cpu/py{platform.python_version()}'
+
+
+def baseline_key(files, engine, detailed, top_k, loader, stat=stat_file):
+    analyzer = f'v{ANALYZER_VERSION}:{engine}:{loader}:' + (f'detailed:{top_k}' if detailed else 'basic')
+    return f'{corpus_fingerprint(files, stat)}|{analyzer}|{machine_id()}'
+
+
+def time_files(files, engine, detailed=False, top_k=20, loader='text', tick=None):
+    """Read and analyze `files` one by one; return the seconds each one took.
+
+    `tick(done)` is called after every file, e.g. for progress reporting.
+    """
+    analyzer = get_analyzer(engine, detailed)
+    reader = get_reader(loader)
+    times = []
+    for path in files:
+        start = time.perf_counter()
+        try:
+            text = reader(path)
+            if detailed:
+                analyzer(text, top_k)
+            else:
+                analyzer(text)
+        except Exception:
+            pass
+        times.append(time.perf_counter() - start)
+        if tick:
+            tick(len(times))
+    return times
+
+
+def choose_sample(files, fraction=SAMPLE_FRACTION, min_files=SAMPLE_MIN_FILES, seed=0):
+    n = min(len(files), max(min_files, math.ceil(len(files) * fraction)))
+    return random.Random(seed).sample(list(files), n)
+
+
+def extrapolate(times, population):
+    """Estimate the total time of `population` files from per-file `times`.
+
+    Returns (estimate, half_width) of a 95% confidence interval, using the
+    finite population correction; the width is 0 when every file was timed.
+    """
+    n = len(times)
+    if n == 0:
+        return 0.0, 0.0
+    mean = sum(times) / n
+    if n == 1 or n >= population:
+        return mean * population, 0.0
+    var = sum((t - mean) ** 2 for t in times) / (n - 1)
+    fpc = (population - n) / (population - 1)
+    return mean * population, Z_95 * math.sqrt(var / n * fpc) * population
+
+
+class BaselineStore:
+    """Measured full baselines in a small JSON file, keyed by `baseline_key`."""
+
+    def __init__(self, path=DEFAULT_BASELINE_PATH):
+        self.path = path
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        return entry['seconds'] if entry else None
+
+    def put(self, key, seconds, files):
+        self.entries[key] = {'seconds': seconds, 'files': files, 'measured_at': time.time()}
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def measure_baseline(mode, files, engine, detailed=False, top_k=20, loader='text',
+                     store_path=DEFAULT_BASELINE_PATH, tick=None, log=print, stat=stat_file):
+    """Get the sequential time for `files` the way `mode` asks for.
+
+    `stat` (see modules.manifest) supplies sizes and mtimes for the corpus
+    fingerprint that stored baselines are keyed by.
+
+    Returns None for 'off', else {'seconds', 'ci' ((low, high) or None),
+    'source' ('measured', 'cached' or 'sampled'), 'files_timed'}.
+    """
+    if mode not in BASELINE_MODES:
+        raise ValueError(f"Unknown baseline mode '{mode}', expected one of {', '.join(BASELINE_MODES)}")
+    if mode == 'off':
+        return None
+    if mode == 'sample':
+        sample = choose_sample(files)
+        log(f'\nTiming a sequential baseline on a sample of {len(sample)} of {len(files)} files...')
+        estimate, half = extrapolate(time_files(sample, engine, detailed, top_k, loader, tick), len(files))
+        return {'seconds': estimate, 'ci': (max(estimate - half, 0.0), estimate + half),
+                'source': 'sampled', 'files_timed': len(sample)}
+
+    store = BaselineStore(store_path)
+    key = baseline_key(files, engine, detailed, top_k, loader, stat)
+    if mode == 'cached':
+        seconds = store.get(key)
+        if seconds is not None:
+            log(f"\nUsing stored sequential baseline from '{store_path}'")
+            return {'seconds': seconds, 'ci': None, 'source': 'cached', 'files_timed': 0}
+    log('\nRunning sequential baseline (single-process, single-thread) for timing...')
+    seconds = sum(time_files(files, engine, detailed, top_k, loader, tick))
+    store.put(key, seconds, len(files))
+    return {'seconds': seconds, 'ci': None, 'source': 'measured', 'files_timed': len(files)}
+
+
+def format_speedup(baseline, parallel_time):
+    """'2.31x' or '2.31x (95% CI 2.05-2.57x)'; None without a baseline."""
+    if baseline is None:
+        return None
+    text = f"{baseline['seconds'] / parallel_time:.2f}x"
+    if baseline['ci']:
+        low, high = baseline['ci']
+        text += f' (95% CI {low / parallel_time:.2f}-{high / parallel_time:.2f}x)'
+    return text
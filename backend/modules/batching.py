@@ -0,0 +1,153 @@
+import os
+import heapq
+from collections import Counter
+
+from modules.io_loader import DEFAULT_LOADER, get_reader, payload_size
+from modules.analyzer import DEFAULT_ENGINE, get_analyzer
+from modules.wordcount import word_partial
+
+
+MIN_BATCH_BYTES = 64 * 1024
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def auto_batch_bytes(total_bytes, workers, batches_per_worker=4):
+    """Pick a batch size so every worker gets a few batches to balance load.
+
+    Small batches waste time on per-future overhead, very large ones leave
+    workers idle at the tail, so the result is clamped to a sane window.
+    """
+    workers = max(1, workers or 1)
+    target = total_bytes // (workers * batches_per_worker)
+    return max(MIN_BATCH_BYTES, min(MAX_BATCH_BYTES, target))
+
+
+def make_batches(files, batch_bytes, sizes=None):
+    """Group `files` into consecutive lists of roughly `batch_bytes` bytes each.
+
+    `sizes` may map path -> size when it is already known; otherwise the
+    files are stat'ed here. A single file larger than `batch_bytes` gets a
+    batch of its own.
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+    for path in files:
+        size = sizes[path] if sizes is not None else file_size(path)
+        if current and current_bytes + size > batch_bytes:
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(path)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def balance_by_bytes(files, sizes, parts):
+    """Split `files` into `parts` lists of about equal total bytes.
+
+    Files go largest first to the currently lightest part; every list keeps
+    the order the files had in `files`.
+    """
+    heap = [(0, i) for i in range(parts)]
+    owner = {}
+    for path in sorted(files, key=sizes.__getitem__, reverse=True):
+        load, i = heapq.heappop(heap)
+        owner[path] = i
+        heapq.heappush(heap, (load + sizes[path], i))
+    out = [[] for _ in range(parts)]
+    for path in files:
+        out[owner[path]].append(path)
+    return out
+
+
+def plan_batches(files, workers, batch_bytes=None, sizes=None):
+    """Split `files` into byte-sized batches for the worker processes.
+
+    Returns (batches, batch_bytes). When `batch_bytes` is None it is derived
+    from the corpus size and worker count. `sizes` may map path -> size
+    (e.g. from the corpus manifest); otherwise the files are stat'ed.
+    """
+    if sizes is None:
+        sizes = {path: file_size(path) for path in files}
+    else:
+        sizes = {path: sizes[path] if path in sizes else file_size(path) for path in files}
+    if not batch_bytes:
+        if workers is None:
+            workers = os.cpu_count()
+        batch_bytes = auto_batch_bytes(sum(sizes.values()), workers)
+    return make_batches(files, batch_bytes, sizes), batch_bytes
+
+
+def task_analyzer(engine, detailed, merge_words=False):
+    """(analyzer, counter) for one worker task, see analyze_batch."""
+    words = Counter() if detailed and merge_words else None
+    return get_analyzer(engine, detailed, counts=words is None, compact=True, into=words), words
+
+
+def analyze_batch(paths, detailed=False, top_k=20, engine=DEFAULT_ENGINE, loader=DEFAULT_LOADER,
+                  merge_words=False, word_sketch=None):
+    """Worker entry point: read and analyze a whole batch of files.
+
+    Only the paths cross the process boundary on the way in, and a single
+    combined partial result comes back:
+    {
+      'results': {path: per-file result dict, ...},
+      'errors': {path: error message, ...},
+      'bytes': total bytes read
+    }
+    Detailed results carry each file's full 'word_counts', unless
+    `merge_words` is set: then the counts of the whole batch are merged
+    here and sent once, as the word partial under 'words' (see
+    modules.wordcount.word_partial, cut to `word_sketch` words if given).
+    """
+    analyzer, words = task_analyzer(engine, detailed, merge_words)
+    reader = get_reader(loader)
+    results = {}
+    errors = {}
+    nbytes = 0
+    for path in paths:
+        try:
+            text = reader(path)
+        except Exception as e:
+            errors[path] = f'read failed: {e}'
+            continue
+        nbytes += payload_size(text)
+        try:
+            if detailed:
+                results[path] = analyzer(text, top_k)
+            else:
+                results[path] = analyzer(text)
+        except Exception as e:
+            errors[path] = f'analysis failed: {e}'
+    part = {'results': results, 'errors': errors, 'bytes': nbytes}
+    if words is not None:
+        part['words'] = word_partial(words, word_sketch)
+    return part
+
+
+def analyze_texts(texts, detailed=False, top_k=20, engine=DEFAULT_ENGINE, word_sketch=None):
+    """Worker entry point of the per-file pipeline when word counts are merged.
+
+    Analyzes a group of texts read by the parent and returns (results,
+    words): one result per text, in order ({'error': message} for a failed
+    one), and the word partial of the group (None unless `detailed`).
+    """
+    analyzer, words = task_analyzer(engine, detailed, merge_words=True)
+    extra = (top_k,) if detailed else ()
+    out = []
+    for text in texts:
+        try:
+            out.append(analyzer(text, *extra))
+        except Exception as e:
+            out.append({'error': f'analysis failed: {e}'})
+    return out, word_partial(words, word_sketch) if words is not None else None
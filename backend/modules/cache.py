@@ -0,0 +1,220 @@
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+from array import array
+
+from modules.analyzer import ANALYZER_VERSION
+from modules.records import FileRecord
+from modules.manifest import stat_file
+
+
+DEFAULT_CACHE_MB = 256
+# Bump when the tables or what is pickled into them change; older caches are dropped
+CACHE_FORMAT = 2
+
+
+class ResultCache:
+    """On-disk cache of per-file analysis results, backed by SQLite.
+
+    An entry is valid while the file keeps the size and mtime it had when it
+    was analyzed, and only for the same analyzer version, mode and `top_k`.
+    The compact result and the file's packed word counts are stored apart,
+    so the counts are only read when a file's words have to be re-added.
+    The total stored size is kept under `max_bytes` by evicting the least
+    recently used entries when the cache is closed.
+
+    Besides the files, the aggregate of a whole run can be stored under its
+    `corpus_key` (modules.pipeline.Aggregator.partial): a run over exactly
+    the same unchanged files then loads that one row instead of every file.
+
+    Several processes (e.g. MPI ranks) may share one cache file; SQLite
+    serializes the writers.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_CACHE_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._pending = []
+        self._touched = []
+        self._now = time.time_ns()
+        self.aggregate_hit = False
+        self._db = sqlite3.connect(path, timeout=60)
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != CACHE_FORMAT:
+            with self._db:
+                self._db.execute('DROP TABLE IF EXISTS results')
+                self._db.execute('DROP TABLE IF EXISTS aggregates')
+                self._db.execute(f'PRAGMA user_version = {CACHE_FORMAT}')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            ' path TEXT NOT NULL, variant TEXT NOT NULL,'
+            ' size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,'
+            ' result BLOB NOT NULL, words BLOB, nbytes INTEGER NOT NULL,'
+            ' last_used INTEGER NOT NULL,'
+            ' PRIMARY KEY (path, variant))')
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS results_lru ON results (last_used)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS aggregates ('
+            ' corpus TEXT NOT NULL, variant TEXT NOT NULL, stamp TEXT NOT NULL,'
+            ' result BLOB NOT NULL, nbytes INTEGER NOT NULL,'
+            ' last_used INTEGER NOT NULL,'
+            ' PRIMARY KEY (corpus, variant))')
+        self._db.commit()
+
+    @staticmethod
+    def variant(detailed, top_k):
+        mode = f'detailed:{top_k}' if detailed else 'basic'
+        return f'v{ANALYZER_VERSION}:{mode}'
+
+    @staticmethod
+    def stat_key(path):
+        """(absolute path, size, mtime_ns) identifying the file's current content."""
+        st = os.stat(path)
+        return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+    def get(self, key, detailed, top_k):
+        """Return the cached result for `key` (from `stat_key`) or None.
+
+        A detailed result gets its 'word_counts' back.
+        """
+        path, size, mtime_ns = key
+        variant = self.variant(detailed, top_k)
+        row = self._db.execute(
+            'SELECT size, mtime_ns, result, words FROM results WHERE path = ? AND variant = ?',
+            (path, variant)).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched.append((self._now, path, variant))
+        r = pickle.loads(row[2])
+        if row[3] is not None:
+            counts = pickle.loads(row[3])
+            if isinstance(r, FileRecord):
+                r.word_counts = counts
+            else:
+                r['word_counts'] = counts
+        return r
+
+    def partition(self, files, detailed, top_k, on_hit, stat=stat_file):
+        """Split `files` into cached and to-be-analyzed.
+
+        Calls on_hit(path, result) for every file with a valid entry and
+        returns (todo, keys): the remaining paths, and their stat keys to
+        `put` the fresh results under. `stat(path)` gives (size, mtime_ns).
+        """
+        todo = []
+        keys = {}
+        for path in files:
+            try:
+                key = (os.path.abspath(path),) + tuple(stat(path))
+            except OSError:
+                todo.append(path)  # let the pipeline report the failure
+                continue
+            r = self.get(key, detailed, top_k)
+            if r is None:
+                keys[path] = key
+                todo.append(path)
+            else:
+                on_hit(path, r)
+        return todo, keys
+
+    def put(self, key, detailed, top_k, result):
+        path, size, mtime_ns = key
+        words = None
+        counts = result.get('word_counts')
+        if counts is not None:
+            words = pickle.dumps(counts, protocol=pickle.HIGHEST_PROTOCOL)
+            if isinstance(result, FileRecord):
+                result = result.stripped()
+            else:
+                result = {k: v for k, v in result.items() if k != 'word_counts'}
+        blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self._pending.append((path, self.variant(detailed, top_k), size, mtime_ns,
+                              blob, words, len(blob) + len(words or b''), self._now))
+        if len(self._pending) >= 1000:
+            self._flush()
+
+    @staticmethod
+    def corpus_key(files, stat=stat_file):
+        """(corpus, stamp) digests of `files` for the aggregate entries, None if one is gone.
+
+        corpus identifies the list of paths, stamp their sizes and mtimes.
+        """
+        stamps = array('q')
+        try:
+            for path in files:
+                stamps.extend(stat(path))
+        except OSError:
+            return None
+        corpus = hashlib.blake2b('\n'.join(map(os.path.abspath, files)).encode('utf-8'), digest_size=16)
+        return corpus.hexdigest(), hashlib.blake2b(stamps.tobytes(), digest_size=16).hexdigest()
+
+    @classmethod
+    def aggregate_variant(cls, detailed, top_k, word_sketch=None):
+        variant = cls.variant(detailed, top_k)
+        return f'{variant}:sketch{word_sketch}' if detailed and word_sketch else variant
+
+    def get_aggregate(self, corpus_key, detailed, top_k, word_sketch=None):
+        """The aggregate partial stored for `corpus_key` if no file changed since, else None."""
+        corpus, stamp = corpus_key
+        variant = self.aggregate_variant(detailed, top_k, word_sketch)
+        row = self._db.execute(
+            'SELECT stamp, result FROM aggregates WHERE corpus = ? AND variant = ?',
+            (corpus, variant)).fetchone()
+        if row is None or row[0] != stamp:
+            return None
+        self.aggregate_hit = True
+        with self._db:
+            self._db.execute('UPDATE aggregates SET last_used = ? WHERE corpus = ? AND variant = ?',
+                             (self._now, corpus, variant))
+        return pickle.loads(row[1])
+
+    def put_aggregate(self, corpus_key, detailed, top_k, word_sketch, partial):
+        corpus, stamp = corpus_key
+        blob = pickle.dumps(partial, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO aggregates VALUES (?, ?, ?, ?, ?, ?)',
+                             (corpus, self.aggregate_variant(detailed, top_k, word_sketch), stamp,
+                              blob, len(blob), self._now))
+
+    def _flush(self):
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self._pending)
+            self._db.executemany(
+                'UPDATE results SET last_used = ? WHERE path = ? AND variant = ?', self._touched)
+        self._pending = []
+        self._touched = []
+
+    def _evict(self):
+        total = self._db.execute(
+            'SELECT (SELECT COALESCE(SUM(nbytes), 0) FROM results)'
+            ' + (SELECT COALESCE(SUM(nbytes), 0) FROM aggregates)').fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        doomed = {'results': [], 'aggregates': []}
+        for table, rowid, nbytes in self._db.execute(
+                "SELECT 'results', rowid, nbytes, last_used FROM results"
+                " UNION ALL SELECT 'aggregates', rowid, nbytes, last_used FROM aggregates"
+                ' ORDER BY last_used'):
+            if total <= self.max_bytes:
+                break
+            doomed[table].append((rowid,))
+            total -= nbytes
+        with self._db:
+            for table, rowids in doomed.items():
+                self._db.executemany(f'DELETE FROM {table} WHERE rowid = ?', rowids)
+        return sum(map(len, doomed.values()))
+
+    def close(self):
+        self._flush()
+        self._evict()
+        self._db.close()
+
+    def summary(self):
+        return {'hits': self.hits, 'misses': self.misses, 'aggregate_hit': self.aggregate_hit}
@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+from array import array
+
+from modules.records import LEN_HIST_WIDTH, FileRecord
+
+
+# Columnar per-file results: a directory with one raw file per column plus
+# meta.json giving each column's dtype (byte order included) and shape.
+# Rows are buffered in `array`s and appended a row group at a time, so
+# writing is a handful of large sequential writes and memory stays
+# bounded; `load_columns` memory-maps the columns back as NumPy arrays
+# without parsing anything.
+
+FORMAT = 'columnar-results'
+FORMAT_VERSION = 1
+ROW_GROUP_ROWS = 65536
+
+_ORDER = '<' if sys.byteorder == 'little' else '>'
+INT_COLUMNS = ('words', 'vowels', 'digits', 'symbols')
+
+
+def _dtype(typecode):
+    return _ORDER + {'q': 'i8', 'd': 'f8', 'B': 'u1'}[typecode]
+
+
+class ColumnarWriter:
+    """Stream per-file results into a columnar directory at `path`.
+
+    Has the `add`/`close` interface of modules.writers.ResultWriter. With
+    `detailed` the length histograms go into a dense rows x LEN_HIST_WIDTH
+    int64 matrix whose last column also counts all longer words. Paths are
+    kept as one UTF-8 blob plus row offsets.
+    """
+
+    def __init__(self, path='results.cols', detailed=False, row_group=ROW_GROUP_ROWS):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.detailed = detailed
+        self.row_group = row_group
+        self.rows = 0
+        self.row_groups = 0
+        self._path_bytes = 0
+        self._columns = {name: 'q' for name in INT_COLUMNS}
+        self._columns['avg_len'] = 'd'
+        if detailed:
+            self._columns['len_histogram'] = 'q'
+        self._columns['path_offsets'] = 'q'
+        self._columns['path_bytes'] = 'B'
+        self._buffers = {name: array(code) for name, code in self._columns.items()}
+        self._files = {name: open(os.path.join(path, name + '.bin'), 'wb') for name in self._columns}
+        self._buffers['path_offsets'].append(0)
+        self._pending = 0
+
+    def add(self, path, r):
+        buf = self._buffers
+        for name in INT_COLUMNS:
+            buf[name].append(r.get(name, 0))
+        buf['avg_len'].append(r.get('avg_len', 0))
+        if self.detailed:
+            row = [0] * LEN_HIST_WIDTH
+            if isinstance(r, FileRecord):
+                row[:len(r.len_hist)] = r.len_hist
+                rest = r.len_overflow or {}
+            else:
+                rest = r.get('len_histogram', {})
+            for length, count in rest.items():
+                row[min(int(length), LEN_HIST_WIDTH - 1)] += count
+            buf['len_histogram'].extend(row)
+        name = path.encode('utf-8')
+        buf['path_bytes'].frombytes(name)
+        self._path_bytes += len(name)
+        buf['path_offsets'].append(self._path_bytes)
+        self.rows += 1
+        self._pending += 1
+        if self._pending >= self.row_group:
+            self._flush()
+
+    def _flush(self):
+        for name, buf in self._buffers.items():
+            buf.tofile(self._files[name])
+            del buf[:]
+        if self._pending:
+            self.row_groups += 1
+        self._pending = 0
+
+    def close(self, aggregate, top_words=(), len_histogram=None):
+        self._flush()
+        for f in self._files.values():
+            f.close()
+        shapes = {name: [self.rows] for name in self._columns}
+        shapes['path_offsets'] = [self.rows + 1]
+        shapes['path_bytes'] = [self._path_bytes]
+        if self.detailed:
+            shapes['len_histogram'] = [self.rows, LEN_HIST_WIDTH]
+        meta = {
+            'format': FORMAT,
+            'version': FORMAT_VERSION,
+            'rows': self.rows,
+            'row_groups': self.row_groups,
+            'columns': {name: {'dtype': _dtype(code), 'shape': shapes[name]}
+                        for name, code in self._columns.items()},
+            'aggregate': aggregate,
+            'top_words': list(top_words),
+            'len_histogram': len_histogram or {},
+        }
+        with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+class Columns:
+    """Memory-mapped view of a columnar results directory.
+
+    `cols['words']` etc. are read-only NumPy memmaps; `path(i)` decodes one
+    row's path. The aggregate, top words and histogram are in `meta`.
+    """
+
+    def __init__(self, path):
+        import numpy as np
+
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != FORMAT:
+            raise ValueError(f"{path} is not a columnar results directory")
+        self.rows = self.meta['rows']
+        self._arrays = {}
+        for name, spec in self.meta['columns'].items():
+            shape = tuple(spec['shape'])
+            if 0 in shape:
+                # mmap refuses empty files
+                self._arrays[name] = np.zeros(shape, dtype=spec['dtype'])
+            else:
+                self._arrays[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=spec['dtype'],
+                                               mode='r', shape=shape)
+
+    def __getitem__(self, name):
+        return self._arrays[name]
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def path(self, i):
+        offsets = self._arrays['path_offsets']
+        return bytes(self._arrays['path_bytes'][offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def paths(self):
+        for i in range(self.rows):
+            yield self.path(i)
+
+
+def load_columns(path='results.cols'):
+    """Open a directory written by ColumnarWriter (needs NumPy)."""
+    return Columns(path)
@@ -0,0 +1,91 @@
+import os
+import pickle
+
+from modules.analyzer import ANALYZER_VERSION
+from modules.pipeline import Aggregator
+from modules.manifest import stat_file
+
+
+# Bump when the pickled layout of the state (or its Aggregator) changes
+STATE_FORMAT = 2
+
+
+class IncrementalState:
+    """Aggregate of a previous run plus what each file contributed to it.
+
+    Persisted with pickle so the next run only has to analyze files that
+    were added or changed, and can take deleted or changed files back out of
+    the totals by subtracting their old results.
+    """
+
+    def __init__(self, detailed=False, top_k=20):
+        self.detailed = detailed
+        self.top_k = top_k
+        self.version = ANALYZER_VERSION
+        self.format = STATE_FORMAT
+        self.files = {}  # abs path -> (size, mtime_ns, result)
+        self.aggregator = Aggregator(detailed)
+
+    @classmethod
+    def load(cls, path, detailed=False, top_k=20):
+        """Load the state at `path`; start fresh if missing or made with other settings."""
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return cls(detailed, top_k)
+        if (not isinstance(state, cls) or state.version != ANALYZER_VERSION
+                or getattr(state, 'format', 1) != STATE_FORMAT
+                or state.detailed != detailed or state.top_k != top_k):
+            print(f"Ignoring incremental state in '{path}' (made with other settings)")
+            return cls(detailed, top_k)
+        return state
+
+    def save(self, path):
+        # write-then-rename so an interrupted save never leaves a torn file
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def diff(self, paths, stat=stat_file):
+        """Compare `paths` with the state.
+
+        Returns (todo, keys, deleted): paths added or changed since the last
+        run, their current (size, mtime_ns), and the state paths that are
+        gone. `stat(path)` gives the current (size, mtime_ns).
+        """
+        todo = []
+        keys = {}
+        seen = set()
+        for path in paths:
+            try:
+                key = tuple(stat(path))
+            except OSError:
+                continue  # vanished between listing and stat, treat as deleted
+            path = os.path.abspath(path)
+            seen.add(path)
+            old = self.files.get(path)
+            if old is None or old[:2] != key:
+                todo.append(path)
+                keys[path] = key
+        deleted = [p for p in self.files if p not in seen]
+        return todo, keys, deleted
+
+    def forget(self, path):
+        """Take `path` out of the aggregate, if it was part of it."""
+        old = self.files.pop(path, None)
+        if old is not None:
+            self.aggregator.remove(old[2])
+
+    def update(self, path, key, result):
+        self.forget(path)
+        self.files[path] = (key[0], key[1], result)
+        self.aggregator.add(result)
+
+    def summary(self):
+        agg = self.aggregator.summary()
+        # re-derive the float sum so repeated add/remove cannot drift
+        agg['avg_len'] = (sum(r.get('avg_len', 0) for _, _, r in self.files.values()) / len(self.files)
+                          if self.files else 0)
+        return agg
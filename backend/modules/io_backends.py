@@ -0,0 +1,131 @@
+import asyncio
+import threading
+from functools import partial
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+
+
+# Backends for the read stage of the pipeline. 'thread' is a plain
+# ThreadPoolExecutor with one blocking read per task; 'asyncio' is
+# AsyncReadExecutor, which keeps the outstanding reads on an event loop and
+# runs them in batches on a couple of threads. Both are Executors, so
+# either can be the `tpool` of modules.pipeline's stream functions.
+
+IO_BACKENDS = ('thread', 'asyncio')
+DEFAULT_IO_BACKEND = 'thread'
+ASYNC_BATCH = 32
+ASYNC_READ_THREADS = 2
+
+
+def _run_batch(batch):
+    for fn, args, fut in batch:
+        if not fut.set_running_or_notify_cancel():
+            continue  # cancelled while queued
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            fut.set_exception(e)
+        else:
+            fut.set_result(result)
+
+
+class AsyncReadExecutor(Executor):
+    """Run read calls from an asyncio event loop living in its own thread.
+
+    `submit` is thread-safe and returns a concurrent.futures.Future. The
+    loop queues the calls; a dispatcher takes up to `batch` of them at a
+    time and hands each batch as one job to `threads` reader threads (0
+    runs the batches on the loop thread itself). An asyncio.Semaphore
+    keeps at most `concurrency` calls in dispatched batches. Many
+    outstanding reads are served by a few threads with one hand-off per
+    batch instead of one thread switch per file.
+    """
+
+    def __init__(self, concurrency=64, batch=ASYNC_BATCH, threads=ASYNC_READ_THREADS):
+        self.concurrency = max(1, concurrency or 1)
+        self.batch = max(1, min(batch, self.concurrency))
+        self._readers = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='aio-read') if threads else None
+        self._shutdown = False
+        self._lock = threading.Lock()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name='aio-loop', daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._started.set()
+        try:
+            self._loop.run_until_complete(self._dispatch())
+        finally:
+            self._loop.close()
+            if self._readers is not None:
+                self._readers.shutdown(wait=True)
+
+    async def _dispatch(self):
+        running = set()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    self._queue.put_nowait(None)  # stop after this batch
+                    break
+                batch.append(item)
+            for _ in batch:
+                await self._semaphore.acquire()
+            if self._readers is None:
+                _run_batch(batch)
+                self._release(len(batch))
+                continue
+            job = self._loop.run_in_executor(self._readers, _run_batch, batch)
+            job.add_done_callback(lambda _, n=len(batch): self._release(n))
+            running.add(job)
+            job.add_done_callback(running.discard)
+        if running:
+            await asyncio.wait(running)
+
+    def _release(self, n):
+        for _ in range(n):
+            self._semaphore.release()
+
+    def submit(self, fn, /, *args, **kwargs):
+        if kwargs:
+            fn, args = partial(fn, *args, **kwargs), ()
+        fut = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, (fn, args, fut))
+        return fut
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            if cancel_futures:
+                self._loop.call_soon_threadsafe(self._cancel_queued)
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+        if wait:
+            self._thread.join()
+
+    def _cancel_queued(self):
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                item[2].cancel()
+
+
+def make_io_pool(backend=DEFAULT_IO_BACKEND, workers=None):
+    """A new executor for the read stage; `workers` is its thread count or read concurrency."""
+    if backend not in IO_BACKENDS:
+        raise ValueError(f"Unknown I/O backend '{backend}', expected one of {', '.join(IO_BACKENDS)}")
+    if backend == 'asyncio':
+        return AsyncReadExecutor(concurrency=workers or 64)
+    return ThreadPoolExecutor(max_workers=workers)
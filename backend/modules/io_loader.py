@@ -1,6 +1,39 @@
 import os
+import mmap
+
+
+LOADERS = ('text', 'mmap')
+DEFAULT_LOADER = 'text'
 
 
 def read_file(path):
     with open(path, 'r', encoding='utf-8') as f:
         return f.read()
+
+
+def read_file_mmap(path):
+    """Return the raw bytes of `path` through a read-only memory map.
+
+    No decoding happens here; the analyzers count ASCII character classes
+    straight from the bytes and only decode when they have to.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap refuses empty files
+            return b''
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[:]
+
+
+def get_reader(loader=DEFAULT_LOADER):
+    if loader not in LOADERS:
+        raise ValueError(
+            f"Unknown loader '{loader}', expected one of {', '.join(LOADERS)}")
+    return read_file_mmap if loader == 'mmap' else read_file
+
+
+def payload_size(data):
+    """Size in bytes of what a reader returned (str is measured as UTF-8)."""
+    if isinstance(data, str):
+        return len(data) if data.isascii() else len(data.encode('utf-8'))
+    return len(data)
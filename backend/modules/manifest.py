@@ -0,0 +1,245 @@
+import os
+import time
+import pickle
+import hashlib
+from array import array
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+
+# The corpus manifest is a sorted index of the .txt files of a folder with
+# their size, mtime and optionally a content hash, persisted under
+# MANIFEST_DIR (one file per folder, keyed by its absolute path) rather than
+# inside or next to the data. Every entry point lists the corpus and weighs
+# partitions by bytes through it instead of listing the folder again.
+#
+# A stored manifest is trusted while the folder's own (mtime, size)
+# signature is unchanged, so an up to date corpus costs one stat. Adding,
+# deleting or renaming a file changes that signature and the folder is
+# scanned again; a file rewritten in place does not, which only a full
+# refresh (load_manifest's `refresh`) picks up. Files whose mtime was within
+# RACY_NS of the scan may still have been written to and are stat'ed again.
+# The recorded sizes and mtimes may therefore be stale: they are good for
+# listing and partitioning, but whether a cached, incremental or baseline
+# result is still valid is always decided by stat'ing the file itself
+# (Manifest.stat).
+#
+# Listing is one os.scandir pass; the stat calls, and hashing when asked
+# for, run on a thread pool in chunks since they release the GIL. A rescan
+# reuses the stored hash of every file whose size and mtime are unchanged.
+
+MANIFEST_DIR = '.manifests'
+MANIFEST_SUFFIX = '.manifest'
+MANIFEST_VERSION = 2
+STAT_CHUNK = 4096
+HASH_BLOCK = 1024 * 1024
+RACY_NS = 2 * 10**9
+
+
+def stat_file(path):
+    """(size, mtime_ns) of `path`; raises OSError if it is gone."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def dir_signature(folder):
+    """(mtime_ns, size) of the folder itself; changes when files are added, deleted or renamed."""
+    st = os.stat(folder)
+    return st.st_mtime_ns, st.st_size
+
+
+def manifest_path(folder, directory=MANIFEST_DIR):
+    """Where the manifest of `folder` is stored: `directory`/<name>-<digest of its absolute path>."""
+    folder = os.path.abspath(folder)
+    digest = hashlib.blake2b(folder.encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(directory, f'{os.path.basename(folder) or "root"}-{digest}{MANIFEST_SUFFIX}')
+
+
+def _stat_names(folder, names):
+    rows = []
+    for name in names:
+        try:
+            st = os.stat(os.path.join(folder, name))
+        except OSError:
+            continue  # deleted since the listing
+        rows.append((name, st.st_size, st.st_mtime_ns))
+    return rows
+
+
+def hash_file(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    """The .txt files of `folder`, sorted by name, with sizes and mtimes.
+
+    `names` is a list, `sizes` and `mtimes` are int64 arrays in the same
+    order and `hashes` a list of hex digests (None when not hashed).
+    `signature` is the folder's dir_signature and `scanned_ns` the time the
+    files were stat'ed.
+    """
+
+    def __init__(self, folder, names, sizes, mtimes, hashes=None, signature=None, scanned_ns=0):
+        self.folder = folder
+        self.names = names
+        self.sizes = sizes
+        self.mtimes = mtimes
+        self.hashes = hashes
+        self.signature = signature
+        self.scanned_ns = scanned_ns
+        self._index = None
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def total_bytes(self):
+        return sum(self.sizes)
+
+    @classmethod
+    def scan(cls, folder, previous=None, hash=False, workers=8):
+        """Build the manifest of `folder`; `previous` donates unchanged hashes."""
+        signature = dir_signature(folder)
+        scanned_ns = time.time_ns()
+        with os.scandir(folder) as entries:
+            names = sorted(e.name for e in entries if e.name.lower().endswith('.txt') and e.is_file())
+        chunks = [names[i:i + STAT_CHUNK] for i in range(0, len(names), STAT_CHUNK)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            rows = [row for part in pool.map(partial(_stat_names, folder), chunks) for row in part]
+            manifest = cls(folder, [name for name, _, _ in rows], array('q', (s for _, s, _ in rows)),
+                           array('q', (m for _, _, m in rows)), signature=signature, scanned_ns=scanned_ns)
+            if hash:
+                manifest.hashes = list(pool.map(manifest._hash_or_reuse, range(len(rows)),
+                                                [previous] * len(rows), chunksize=256))
+        return manifest
+
+    def restat_racy(self, hash=False):
+        """Stat again the files modified shortly before the scan.
+
+        Their writers may not have finished when they were stat'ed. Updates
+        the entries (and `scanned_ns`) in place and returns True if any of
+        them changed; raises OSError if one is gone.
+        """
+        racy = [i for i, mtime in enumerate(self.mtimes) if mtime >= self.scanned_ns - RACY_NS]
+        if not racy:
+            return False
+        scanned_ns = time.time_ns()
+        changed = False
+        for i in racy:
+            path = os.path.join(self.folder, self.names[i])
+            size, mtime = stat_file(path)
+            if (size, mtime) != (self.sizes[i], self.mtimes[i]):
+                self.sizes[i], self.mtimes[i] = size, mtime
+                if self.hashes is not None:
+                    self.hashes[i] = hash_file(path) if hash else None
+                changed = True
+        self.scanned_ns = scanned_ns
+        return changed
+
+    def is_current(self):
+        """Whether the folder still holds these files, as far as load_manifest can tell without a rescan."""
+        try:
+            return self.signature == dir_signature(self.folder) and not self.restat_racy()
+        except OSError:
+            return False
+
+    def _hash_or_reuse(self, i, previous):
+        name = self.names[i]
+        if previous is not None and previous.hashes is not None:
+            old = previous.entry(name)
+            if old is not None and old[:2] == (self.sizes[i], self.mtimes[i]) and old[2]:
+                return old[2]
+        try:
+            return hash_file(os.path.join(self.folder, name))
+        except OSError:
+            return None
+
+    def entry(self, name):
+        """(size, mtime_ns, hash) of file `name`, or None."""
+        if self._index is None:
+            self._index = {n: i for i, n in enumerate(self.names)}
+        i = self._index.get(name)
+        if i is None:
+            return None
+        return self.sizes[i], self.mtimes[i], self.hashes[i] if self.hashes else None
+
+    def paths(self, limit=None):
+        names = self.names if limit is None else self.names[:limit]
+        return [os.path.join(self.folder, name) for name in names]
+
+    def size_map(self, limit=None):
+        """{path: size} for the first `limit` files, for byte-weighted partitioning."""
+        return dict(zip(self.paths(limit), self.sizes))
+
+    def stat(self, path):
+        """Current (size, mtime_ns) of `path`, never the recorded entry: validity keys need real stats."""
+        return stat_file(path)
+
+    def same_files(self, other):
+        return (other is not None and self.signature == other.signature and self.names == other.names
+                and self.sizes == other.sizes and self.mtimes == other.mtimes
+                and (self.hashes is None or self.hashes == other.hashes))
+
+    def save(self, path):
+        state = {'version': MANIFEST_VERSION, 'folder': os.path.abspath(self.folder), 'names': self.names,
+                 'sizes': self.sizes, 'mtimes': self.mtimes, 'hashes': self.hashes,
+                 'signature': self.signature, 'scanned_ns': self.scanned_ns}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # write-then-rename so readers never see a torn file
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, folder, path):
+        """The manifest stored at `path`, or None if missing or unreadable."""
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if (not isinstance(state, dict) or state.get('version') != MANIFEST_VERSION
+                or state.get('folder') != os.path.abspath(folder)):
+            return None
+        return cls(folder, state['names'], state['sizes'], state['mtimes'], state['hashes'],
+                   state['signature'], state['scanned_ns'])
+
+
+def load_manifest(folder='data', path=None, refresh=False, hash=False, workers=8):
+    """The manifest of `folder`, persisted at `path` (default: manifest_path).
+
+    The stored manifest is reused while the folder's dir_signature is
+    unchanged, re-stat'ing only the files that were being written around
+    the last scan; otherwise the folder is scanned again. `refresh` forces
+    the full scan, which also catches files rewritten in place. Persisting
+    is skipped if the location is not writable.
+    """
+    if path is None:
+        path = manifest_path(folder)
+    stored = Manifest.load(folder, path)
+    if (not refresh and stored is not None and (stored.hashes is not None or not hash)
+            and stored.signature == dir_signature(folder)):
+        scanned_ns = stored.scanned_ns
+        try:
+            stored.restat_racy(hash)
+            if stored.scanned_ns != scanned_ns:
+                _save(stored, path)
+            return stored
+        except OSError:
+            pass  # a file vanished without the folder changing (yet): rescan
+    manifest = Manifest.scan(folder, stored, hash, workers)
+    if not manifest.same_files(stored):
+        _save(manifest, path)
+    return manifest
+
+
+def _save(manifest, path):
+    try:
+        manifest.save(path)
+    except OSError:
+        pass
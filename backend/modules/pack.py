@@ -0,0 +1,335 @@
+import os
+import mmap
+import time
+import zlib
+import pickle
+from array import array
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.io_loader import DEFAULT_LOADER, LOADERS
+from modules.analyzer import DEFAULT_ENGINE
+from modules.batching import plan_batches, task_analyzer
+from modules.wordcount import word_partial
+from modules.manifest import load_manifest
+
+
+# Packed corpus: a directory holding a few large segment files plus one
+# index, so a corpus of millions of tiny files is read with a handful of
+# opens and large sequential (or memory-mapped) reads instead of one
+# open/read/close and inode lookup per file.
+#
+#   corpus.pack/index          pickled dict, see PackWriter.close
+#   corpus.pack/seg-00000.bin  blocks of concatenated files, back to back
+#
+# Files are grouped into blocks of about `block_bytes`; a file never spans
+# two blocks. With the zlib codec every block is compressed on its own, so
+# any block can be read and inflated without touching the others. Blocks
+# are the unit of work handed to the worker processes, and results are
+# reported under each file's original path (source folder + name).
+
+PACK_SUFFIX = '.pack'
+PACK_FORMAT = 'text-pack'
+PACK_VERSION = 1
+CODECS = ('none', 'zlib')
+# blocks are the smallest unit of work, so they must be small enough for a
+# modest corpus to spread over all workers (cf. batching.MIN_BATCH_BYTES)
+DEFAULT_BLOCK_BYTES = 64 * 1024
+DEFAULT_SEGMENT_BYTES = 256 * 1024 * 1024
+READ_CHUNK = 1024
+
+# One block as the workers see it. `members` is a tuple of
+# (path, offset, length) inside the uncompressed block; the tuple is
+# hashable, so blocks can stand in for paths in modules.batching.
+Block = namedtuple('Block', 'segment offset stored raw codec members')
+
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class PackWriter:
+    """Append files to a new pack directory at `path`, block by block."""
+
+    def __init__(self, path, source, codec='none', block_bytes=DEFAULT_BLOCK_BYTES,
+                 segment_bytes=DEFAULT_SEGMENT_BYTES):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}', expected one of {', '.join(CODECS)}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.source = source
+        self.codec = codec
+        self.block_bytes = block_bytes
+        self.segment_bytes = segment_bytes
+        self.segments = []
+        self.names = []
+        self.member_offsets = array('q')
+        self.member_lengths = array('q')
+        self.block_segments = array('q')
+        self.block_offsets = array('q')
+        self.block_stored = array('q')
+        self.block_raw = array('q')
+        self.block_first = array('q', [0])
+        self.stored_bytes = 0
+        self._segment = None
+        self._segment_size = 0
+        self._block = bytearray()
+
+    def add(self, name, data):
+        if self._block and len(self._block) + len(data) > self.block_bytes:
+            self._flush_block()
+        self.names.append(name)
+        self.member_offsets.append(len(self._block))
+        self.member_lengths.append(len(data))
+        self._block += data
+
+    def _flush_block(self):
+        data = zlib.compress(self._block) if self.codec == 'zlib' else self._block
+        if self._segment is None or (self._segment_size and self._segment_size + len(data) > self.segment_bytes):
+            self._open_segment()
+        self._segment.write(data)
+        self.block_segments.append(len(self.segments) - 1)
+        self.block_offsets.append(self._segment_size)
+        self.block_stored.append(len(data))
+        self.block_raw.append(len(self._block))
+        self.block_first.append(len(self.names))
+        self._segment_size += len(data)
+        self.stored_bytes += len(data)
+        self._block = bytearray()
+
+    def _open_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        name = f'seg-{len(self.segments):05d}.bin'
+        self.segments.append(name)
+        self._segment = open(os.path.join(self.path, name), 'wb')
+        self._segment_size = 0
+
+    def close(self):
+        if self._block:
+            self._flush_block()
+        if self._segment is not None:
+            self._segment.close()
+        state = {'format': PACK_FORMAT, 'version': PACK_VERSION, 'source': self.source,
+                 'codec': self.codec, 'segments': self.segments, 'names': self.names,
+                 'member_offsets': self.member_offsets, 'member_lengths': self.member_lengths,
+                 'block_segments': self.block_segments, 'block_offsets': self.block_offsets,
+                 'block_stored': self.block_stored, 'block_raw': self.block_raw,
+                 'block_first': self.block_first}
+        # the index goes last: a pack without one is not a pack
+        tmp = os.path.join(self.path, 'index.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, os.path.join(self.path, 'index'))
+
+
+def pack_corpus(folder='data', out=None, codec='none', block_bytes=DEFAULT_BLOCK_BYTES,
+                segment_bytes=DEFAULT_SEGMENT_BYTES, limit_data=None, io_workers=8, log=print):
+    """Pack the .txt files of `folder` (from its manifest) into `out`.
+
+    `out` defaults to the folder's path plus PACK_SUFFIX. Files are read on
+    `io_workers` threads a chunk at a time and written in name order.
+    Returns the Pack.
+    """
+    if out is None:
+        out = os.path.normpath(folder) + PACK_SUFFIX
+    manifest = load_manifest(folder)
+    names = manifest.names if limit_data is None else manifest.names[:limit_data]
+    writer = PackWriter(out, folder, codec, block_bytes, segment_bytes)
+    with ThreadPoolExecutor(max_workers=io_workers) as pool:
+        for i in range(0, len(names), READ_CHUNK):
+            chunk = names[i:i + READ_CHUNK]
+            for name, data in zip(chunk, pool.map(_read_bytes, [os.path.join(folder, n) for n in chunk])):
+                writer.add(name, data)
+    writer.close()
+    raw = sum(writer.block_raw)
+    log(f"Packed {len(names)} files ({raw} bytes) from '{folder}' into '{out}': "
+        f"{len(writer.block_raw)} blocks in {len(writer.segments)} segments, "
+        f"{writer.stored_bytes} bytes stored ({codec})")
+    return load_pack(out)
+
+
+class Pack:
+    """Read-side view of a pack directory's index."""
+
+    def __init__(self, path, state):
+        self.path = path
+        self.source = state['source']
+        self.codec = state['codec']
+        self.segments = state['segments']
+        self.names = state['names']
+        self.member_offsets = state['member_offsets']
+        self.member_lengths = state['member_lengths']
+        self.block_segments = state['block_segments']
+        self.block_offsets = state['block_offsets']
+        self.block_stored = state['block_stored']
+        self.block_raw = state['block_raw']
+        self.block_first = state['block_first']
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def total_bytes(self):
+        return sum(self.member_lengths)
+
+    @property
+    def stored_bytes(self):
+        return sum(self.block_stored)
+
+    def paths(self, limit=None):
+        """Original paths of the packed files, in pack order."""
+        names = self.names if limit is None else self.names[:limit]
+        return [os.path.join(self.source, name) for name in names]
+
+    def blocks(self, limit=None):
+        """Block descriptors covering the first `limit` files (all by default)."""
+        n = len(self.names) if limit is None else min(limit, len(self.names))
+        out = []
+        for b in range(len(self.block_raw)):
+            first, end = self.block_first[b], min(self.block_first[b + 1], n)
+            if first >= end:
+                break
+            members = tuple((os.path.join(self.source, self.names[i]), self.member_offsets[i],
+                             self.member_lengths[i]) for i in range(first, end))
+            out.append(Block(os.path.join(self.path, self.segments[self.block_segments[b]]),
+                             self.block_offsets[b], self.block_stored[b], self.block_raw[b],
+                             self.codec, members))
+        return out
+
+
+def load_pack(path):
+    """Open the pack directory at `path`; ValueError if it is not one."""
+    try:
+        with open(os.path.join(path, 'index'), 'rb') as f:
+            state = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        raise ValueError(f"{path} is not a readable pack: {e}") from e
+    if not isinstance(state, dict) or state.get('format') != PACK_FORMAT:
+        raise ValueError(f"{path} is not a pack directory")
+    if state.get('version') != PACK_VERSION:
+        raise ValueError(f"{path} has pack version {state.get('version')}, expected {PACK_VERSION}")
+    return Pack(path, state)
+
+
+def block_sizes(blocks):
+    """{block: uncompressed bytes}, the weights for plan_batches and friends."""
+    return {block: block.raw for block in blocks}
+
+
+def plan_pack_batches(blocks, workers, batch_bytes=None):
+    """Group consecutive blocks into batches of about `batch_bytes`, see plan_batches."""
+    return plan_batches(blocks, workers, batch_bytes, block_sizes(blocks))
+
+
+class _Segments:
+    """Open segment files of one task: file handles, or maps with the mmap loader."""
+
+    def __init__(self, loader):
+        self.loader = loader
+        self._open = {}
+
+    def read(self, block):
+        """The stored bytes of `block` (a memoryview into the map with mmap)."""
+        if block.stored == 0:
+            return b''
+        handle = self._open.get(block.segment)
+        if handle is None:
+            f = open(block.segment, 'rb')
+            if self.loader == 'mmap':
+                with f:
+                    handle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                handle = f
+            self._open[block.segment] = handle
+        if self.loader == 'mmap':
+            return memoryview(handle)[block.offset:block.offset + block.stored]
+        handle.seek(block.offset)
+        return handle.read(block.stored)
+
+    def close(self):
+        for handle in self._open.values():
+            handle.close()
+        self._open.clear()
+
+
+def _release(data):
+    # the map cannot close while views into it are alive
+    if isinstance(data, memoryview):
+        data.release()
+
+
+def _block_data(segments, block):
+    """The uncompressed bytes of `block`; a view into the map for plain blocks read with mmap."""
+    data = segments.read(block)
+    try:
+        if block.codec == 'zlib':
+            data, stored = zlib.decompress(data), data
+            _release(stored)
+        if len(data) != block.raw:
+            raise ValueError(f'block at {block.offset} of {block.segment} has {len(data)} bytes, expected {block.raw}')
+    except BaseException:
+        _release(data)
+        raise
+    return data
+
+
+def analyze_blocks(blocks, detailed=False, top_k=20, engine=DEFAULT_ENGINE, loader=DEFAULT_LOADER,
+                   merge_words=False, word_sketch=None):
+    """Worker entry point: read, inflate and analyze a batch of pack blocks.
+
+    Same arguments and return value as modules.batching.analyze_batch,
+    keyed by the files' original paths. `loader` picks how segments are
+    read: one seek and read per block (text) or slices of a memory map
+    (mmap).
+    """
+    if loader not in LOADERS:
+        raise ValueError(f"Unknown loader '{loader}', expected one of {', '.join(LOADERS)}")
+    analyzer, words = task_analyzer(engine, detailed, merge_words)
+    extra = (top_k,) if detailed else ()
+    results = {}
+    errors = {}
+    nbytes = 0
+    segments = _Segments(loader)
+    try:
+        for block in blocks:
+            try:
+                data = _block_data(segments, block)
+            except Exception as e:
+                for path, _, _ in block.members:
+                    errors[path] = f'read failed: {e}'
+                continue
+            try:
+                for path, offset, length in block.members:
+                    text = bytes(data[offset:offset + length])
+                    nbytes += length
+                    try:
+                        results[path] = analyzer(text, *extra)
+                    except Exception as e:
+                        errors[path] = f'analysis failed: {e}'
+            finally:
+                _release(data)
+    finally:
+        segments.close()
+    part = {'results': results, 'errors': errors, 'bytes': nbytes}
+    if words is not None:
+        part['words'] = word_partial(words, word_sketch)
+    return part
+
+
+def time_blocks(blocks, engine, detailed=False, top_k=20, loader=DEFAULT_LOADER, tick=None):
+    """Sequential seconds per block, the pack counterpart of baseline.time_files.
+
+    `tick(done)` is called with the number of files done after each block.
+    """
+    times = []
+    done = 0
+    for block in blocks:
+        start = time.perf_counter()
+        analyze_blocks([block], detailed, top_k, engine, loader, merge_words=True)
+        times.append(time.perf_counter() - start)
+        done += len(block.members)
+        if tick:
+            tick(done)
+    return times
@@ -0,0 +1,493 @@
+import time
+import pickle
+from operator import add, sub
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import Counter
+from contextlib import nullcontext
+
+from modules.io_loader import DEFAULT_LOADER, get_reader, payload_size
+from modules.analyzer import DEFAULT_ENGINE, get_analyzer
+from modules.batching import analyze_batch, analyze_texts
+from modules.shm import SegmentRing, analyze_shared, fill_segment
+from modules.wordcount import MisraGries, add_packed, packed_items, word_partial
+from modules.trace import timed_call
+from modules.records import LEN_HIST_WIDTH, FileRecord
+
+
+_DONE = object()
+# texts per analyze task of stream_analyze when word counts are merged in the workers
+MERGE_GROUP = 8
+
+
+def _cancel_pending(pending):
+    """Drop queued tasks when the consumer stops early; running ones finish."""
+    for fut in pending:
+        fut.cancel()
+
+
+def _pool(pool, factory, workers):
+    """Use a caller-owned pool as is, or create one that is shut down afterwards."""
+    return nullcontext(pool) if pool is not None else factory(max_workers=workers)
+
+
+def _submit(pool, tracer, fn, *args):
+    """pool.submit, wrapped in `timed_call` when a tracer is recording."""
+    if tracer is None:
+        return pool.submit(fn, *args)
+    return pool.submit(timed_call, fn, *args)
+
+
+def _result(fut, tracer, stage, submitted):
+    """fut.result(), booking the timings with the tracer if there is one."""
+    if tracer is None:
+        return fut.result()
+    return tracer.record(stage, submitted, fut.result())
+
+
+def default_inflight(io_workers, cpu_workers):
+    """Enough files in flight to keep every reader and worker busy."""
+    return (io_workers or 1) + 4 * (cpu_workers or 1)
+
+
+def stream_analyze(files, io_workers, cpu_workers, detailed=False, top_k=20,
+                   engine=DEFAULT_ENGINE, max_inflight=None, loader=DEFAULT_LOADER,
+                   stats=None, tpool=None, ppool=None, reader=None, tracer=None,
+                   words=None, word_sketch=None):
+    """Read files in threads and analyze them in processes, yielding as they finish.
+
+    At most `max_inflight` files are between "read submitted" and "result
+    yielded" at any time, so only that many texts are ever held in memory no
+    matter how long `files` is. `files` can be any iterable, it is consumed
+    lazily.
+
+    `loader` picks the read backend (see modules.io_loader); a `reader`
+    function replaces it for items that are not plain paths. If `stats` is a
+    dict, stats['bytes_read'] is incremented with the bytes read. Long-lived
+    executors can be passed as `tpool`/`ppool`; they are not shut down.
+    A `tracer` (modules.trace.Tracer) gets the 'read' and 'analyze' stage
+    timings, the in-flight depth and the bytes pickled to the workers.
+
+    Results are modules.records.FileRecord objects. Detailed ones carry
+    their file's full 'word_counts' unless `words` is given: then the texts
+    go to the workers in groups of up to MERGE_GROUP, each group's word
+    counts are merged in the worker, and `words(partial)` gets one word
+    partial per group (modules.wordcount.word_partial, cut to `word_sketch`
+    words if given). Yields (path, result, error); exactly one of
+    result/error is None.
+    """
+    merge = detailed and words is not None
+    group = MERGE_GROUP if merge else 1
+    analyzer = None if merge else get_analyzer(engine, detailed, counts=True, compact=True)
+    if reader is None:
+        reader = get_reader(loader)
+    if stats is not None:
+        stats.setdefault('bytes_read', 0)
+    extra = (top_k,) if detailed else ()
+    if max_inflight is None:
+        max_inflight = default_inflight(io_workers, (cpu_workers or 1) * group)
+    # a smaller window than requested groups would leave workers idle
+    group = min(group, max(1, max_inflight // (2 * (cpu_workers or 1))))
+
+    files = iter(files)
+    pending = {}  # future -> (stage, path or paths of a group, submitted)
+    ready = []  # (path, text) read and waiting for a group to fill up
+    inflight = 0  # files submitted but not yet yielded
+    reading = 0
+
+    with _pool(tpool, ThreadPoolExecutor, io_workers) as tpool, _pool(ppool, ProcessPoolExecutor, cpu_workers) as ppool:
+        def refill():
+            nonlocal inflight, reading
+            while inflight < max_inflight:
+                path = next(files, _DONE)
+                if path is _DONE:
+                    return
+                pending[_submit(tpool, tracer, reader, path)] = ('read', path, time.perf_counter())
+                inflight += 1
+                reading += 1
+
+        def flush(n):
+            paths = [path for path, _ in ready[:n]]
+            texts = [text for _, text in ready[:n]]
+            del ready[:n]
+            pending[_submit(ppool, tracer, analyze_texts, texts, detailed, top_k, engine, word_sketch)] = (
+                'analyze', paths, time.perf_counter())
+
+        refill()
+        try:
+            while pending:
+                if tracer is not None:
+                    tracer.depth(inflight)
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    stage, path, submitted = pending.pop(fut)
+                    if stage == 'read':
+                        reading -= 1
+                        try:
+                            text = _result(fut, tracer, stage, submitted)
+                        except Exception as e:
+                            inflight -= 1
+                            yield path, None, f'read failed: {e}'
+                            continue
+                        if stats is not None or tracer is not None:
+                            nbytes = payload_size(text)
+                            if stats is not None:
+                                stats['bytes_read'] += nbytes
+                            if tracer is not None:
+                                tracer.sent(nbytes)
+                        # the slot moves on to the analyze stage, the window stays the same
+                        if merge:
+                            ready.append((path, text))
+                        else:
+                            pending[_submit(ppool, tracer, analyzer, text, *extra)] = (
+                                'analyze', path, time.perf_counter())
+                    elif merge:
+                        inflight -= len(path)
+                        try:
+                            out, partial = _result(fut, tracer, stage, submitted)
+                        except Exception as e:
+                            for p in path:
+                                yield p, None, f'analysis failed: {e}'
+                            continue
+                        if partial is not None:
+                            words(partial)
+                        for p, r in zip(path, out):
+                            if 'error' in r:
+                                yield p, None, r['error']
+                            else:
+                                yield p, r, None
+                    else:
+                        inflight -= 1
+                        try:
+                            r = _result(fut, tracer, stage, submitted)
+                        except Exception as e:
+                            yield path, None, f'analysis failed: {e}'
+                            continue
+                        yield path, r, None
+                refill()
+                while len(ready) >= group:
+                    flush(group)
+                if ready and not reading:
+                    # nothing more is being read for now; do not wait for a full group
+                    flush(len(ready))
+        finally:
+            _cancel_pending(pending)
+
+
+def _batch_paths(batch):
+    """The file paths of a batch of paths or of pack blocks."""
+    for item in batch:
+        if hasattr(item, 'members'):
+            yield from (path for path, _, _ in item.members)
+        else:
+            yield item
+
+
+def stream_batches(batches, cpu_workers, detailed=False, top_k=20,
+                   engine=DEFAULT_ENGINE, max_inflight=None, loader=DEFAULT_LOADER,
+                   stats=None, ppool=None, tracer=None, task=analyze_batch, words=None,
+                   word_sketch=None):
+    """Like `stream_analyze` but each task is a batch of paths read by the worker.
+
+    At most `max_inflight` batches are submitted at once; a `tracer` sees
+    one 'batch' stage per task. `task` is the worker function, called as
+    task(batch, detailed, top_k, engine, loader, merge_words, word_sketch)
+    and returning what modules.batching.analyze_batch does
+    (modules.pack.analyze_blocks takes batches of pack blocks instead).
+    With `words`, every batch's word counts are merged in the worker and
+    `words(partial)` gets the batch's word partial. Yields (path, result,
+    error) per file, also for every file of a batch whose task failed.
+    """
+    if stats is not None:
+        stats.setdefault('bytes_read', 0)
+    if max_inflight is None:
+        max_inflight = 2 * (cpu_workers or 1)
+    merge = detailed and words is not None
+
+    batches = iter(batches)
+    pending = {}  # future -> (submitted, batch)
+
+    with _pool(ppool, ProcessPoolExecutor, cpu_workers) as ppool:
+        def refill():
+            while len(pending) < max_inflight:
+                batch = next(batches, _DONE)
+                if batch is _DONE:
+                    return
+                if tracer is not None:
+                    tracer.sent(len(pickle.dumps(batch)))
+                pending[_submit(ppool, tracer, task, batch, detailed, top_k, engine, loader,
+                                merge, word_sketch)] = time.perf_counter(), batch
+
+        refill()
+        try:
+            while pending:
+                if tracer is not None:
+                    tracer.depth(len(pending))
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    submitted, batch = pending.pop(fut)
+                    try:
+                        part = _result(fut, tracer, 'batch', submitted)
+                    except Exception as e:
+                        for path in _batch_paths(batch):
+                            yield path, None, f'batch failed: {e}'
+                        continue
+                    if stats is not None:
+                        stats['bytes_read'] += part['bytes']
+                    if 'words' in part:
+                        words(part['words'])
+                    for path, err in part['errors'].items():
+                        yield path, None, err
+                    for path, r in part['results'].items():
+                        yield path, r, None
+                refill()
+        finally:
+            _cancel_pending(pending)
+
+
+def stream_shared(batches, segment_bytes, io_workers, cpu_workers, detailed=False, top_k=20,
+                  engine=DEFAULT_ENGINE, max_inflight=None, stats=None, tpool=None, ppool=None,
+                  tracer=None, words=None, word_sketch=None):
+    """Hand file contents to the workers through shared memory segments.
+
+    Reader threads copy each batch into a segment from a ring of
+    `max_inflight` segments of `segment_bytes`; the workers only receive the
+    segment name plus (offset, length) spans and send back one result per
+    file. Segments are recycled as results come back and always unlinked on
+    exit, also when the pipeline fails or the consumer stops early.
+
+    If `stats` is a dict it gets 'bytes_read', 'ipc_payload_bytes' (file
+    bytes that did not have to be pickled) and 'ipc_descriptor_bytes' (what
+    was pickled instead). A `tracer` gets 'read' (segment fill) and
+    'analyze' stage timings. `words` works as in `stream_batches`, one word
+    partial per segment. Yields (path, result, error) per file.
+    """
+    if max_inflight is None:
+        max_inflight = 2 * (cpu_workers or 1)
+    if stats is not None:
+        for key in ('bytes_read', 'ipc_payload_bytes', 'ipc_descriptor_bytes'):
+            stats.setdefault(key, 0)
+    merge = detailed and words is not None
+
+    batches = iter(batches)
+    pending = {}  # future -> (stage, payload, submitted)
+    ring = SegmentRing(max_inflight, segment_bytes)
+
+    try:
+        with _pool(tpool, ThreadPoolExecutor, io_workers) as tpool, _pool(ppool, ProcessPoolExecutor, cpu_workers) as ppool:
+            def refill():
+                while len(pending) < max_inflight:
+                    batch = next(batches, _DONE)
+                    if batch is _DONE:
+                        return
+                    pending[_submit(tpool, tracer, fill_segment, ring, batch)] = (
+                        'read', batch, time.perf_counter())
+
+            refill()
+            try:
+                while pending:
+                    if tracer is not None:
+                        tracer.depth(len(pending))
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        stage, payload, submitted = pending.pop(fut)
+                        if stage == 'read':
+                            try:
+                                seg, entries, errors = _result(fut, tracer, stage, submitted)
+                            except Exception as e:
+                                for path in payload:
+                                    yield path, None, f'read failed: {e}'
+                                continue
+                            for path, err in errors.items():
+                                yield path, None, err
+                            spans = [(off, n) for _, off, n in entries]
+                            if stats is not None or tracer is not None:
+                                descriptor = len(pickle.dumps((seg.name, spans)))
+                                if stats is not None:
+                                    nbytes = sum(n for _, n in spans)
+                                    stats['bytes_read'] += nbytes
+                                    stats['ipc_payload_bytes'] += nbytes
+                                    stats['ipc_descriptor_bytes'] += descriptor
+                                if tracer is not None:
+                                    tracer.sent(descriptor)
+                            pending[_submit(ppool, tracer, analyze_shared, seg.name, spans, detailed, top_k, engine,
+                                            merge, word_sketch)] = ('analyze', (seg, entries), time.perf_counter())
+                        else:
+                            seg, entries = payload
+                            try:
+                                out, partial = _result(fut, tracer, stage, submitted)
+                            except Exception as e:
+                                out, partial = [{'error': f'analysis failed: {e}'}] * len(entries), None
+                            finally:
+                                ring.release(seg)
+                            if partial is not None:
+                                words(partial)
+                            for (path, _, _), r in zip(entries, out):
+                                if 'error' in r:
+                                    yield path, None, r['error']
+                                else:
+                                    yield path, r, None
+                    refill()
+            finally:
+                _cancel_pending(pending)
+                # a caller-owned tpool is not shut down here: readers still
+                # copying into a segment must finish before the ring goes
+                wait([fut for fut, (stage, _, _) in pending.items() if stage == 'read'])
+    finally:
+        ring.close()
+
+
+def _subtract(counter, items):
+    """counter -= items, dropping keys that reach zero."""
+    for key, c in items:
+        left = counter.get(key, 0) - c
+        if left > 0:
+            counter[key] = left
+        else:
+            counter.pop(key, None)
+
+
+def _fold_histogram(dense, overflow, hist, op):
+    """dense/overflow (op)= a {length: count} dict."""
+    for n, c in hist.items():
+        if n < LEN_HIST_WIDTH:
+            dense[n] = op(dense[n], c)
+        else:
+            overflow[n] = op(overflow.get(n, 0), c)
+            if not overflow[n]:
+                del overflow[n]
+
+
+class Aggregator:
+    """Running totals over per-file results, so the results need not be kept.
+
+    Word frequencies are summed exactly, straight from each file's packed
+    'word_counts' or from the word partials of whole worker tasks passed to
+    `add_words` (the pipelines' `words` callback). With `word_sketch` they
+    go into a Misra-Gries summary of that many words instead, which bounds
+    memory at the price of counts that may be low by at most
+    `word_counter.error`.
+
+    `partial` packs all totals into a small picklable dict that `merge`
+    adds to another Aggregator, e.g. to reuse a whole run from a cache.
+
+    Length histograms are summed into a dense list of LEN_HIST_WIDTH
+    counts (plus an overflow Counter for longer words); FileRecord results
+    are added straight from their attributes and histogram arrays.
+    """
+
+    def __init__(self, detailed=False, word_sketch=None):
+        self.detailed = detailed
+        self.files = 0
+        self.words = 0
+        self.vowels = 0
+        self.digits = 0
+        self.symbols = 0
+        self.avg_len_sum = 0.0
+        self.word_counter = MisraGries(word_sketch) if word_sketch else Counter()
+        self.hist = [0] * LEN_HIST_WIDTH
+        self.hist_overflow = Counter()
+
+    @property
+    def len_hist(self):
+        """The summed length histogram as a Counter {length: count}."""
+        hist = Counter({n: c for n, c in enumerate(self.hist) if c})
+        hist.update(self.hist_overflow)
+        return hist
+
+    def _add_record(self, r, op):
+        self.files = op(self.files, 1)
+        self.words = op(self.words, r.words)
+        self.vowels = op(self.vowels, r.vowels)
+        self.digits = op(self.digits, r.digits)
+        self.symbols = op(self.symbols, r.symbols)
+        self.avg_len_sum = op(self.avg_len_sum, r.avg_len)
+        if self.detailed and r.len_hist is not None:
+            n = len(r.len_hist)
+            self.hist[:n] = map(op, self.hist[:n], r.len_hist)
+            if r.len_overflow:
+                _fold_histogram(self.hist, self.hist_overflow, r.len_overflow, op)
+
+    def _add_counts(self, r):
+        packed = r.get('word_counts')
+        if packed is None:
+            return  # merged in the worker and added through add_words
+        if isinstance(self.word_counter, MisraGries):
+            self.word_counter.merge_partial((packed, r.get('words', 0), 0))
+        else:
+            add_packed(self.word_counter, packed)
+
+    def _remove_counts(self, r):
+        packed = r.get('word_counts')
+        if packed is not None:
+            _subtract(self.word_counter, packed_items(packed))
+
+    def add(self, r):
+        if isinstance(r, FileRecord):
+            self._add_record(r, add)
+            if self.detailed:
+                self._add_counts(r)
+            return
+        self.files += 1
+        self.words += r.get('words', 0)
+        self.vowels += r.get('vowels', 0)
+        self.digits += r.get('digits', 0)
+        self.symbols += r.get('symbols', 0)
+        self.avg_len_sum += r.get('avg_len', 0)
+        if self.detailed:
+            self._add_counts(r)
+            _fold_histogram(self.hist, self.hist_overflow, r.get('len_histogram', {}), add)
+
+    def add_words(self, partial):
+        """Merge the word partial of a worker task (modules.wordcount.word_partial)."""
+        if isinstance(self.word_counter, MisraGries):
+            self.word_counter.merge_partial(partial)
+        else:
+            add_packed(self.word_counter, partial[0])
+
+    def remove(self, r):
+        """Undo an earlier `add(r)`, e.g. for a file that changed or was deleted."""
+        if self.detailed and isinstance(self.word_counter, MisraGries):
+            raise ValueError('cannot remove files from a word sketch')
+        if isinstance(r, FileRecord):
+            self._add_record(r, sub)
+            if self.detailed:
+                self._remove_counts(r)
+            return
+        self.files -= 1
+        self.words -= r.get('words', 0)
+        self.vowels -= r.get('vowels', 0)
+        self.digits -= r.get('digits', 0)
+        self.symbols -= r.get('symbols', 0)
+        self.avg_len_sum -= r.get('avg_len', 0)
+        if self.detailed:
+            self._remove_counts(r)
+            _fold_histogram(self.hist, self.hist_overflow, r.get('len_histogram', {}), sub)
+
+    def partial(self):
+        words = None
+        if self.detailed:
+            words = (self.word_counter.pack() if isinstance(self.word_counter, MisraGries)
+                     else word_partial(self.word_counter))
+        return {'files': self.files, 'words': self.words, 'vowels': self.vowels,
+                'digits': self.digits, 'symbols': self.symbols, 'avg_len_sum': self.avg_len_sum,
+                'hist': list(self.hist), 'hist_overflow': dict(self.hist_overflow),
+                'word_counts': words}
+
+    def merge(self, partial):
+        """Add the totals of another Aggregator's `partial`."""
+        self.files += partial['files']
+        self.words += partial['words']
+        self.vowels += partial['vowels']
+        self.digits += partial['digits']
+        self.symbols += partial['symbols']
+        self.avg_len_sum += partial['avg_len_sum']
+        if self.detailed:
+            self.hist[:] = map(add, self.hist, partial['hist'])
+            self.hist_overflow.update(partial['hist_overflow'])
+            if partial['word_counts'] is not None:
+                self.add_words(partial['word_counts'])
+
+    def summary(self):
+        return {'files': self.files, 'words': self.words, 'vowels': self.vowels,
+                'digits': self.digits, 'symbols': self.symbols,
+                'avg_len': self.avg_len_sum / self.files if self.files else 0}
@@ -0,0 +1,94 @@
+import sys
+import json
+import time
+
+from modules.writers import without_counts
+
+
+# Machine-readable result protocol of analyze_files.py / analyze_mpi.py
+# (--result-stream). One compact JSON object per line, each with a 'type':
+#
+#   start     {'version', 'runner', 'config'}
+#   progress  {'phase', 'done', 'total'}
+#   file      {'path', 'result'} or {'path', 'error'}   (only with --stream-files)
+#   summary   the metrics dict the runner returns, full precision
+#   end       {}
+#
+# Consumers read records until 'end'; a stream that stops before it belongs
+# to a run that died.
+
+PROTOCOL_VERSION = 1
+# progress records are rate limited, per-file ones would swamp the reader
+PROGRESS_INTERVAL = 0.2
+
+
+def reserve_stdout():
+    """Point print() at stderr so stdout carries nothing but protocol records."""
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    return stdout
+
+
+class ResultStream:
+    """Writes protocol records to a text file object, one line each."""
+
+    def __init__(self, f, per_file=False):
+        self._f = f
+        self.per_file = per_file
+        self._last_progress = 0.0
+
+    def emit(self, type, **fields):
+        record = {'type': type, **fields}
+        self._f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._f.flush()
+
+    def start(self, runner, config):
+        self.emit('start', version=PROTOCOL_VERSION, runner=runner, config=config)
+
+    def progress(self, phase, done, total):
+        now = time.monotonic()
+        if done < total and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        self.emit('progress', phase=phase, done=done, total=total)
+
+    def file(self, path, r=None, error=None):
+        if error is not None:
+            self.emit('file', path=path, error=error)
+        else:
+            self.emit('file', path=path, result=without_counts(r))
+
+    def summary(self, stats):
+        self.emit('summary', **stats)
+
+    def close(self):
+        self.emit('end')
+        if self._f not in (sys.__stdout__, sys.stdout):
+            self._f.close()
+
+
+def open_result_stream(path, per_file=False):
+    """Open a ResultStream on `path`; '-' takes over stdout (see reserve_stdout)."""
+    f = reserve_stdout() if path == '-' else open(path, 'w', encoding='utf-8')
+    return ResultStream(f, per_file)
+
+
+def read_records(lines):
+    """Decode protocol lines (str or bytes) into record dicts, stopping at 'end'.
+
+    Lines that are not JSON objects (stray output of a launcher, say) are
+    skipped.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(record, dict):
+            continue
+        yield record
+        if record.get('type') == 'end':
+            return
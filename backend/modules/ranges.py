@@ -0,0 +1,135 @@
+import os
+import re
+from collections import Counter
+
+from modules.analyzer import DEFAULT_ENGINE, get_analyzer
+from modules.records import FileRecord
+from modules.wordcount import pack_counter, unpack_counter
+
+
+# A single large file is analyzed as byte ranges that are cut right after an
+# ASCII whitespace byte. Such a byte never occurs inside a UTF-8 multi-byte
+# sequence and always separates words, so every range decodes on its own and
+# no word is split in two. Partial results of the ranges, merged in file
+# order with `merge_partials` and completed by `finish_partial`, equal the
+# whole-file analysis exactly.
+
+RANGE_BYTES = 32 * 1024 * 1024
+_WHITESPACE = re.compile(rb'[ \t\n\r\x0b\x0c\x1c-\x1f]')
+_SCAN_BLOCK = 64 * 1024
+
+
+def auto_ranges(size, workers, range_bytes=RANGE_BYTES):
+    """Enough ranges to keep every worker busy and bound each one's size."""
+    return max(1, workers or 1, -(-size // range_bytes))
+
+
+def _next_boundary(f, pos, size):
+    """Offset just past the first ASCII whitespace byte at or after `pos`."""
+    f.seek(pos)
+    while pos < size:
+        block = f.read(_SCAN_BLOCK)
+        if not block:
+            break
+        m = _WHITESPACE.search(block)
+        if m:
+            return pos + m.start() + 1
+        pos += len(block)
+    return size
+
+
+def split_ranges(path, parts):
+    """Split `path` into at most `parts` (start, end) ranges of similar size.
+
+    Each cut is moved forward to just past the next whitespace byte, so a
+    range can come out longer than the others (a very long token) or ranges
+    can collapse into fewer than `parts`.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return [(0, 0)]
+    parts = max(1, min(parts, size))
+    ranges = []
+    start = 0
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            if start >= size:
+                break
+            cut = _next_boundary(f, max(start, size * i // parts), size)
+            if cut > start:
+                ranges.append((start, cut))
+                start = cut
+    if start < size:
+        ranges.append((start, size))
+    return ranges
+
+
+def read_range(span):
+    """Reader for (path, start, end) spans."""
+    path, start, end = span
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def as_partial(r):
+    """Make an analyzer result (with 'word_counts' if detailed) mergeable.
+
+    A partial carries 'len_sum', the total word length, so the merged
+    average is computed from integers exactly as the whole-file analysis
+    does.
+    """
+    if isinstance(r, FileRecord):
+        r = r.as_dict()
+    if 'len_histogram' in r:
+        r['len_sum'] = sum(n * c for n, c in r['len_histogram'].items())
+    else:
+        # avg_len is an integer sum divided by the word count, so this
+        # recovers the sum exactly for any realistic file size
+        r['len_sum'] = round(r['avg_len'] * r['words'])
+    return r
+
+
+def analyze_part(data, detailed=False, top_k=20, engine=DEFAULT_ENGINE):
+    """Worker entry point: analyze one range into a partial result."""
+    analyzer = get_analyzer(engine, detailed, counts=True)
+    return as_partial(analyzer(data, top_k) if detailed else analyzer(data))
+
+
+def merge_partials(parts):
+    """Combine partial results, given in file order, into one partial.
+
+    An empty dict stands for a range-less part and merges as zero.
+
+    Merging in file order keeps the order of first occurrence of every
+    word, so ties in 'top_words' later break the same way as for the whole
+    text.
+    """
+    merged = {key: sum(p.get(key, 0) for p in parts)
+              for key in ('words', 'vowels', 'digits', 'symbols', 'len_sum')}
+    detailed = [p for p in parts if 'word_counts' in p]
+    if detailed:
+        counter = Counter()
+        len_hist = Counter()
+        for p in detailed:
+            counter.update(unpack_counter(p['word_counts']))
+            len_hist.update(p['len_histogram'])
+        merged['word_counts'] = pack_counter(counter)
+        merged['len_histogram'] = dict(len_hist)
+    return merged
+
+
+def finish_partial(partial, top_k=20):
+    """Turn a (merged) partial into the result the analyzers return."""
+    words = partial['words']
+    result = {
+        'words': words,
+        'vowels': partial['vowels'],
+        'digits': partial['digits'],
+        'symbols': partial['symbols'],
+        'avg_len': partial['len_sum'] / words if words else 0
+    }
+    if 'word_counts' in partial:
+        result['top_words'] = unpack_counter(partial['word_counts']).most_common(top_k)
+        result['len_histogram'] = partial['len_histogram']
+    return result
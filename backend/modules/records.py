@@ -0,0 +1,139 @@
+from array import array
+
+from modules.wordcount import pack_counter, packed_items, unpack_counter
+
+
+# Word lengths 0 .. LEN_HIST_WIDTH - 1 get a slot of their own in the dense
+# length histograms; the rare longer tokens are kept in a small overflow
+# dict so totals stay exact.
+LEN_HIST_WIDTH = 64
+
+_KEYS = ('words', 'vowels', 'digits', 'symbols', 'avg_len',
+         'top_words', 'len_histogram', 'word_counts')
+
+
+class FileRecord:
+    """Per-file analysis result with a fixed layout.
+
+    Pickles as one flat tuple of numbers and byte strings: the length
+    histogram is an int array trimmed after the longest word and the top
+    words are packed like modules.wordcount counters, instead of a dict of
+    string keys, a dict of boxed ints and a list of tuples. A record that
+    carries its full 'word_counts' only stores how many top words it had
+    and derives the list from the counts when it is first asked for. It answers
+    `get`, `[]` and `in` with the keys of the analyzer dicts, so code that
+    reads results does not need to know which kind it got; `as_dict`
+    converts it back.
+    """
+
+    __slots__ = ('words', 'vowels', 'digits', 'symbols', 'avg_len',
+                 'len_hist', 'len_overflow', '_top', 'word_counts')
+
+    def __init__(self, words, vowels, digits, symbols, avg_len,
+                 len_hist=None, len_overflow=None, top_words=None, word_counts=None):
+        self.words = words
+        self.vowels = vowels
+        self.digits = digits
+        self.symbols = symbols
+        self.avg_len = avg_len
+        self.len_hist = len_hist
+        self.len_overflow = len_overflow
+        self._top = top_words  # or the number of top words to derive from word_counts
+        self.word_counts = word_counts
+
+    @property
+    def top_words(self):
+        if isinstance(self._top, int):
+            # counts keep the order words were first seen, so ties come out as the analyzer had them
+            self._top = unpack_counter(self.word_counts).most_common(self._top)
+        return self._top
+
+    @classmethod
+    def from_result(cls, r):
+        """Build a record from an analyzer result dict."""
+        len_hist = overflow = None
+        if 'len_histogram' in r:
+            len_hist, overflow = dense_histogram(r['len_histogram'])
+        return cls(r['words'], r['vowels'], r['digits'], r['symbols'], r['avg_len'],
+                   len_hist, overflow, r.get('top_words'), r.get('word_counts'))
+
+    def __reduce__(self):
+        hist = top = None
+        if self.len_hist is not None:
+            hist = (self.len_hist.typecode, self.len_hist.tobytes())
+        if self._top is not None:
+            if self.word_counts is not None:
+                top = self._top if isinstance(self._top, int) else len(self._top)
+            else:
+                top = pack_counter(dict(self._top))
+        return (_rebuild, (self.words, self.vowels, self.digits, self.symbols, self.avg_len,
+                           hist, self.len_overflow, top, self.word_counts))
+
+    def stripped(self):
+        """A copy without the full word counts, keeping the top words."""
+        return FileRecord(self.words, self.vowels, self.digits, self.symbols, self.avg_len,
+                          self.len_hist, self.len_overflow, self.top_words)
+
+    def len_histogram(self):
+        """The histogram as the analyzers' {length: count} dict."""
+        hist = {n: c for n, c in enumerate(self.len_hist) if c}
+        if self.len_overflow:
+            hist.update(self.len_overflow)
+        return hist
+
+    def as_dict(self, counts=True):
+        r = {'words': self.words, 'vowels': self.vowels, 'digits': self.digits,
+             'symbols': self.symbols, 'avg_len': self.avg_len}
+        if self.len_hist is not None:
+            r['top_words'] = self.top_words
+            r['len_histogram'] = self.len_histogram()
+        if counts and self.word_counts is not None:
+            r['word_counts'] = self.word_counts
+        return r
+
+    def __contains__(self, key):
+        if key in ('top_words', 'len_histogram'):
+            return self.len_hist is not None
+        if key == 'word_counts':
+            return self.word_counts is not None
+        return key in _KEYS
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key == 'len_histogram':
+            return self.len_histogram()
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+def _rebuild(words, vowels, digits, symbols, avg_len, hist, overflow, top, word_counts):
+    """Unpickle a FileRecord from the packed tuple made by __reduce__."""
+    len_hist = None
+    if hist is not None:
+        len_hist = array(hist[0])
+        len_hist.frombytes(hist[1])
+    top_words = top if top is None or isinstance(top, int) else list(packed_items(top))
+    return FileRecord(words, vowels, digits, symbols, avg_len, len_hist, overflow, top_words, word_counts)
+
+
+def dense_histogram(hist):
+    """Split a {length: count} dict into (int array, overflow dict or None)."""
+    top = max((n for n in hist if n < LEN_HIST_WIDTH), default=-1)
+    dense = [0] * (top + 1)
+    overflow = None
+    for n, c in hist.items():
+        if n < LEN_HIST_WIDTH:
+            dense[n] = c
+        else:
+            overflow = overflow or {}
+            overflow[n] = c
+    typecode = 'I' if not dense or max(dense) < 2 ** 32 else 'Q'
+    return array(typecode, dense), overflow
+
+
+def compact(fn, *args, **kwargs):
+    """Run analyzer `fn` and return its result as a FileRecord (see get_analyzer)."""
+    return FileRecord.from_result(fn(*args, **kwargs))
@@ -0,0 +1,133 @@
+import os
+import queue
+import threading
+from multiprocessing.shared_memory import SharedMemory
+
+from modules.analyzer import DEFAULT_ENGINE
+from modules.batching import task_analyzer
+from modules.wordcount import word_partial
+
+
+class SegmentRing:
+    """A fixed pool of reusable shared memory segments.
+
+    Reader threads `acquire` a segment, fill it with file contents and hand
+    its name to a worker; the segment goes back to the ring with `release`
+    once the worker is done. A request larger than the regular segment size
+    gets a one-off segment that is unlinked on release. `close` unlinks
+    everything still alive, so call it from a `finally`.
+    """
+
+    def __init__(self, count, size):
+        self.size = size
+        self._free = queue.Queue()
+        self._lock = threading.Lock()
+        self._live = {}
+        for _ in range(count):
+            seg = self._create(size)
+            self._free.put(seg)
+
+    def _create(self, size):
+        seg = SharedMemory(create=True, size=max(1, size))
+        with self._lock:
+            self._live[seg.name] = seg
+        return seg
+
+    def acquire(self, nbytes):
+        if nbytes > self.size:
+            return self._create(nbytes)
+        return self._free.get()
+
+    def release(self, seg):
+        if seg.size > self.size:
+            self._destroy(seg)
+        else:
+            self._free.put(seg)
+
+    def _destroy(self, seg):
+        with self._lock:
+            self._live.pop(seg.name, None)
+        try:
+            seg.close()
+        finally:
+            # unlink even if close fails, or the segment stays in /dev/shm
+            try:
+                seg.unlink()
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        with self._lock:
+            segs = list(self._live.values())
+        for seg in segs:
+            try:
+                self._destroy(seg)
+            except BufferError:
+                pass  # still exported somewhere; unlinked, freed with the last view
+
+
+def fill_segment(ring, paths):
+    """Reader-thread side: copy `paths` into one segment from `ring`.
+
+    Files are read with `readinto` straight into the shared buffer, so the
+    bytes are copied exactly once. Returns (segment, entries, errors) where
+    entries is [(path, offset, length), ...] and errors maps path -> message.
+    """
+    sizes = {}
+    errors = {}
+    for path in paths:
+        try:
+            sizes[path] = os.path.getsize(path)
+        except OSError as e:
+            errors[path] = f'read failed: {e}'
+
+    seg = ring.acquire(sum(sizes.values()))
+    entries = []
+    offset = 0
+    try:
+        buf = seg.buf
+        for path, size in sizes.items():
+            try:
+                with open(path, 'rb') as f:
+                    # a file that grew since stat is cut at the stat'ed size
+                    n = f.readinto(buf[offset:offset + size]) if size else 0
+            except OSError as e:
+                errors[path] = f'read failed: {e}'
+                continue
+            entries.append((path, offset, n))
+            offset += size
+        del buf
+    except BaseException:
+        ring.release(seg)
+        raise
+    return seg, entries, errors
+
+
+def analyze_shared(name, spans, detailed=False, top_k=20, engine=DEFAULT_ENGINE, merge_words=False,
+                   word_sketch=None):
+    """Worker side: analyze the (offset, length) `spans` of segment `name`.
+
+    Only the segment name and spans cross the process boundary. Returns
+    (results, words): one result per span, in order ({'error': message}
+    for a failed one), and with `merge_words` the word partial of all spans
+    (see modules.batching.analyze_batch), else None.
+    """
+    analyzer, words = task_analyzer(engine, detailed, merge_words)
+    shm = SharedMemory(name=name)
+    out = []
+    try:
+        buf = shm.buf
+        for offset, length in spans:
+            data = bytes(buf[offset:offset + length])
+            try:
+                if detailed:
+                    out.append(analyzer(data, top_k))
+                else:
+                    out.append(analyzer(data))
+            except Exception as e:
+                out.append({'error': f'analysis failed: {e}'})
+        del buf
+    finally:
+        # only detach; the parent owns and unlinks the segment
+        shm.close()
+    return out, word_partial(words, word_sketch) if words is not None else None
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import pickle
+import threading
+from collections import Counter, defaultdict
+
+
+# Pipeline instrumentation. When a Tracer is passed to the pipelines, work
+# sent to a pool is wrapped in `timed_call`, which reports when it started
+# and ended and on which worker; the parent turns that into per-stage
+# latency histograms, per-worker busy time and IPC byte counts. Without a
+# Tracer tasks are submitted as they are. Individual spans for a Chrome
+# trace (chrome://tracing, ui.perfetto.dev) are only kept when asked for.
+#
+# perf_counter is CLOCK_MONOTONIC on Linux, shared by all processes, so
+# timestamps taken in workers line up with the parent's.
+
+def _worker():
+    return f'{os.getpid()}/{threading.current_thread().name}'
+
+
+def timed_call(fn, *args):
+    """Run fn(*args) in a pool; returns (result, start, end, worker, pickled).
+
+    In a worker process the result is pickled right here and `pickled` is
+    True: what travels back over IPC is then that one bytes object, whose
+    length Tracer.record counts before unpickling it, so the result is not
+    serialized twice. In a thread the result is returned as is.
+    """
+    start = time.perf_counter()
+    result = fn(*args)
+    end = time.perf_counter()
+    if threading.current_thread() is threading.main_thread():
+        return pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), start, end, _worker(), True
+    return result, start, end, _worker(), False
+
+
+class Histogram:
+    """Latency histogram with power-of-two microsecond buckets."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = Counter()
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[max(0, int(seconds * 1e6)).bit_length()] += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, in seconds."""
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.max, (2 ** bucket) / 1e6)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_s': self.total,
+            'mean_ms': self.total / self.count * 1e3 if self.count else 0.0,
+            'p50_ms': self.quantile(0.5) * 1e3,
+            'p90_ms': self.quantile(0.9) * 1e3,
+            'p99_ms': self.quantile(0.99) * 1e3,
+            'max_ms': self.max * 1e3,
+            # bucket b holds durations in [2**(b-1), 2**b) microseconds
+            'buckets_us': {str(2 ** b): n for b, n in sorted(self.buckets.items())},
+        }
+
+
+class Tracer:
+    """Collects per-stage timings, queue depths, worker busy time and IPC bytes.
+
+    Stages recorded by the pipelines:
+      <stage>_wait    submit -> start on a worker (queueing and pickling in)
+      <stage>         the work itself on the worker
+      <stage>_return  end on the worker -> result seen by the parent
+    plus 'aggregate' for the parent's own bookkeeping.
+    """
+
+    def __init__(self, events=False):
+        self.origin = time.perf_counter()
+        self.stages = defaultdict(Histogram)
+        self.busy = Counter()
+        self.ipc_bytes = Counter()
+        self.depth_samples = 0
+        self.depth_sum = 0
+        self.depth_max = 0
+        self.events = [] if events else None
+
+    def span(self, stage, start, end, worker='parent'):
+        self.stages[stage].add(end - start)
+        if self.events is not None:
+            self.events.append((stage, start, end, worker))
+
+    def record(self, stage, submitted, payload):
+        """Book a `timed_call` result submitted at `submitted`; returns the real result."""
+        result, start, end, worker, pickled = payload
+        now = time.perf_counter()
+        self.stages[stage + '_wait'].add(max(0.0, start - submitted))
+        self.stages[stage + '_return'].add(max(0.0, now - end))
+        self.span(stage, start, end, worker)
+        self.busy[worker] += end - start
+        if pickled:
+            self.ipc_bytes['from_workers'] += len(result)
+            result = pickle.loads(result)
+        return result
+
+    def sent(self, nbytes):
+        self.ipc_bytes['to_workers'] += nbytes
+
+    def depth(self, n):
+        self.depth_samples += 1
+        self.depth_sum += n
+        if n > self.depth_max:
+            self.depth_max = n
+
+    def summary(self, wall_time=None):
+        wall = wall_time or (time.perf_counter() - self.origin)
+        return {
+            'stages': {name: h.summary() for name, h in sorted(self.stages.items())},
+            'queue_depth': {
+                'samples': self.depth_samples,
+                'mean': self.depth_sum / self.depth_samples if self.depth_samples else 0.0,
+                'max': self.depth_max,
+            },
+            'worker_utilization': {w: busy / wall for w, busy in sorted(self.busy.items())},
+            'ipc_bytes': dict(self.ipc_bytes),
+        }
+
+    def write_chrome_trace(self, path):
+        """Write the recorded spans as Chrome trace JSON (one track per worker thread)."""
+        tracks = {}
+        events = []
+        for stage, start, end, worker in self.events or ():
+            if worker not in tracks:
+                pid, _, thread = worker.partition('/')
+                tid = len(tracks) + 1
+                tracks[worker] = (int(pid) if pid.isdigit() else 0, tid)
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': tracks[worker][0], 'tid': tid,
+                               'args': {'name': f'{thread or worker} ({pid})'}})
+            pid, tid = tracks[worker]
+            events.append({'name': stage, 'cat': 'pipeline', 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def report(self, log=print):
+        """Short human-readable per-stage table."""
+        log('  Stage timings (count, mean, p90, max ms):')
+        for name, h in sorted(self.stages.items()):
+            s = h.summary()
+            log(f"    {name:<16} {s['count']:>7} {s['mean_ms']:>9.3f} {s['p90_ms']:>9.3f} {s['max_ms']:>9.3f}")
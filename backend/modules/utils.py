@@ -1,6 +1,9 @@
 import os
+import math
 import random
 import string
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 
 def generate_dummy_files(folder='data', count=810, seed=237006081):
@@ -13,11 +16,15 @@ def generate_dummy_files(folder='data', count=810, seed=237006081):
             f.write(text)
 
 
-def generate_random_assignment_files(folder='data', count=810, seed=237006081):
+def generate_random_assignment_files(folder='data', count=810, seed=237006081, sentences=20):
     """Generate `count` text files with mixed content (letters, digits, punctuation)
 
     The files are suitable for testing the Parallel File Analyzer: they include
     vowels, words, digits and symbols. Files are named `sample_001.txt` .. `sample_{count:03d}.txt`.
+
+    `sentences` sets the file size: a fixed number of sentences per file
+    (about 110 bytes each), or a (min, max) pair to draw each file's count
+    uniformly for a mixed-size corpus.
     """
     os.makedirs(folder, exist_ok=True)
     random.seed(seed)
@@ -29,8 +36,9 @@ def generate_random_assignment_files(folder='data', count=810, seed=237006081):
 
     for i in range(1, count + 1):
         parts = []
-        # create 20 sentences per file; each sentence contains words, digits and symbols
-        for _ in range(20):
+        n_sentences = sentences if isinstance(sentences, int) else random.randint(*sentences)
+        # each sentence contains words, digits and symbols
+        for _ in range(n_sentences):
             # build 8-16 words per sentence
             words = []
             for _w in range(random.randint(8, 16)):
@@ -50,6 +58,217 @@ def generate_random_assignment_files(folder='data', count=810, seed=237006081):
             f.write(content)
 
 
+# --- Fast corpus generator -------------------------------------------------
+#
+# generate_corpus builds every file from its own NumPy generator seeded with
+# (seed, file number), so the bytes of a file do not depend on how many
+# workers ran or which one made it; file sizes come from one vectorized draw
+# seeded with (seed, 0). A file is a run of words drawn Zipf-weighted from
+# one fixed vocabulary of mixed letter/digit words, each followed by a
+# separator (mostly a space, sometimes a comma or a sentence end of
+# punctuation and digits plus a newline), so word frequencies, lengths and
+# the character mix resemble generate_random_assignment_files with the
+# repeated words of real text. Chunks of files are made on a process pool
+# and written as files, into a pack (modules.pack) or at precomputed
+# offsets of one large file.
+
+CORPUS_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal', 'pareto')
+CORPUS_OUTPUTS = ('files', 'pack', 'single')
+GENERATE_CHUNK = 256
+LOGNORMAL_SIGMA = 1.0
+PARETO_ALPHA = 1.5
+VOCAB_SIZE = 20000
+VOCAB_SEED = 237006081  # the vocabulary is the same for every corpus
+ZIPF_EXPONENT = 1.0
+
+_VOCAB = None
+
+
+class _Vocabulary:
+    """Word and separator strings concatenated into one byte table.
+
+    `word_starts`/`word_lengths` and `sep_starts`/`sep_lengths` locate the
+    pieces in `table`; `cdf` is the cumulative Zipf weight of the words in
+    the order they were drawn, and `mean_bytes` the expected bytes per word
+    plus separator.
+    """
+
+    def __init__(self):
+        import numpy as np
+
+        rnd = random.Random(VOCAB_SEED)
+        chars = string.ascii_letters * 2 + string.digits
+        words = {}  # insertion ordered, unlike a set of str
+        while len(words) < VOCAB_SIZE:
+            # 1-12 characters, mostly short like the space-split words of the assignment files
+            n = 1
+            while n < 12 and rnd.random() < 0.7:
+                n += 1
+            words[''.join(rnd.choices(chars, k=n))] = None
+        words = list(words)
+        ends = [''.join(rnd.choices(string.punctuation + string.digits, k=rnd.randint(0, 6))) + '\n'
+                for _ in range(6)]
+        # 100 equally likely separators: 93 spaces, a comma and 6 sentence ends
+        separators = [' '] * 93 + [', '] + ends
+
+        pieces = words + separators
+        lengths = np.array([len(p) for p in pieces], dtype=np.int64)
+        starts = np.cumsum(lengths) - lengths
+        self.table = np.frombuffer(''.join(pieces).encode('ascii'), dtype=np.uint8)
+        self.word_starts, self.word_lengths = starts[:len(words)], lengths[:len(words)]
+        self.sep_starts, self.sep_lengths = starts[len(words):], lengths[len(words):]
+        weights = 1.0 / np.arange(1, len(words) + 1) ** ZIPF_EXPONENT
+        weights /= weights.sum()
+        self.cdf = np.cumsum(weights)
+        self.cdf[-1] = 1.0
+        self.mean_bytes = float(weights @ self.word_lengths + self.sep_lengths.mean())
+
+
+def _vocabulary():
+    global _VOCAB
+    if _VOCAB is None:
+        _VOCAB = _Vocabulary()
+    return _VOCAB
+
+
+def corpus_sizes(count, mean_bytes=2200, distribution='lognormal', seed=237006081, max_bytes=None):
+    """File sizes (int64 array) for `count` files averaging about `mean_bytes`.
+
+    'fixed' gives every file `mean_bytes`, 'uniform' draws from 1 ..
+    2 * mean_bytes, 'lognormal' has a long right tail (sigma
+    LOGNORMAL_SIGMA) and 'pareto' a heavy one (alpha PARETO_ALPHA, a few
+    files orders of magnitude above the mean). `max_bytes` caps the sizes.
+    """
+    import numpy as np
+
+    if distribution not in CORPUS_DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution '{distribution}', expected one of {', '.join(CORPUS_DISTRIBUTIONS)}")
+    rng = np.random.default_rng([seed, 0])
+    if distribution == 'fixed':
+        sizes = np.full(count, mean_bytes, dtype=np.float64)
+    elif distribution == 'uniform':
+        sizes = rng.integers(1, 2 * mean_bytes, count, endpoint=True).astype(np.float64)
+    elif distribution == 'lognormal':
+        sizes = rng.lognormal(math.log(mean_bytes) - LOGNORMAL_SIGMA ** 2 / 2, LOGNORMAL_SIGMA, count)
+    else:
+        scale = mean_bytes * (PARETO_ALPHA - 1) / PARETO_ALPHA
+        sizes = (rng.pareto(PARETO_ALPHA, count) + 1) * scale
+    if max_bytes is not None:
+        sizes = np.minimum(sizes, max_bytes)
+    return np.maximum(sizes, 1).astype(np.int64)
+
+
+def corpus_file(seed, number, size):
+    """The bytes of file `number` (1-based) of the corpus made with `seed`."""
+    import numpy as np
+
+    vocab = _vocabulary()
+    rng = np.random.default_rng([seed, number])
+    n = int(size / vocab.mean_bytes * 1.2) + 8
+    while True:
+        words = np.searchsorted(vocab.cdf, rng.random(n), side='right')
+        seps = rng.integers(0, len(vocab.sep_starts), n)
+        # word, separator, word, separator, ... as (start, length) pieces of the table
+        starts = np.empty(2 * n, dtype=np.int64)
+        lengths = np.empty(2 * n, dtype=np.int64)
+        starts[0::2], starts[1::2] = vocab.word_starts[words], vocab.sep_starts[seps]
+        lengths[0::2], lengths[1::2] = vocab.word_lengths[words], vocab.sep_lengths[seps]
+        ends = np.cumsum(lengths)
+        if ends[-1] >= size:
+            break
+        n *= 2  # an unusually long draw; try again with more words
+    k = int(np.searchsorted(ends, size)) + 1
+    starts, lengths, ends = starts[:k], lengths[:k], ends[:k]
+    # one gather copies all pieces: output byte i comes from table[i + shift of its piece]
+    index = np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1])
+    return vocab.table[index[:size]].tobytes()
+
+
+def _make_chunk(seed, first, sizes):
+    return [corpus_file(seed, first + k, int(n)) for k, n in enumerate(sizes)]
+
+
+def _write_files_chunk(seed, first, sizes, folder, names):
+    for data, name in zip(_make_chunk(seed, first, sizes), names):
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(data)
+    return int(sum(sizes))
+
+
+def _write_single_chunk(seed, first, sizes, path, offset):
+    # files are separated by one newline so no word spans two of them
+    data = b'\n'.join(_make_chunk(seed, first, sizes)) + b'\n'
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, offset)
+    finally:
+        os.close(fd)
+    return len(data)
+
+
+def _ordered(pool, tasks, window):
+    """Submit (fn, *args) tasks at most `window` ahead, yield results in order."""
+    pending = deque()
+    tasks = iter(tasks)
+    for task in tasks:
+        pending.append(pool.submit(*task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def generate_corpus(folder='data', count=810, seed=237006081, distribution='lognormal', mean_bytes=2200,
+                    max_bytes=None, output='files', path=None, codec='none', workers=None, prefix='sample'):
+    """Generate a large random corpus quickly on `workers` processes.
+
+    Files are named `{prefix}_{n}.txt` with n zero-padded to the width of
+    `count`. `output` 'files' writes them into `folder`; 'pack' writes a
+    pack directory at `path` (default: folder + '.pack', blocks compressed
+    with `codec`) whose files read back as if they were in `folder`;
+    'single' writes them into one file at `path` (default: folder +
+    '.txt'), each followed by a newline, for the --file mode. The content
+    is the same for any worker count. Returns the total bytes of the files.
+    """
+    import numpy as np
+
+    if output not in CORPUS_OUTPUTS:
+        raise ValueError(f"Unknown output '{output}', expected one of {', '.join(CORPUS_OUTPUTS)}")
+    sizes = corpus_sizes(count, mean_bytes, distribution, seed, max_bytes)
+    width = max(3, len(str(count)))
+    names = [f'{prefix}_{i:0{width}d}.txt' for i in range(1, count + 1)]
+    starts = range(0, count, GENERATE_CHUNK)
+    workers = workers or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if output == 'files':
+            os.makedirs(folder, exist_ok=True)
+            tasks = ((_write_files_chunk, seed, i + 1, sizes[i:i + GENERATE_CHUNK], folder,
+                      names[i:i + GENERATE_CHUNK]) for i in starts)
+            for _ in _ordered(pool, tasks, 2 * workers):
+                pass
+        elif output == 'single':
+            path = path or os.path.normpath(folder) + '.txt'
+            # every chunk knows its offset up front, so the chunks are written in parallel
+            offsets = np.concatenate(([0], np.cumsum(sizes + 1)))
+            with open(path, 'wb') as f:
+                f.truncate(int(offsets[-1]))
+            tasks = ((_write_single_chunk, seed, i + 1, sizes[i:i + GENERATE_CHUNK], path, int(offsets[i]))
+                     for i in starts)
+            for _ in _ordered(pool, tasks, 2 * workers):
+                pass
+        else:
+            from modules.pack import PACK_SUFFIX, PackWriter
+
+            writer = PackWriter(path or os.path.normpath(folder) + PACK_SUFFIX, folder, codec)
+            tasks = ((_make_chunk, seed, i + 1, sizes[i:i + GENERATE_CHUNK]) for i in starts)
+            for i, chunk in zip(starts, _ordered(pool, tasks, 2 * workers)):
+                for name, data in zip(names[i:i + GENERATE_CHUNK], chunk):
+                    writer.add(name, data)
+            writer.close()
+    return int(sizes.sum())
+
+
 def params_from_nim(nim):
     """Derive parameters from a NIM string or int.
 
@@ -0,0 +1,109 @@
+from array import array
+from collections import Counter
+
+
+# A packed counter is (typecode, words, counts): the words joined by '\n'
+# (tokens never contain whitespace) and the counts as raw array bytes. It
+# pickles to a fraction of the size of a dict or a list of (word, count)
+# tuples, which matters because one is sent back for every worker task.
+#
+# A word partial is what a task sends back for the global word counts:
+# (packed counter, tokens counted, error), the counts of all files of the
+# task merged in the worker, optionally cut to a Misra-Gries summary there.
+
+def pack_counter(counter):
+    typecode = 'I' if not counter or max(counter.values()) < 2 ** 32 else 'Q'
+    return (typecode, '\n'.join(counter), array(typecode, counter.values()).tobytes())
+
+
+def packed_items(packed):
+    """(word, count) pairs of a packed counter, in the order they were counted."""
+    typecode, words, raw = packed
+    if not words:
+        return iter(())
+    counts = array(typecode)
+    counts.frombytes(raw)
+    return zip(words.split('\n'), counts)
+
+
+def unpack_counter(packed):
+    return Counter(dict(packed_items(packed)))
+
+
+def add_packed(counter, packed):
+    """counter += a packed counter, without unpacking it into a Counter first."""
+    items = packed_items(packed)
+    if not counter:
+        dict.update(counter, items)
+        return
+    get = counter.get
+    for word, c in items:
+        counter[word] = get(word, 0) + c
+
+
+def word_partial(counter, sketch=None):
+    """The word partial of one task's merged `counter`.
+
+    With `sketch` the counts are cut to a Misra-Gries summary of that many
+    words first, so no task sends back more than `sketch` words.
+    """
+    if sketch:
+        summary = MisraGries(sketch)
+        summary.update(counter)
+        return summary.pack()
+    return pack_counter(counter), sum(counter.values()), 0
+
+
+class MisraGries:
+    """Bounded-memory heavy-hitter summary of word counts (Misra-Gries).
+
+    Keeps at most `capacity` words. Every reported count is a lower bound
+    of the true count and undercounts by at most `error`, which never
+    exceeds N / (capacity + 1) for N counted tokens. Any word whose true
+    count is above `error` is guaranteed to be in the summary. Summaries
+    built on different ranks can be merged and keep the same guarantee.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.counts = Counter()
+        self.total = 0
+        self.error = 0
+
+    def update(self, counter):
+        self.counts.update(counter)
+        self.total += sum(counter.values())
+        self._prune()
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.error += other.error
+        self._prune()
+
+    def merge_partial(self, partial):
+        """Merge a word partial (see `word_partial`) of exact or summarized counts."""
+        packed, total, error = partial
+        add_packed(self.counts, packed)
+        self.total += total
+        self.error += error
+        self._prune()
+
+    def pack(self):
+        """This summary as a word partial."""
+        return pack_counter(self.counts), self.total, self.error
+
+    def _prune(self):
+        if len(self.counts) <= self.capacity:
+            return
+        # subtract the (capacity+1)-th largest count from everything
+        cut = sorted(self.counts.values(), reverse=True)[self.capacity]
+        self.error += cut
+        self.counts = Counter(
+            {w: c - cut for w, c in self.counts.items() if c > cut})
+
+    def most_common(self, n=None):
+        return self.counts.most_common(n)
+
+    def __bool__(self):
+        return bool(self.counts)
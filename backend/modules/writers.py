@@ -0,0 +1,66 @@
+import os
+import csv
+import json
+import tempfile
+
+from modules.records import FileRecord
+
+
+CSV_HEADER = ['file', 'words', 'vowels', 'digits', 'symbols', 'avg_len']
+
+
+def csv_row(path, r):
+    return [os.path.basename(path), r.get('words', 0), r.get('vowels', 0),
+            r.get('digits', 0), r.get('symbols', 0), r.get('avg_len', 0)]
+
+
+def without_counts(r):
+    """`r` as a plain dict without the packed full word counts, which only feed the aggregate."""
+    if isinstance(r, FileRecord):
+        return r.as_dict(counts=False)
+    if 'word_counts' in r:
+        r = {k: v for k, v in r.items() if k != 'word_counts'}
+    return r
+
+
+class ResultWriter:
+    """Write per-file results to results.csv / results.json as they arrive.
+
+    CSV rows go straight to disk. The per-file JSON records are spooled to a
+    temporary file and streamed into results.json on `close`, so the final
+    file has the same layout as before without holding every result in
+    memory.
+    """
+
+    def __init__(self, json_path='results.json', csv_path='results.csv'):
+        self.json_path = json_path
+        self.csv_path = csv_path
+        self._csv_file = open(csv_path, 'w', newline='', encoding='utf-8')
+        self._csv = csv.writer(self._csv_file)
+        self._csv.writerow(CSV_HEADER)
+        self._spool = tempfile.TemporaryFile(
+            'w+', encoding='utf-8', dir=os.path.dirname(os.path.abspath(json_path)))
+
+    def add(self, path, r):
+        self._csv.writerow(csv_row(path, r))
+        self._spool.write(json.dumps([path, without_counts(r)], ensure_ascii=False) + '\n')
+
+    def close(self, aggregate, top_words=(), len_histogram=None):
+        self._csv_file.close()
+        self._spool.seek(0)
+        with open(self.json_path, 'w', encoding='utf-8') as f:
+            f.write('{\n  "aggregate": ')
+            f.write(json.dumps(aggregate, ensure_ascii=False))
+            f.write(',\n  "per_file": {')
+            sep = '\n    '
+            for line in self._spool:
+                path, r = json.loads(line)
+                f.write(sep + json.dumps(path, ensure_ascii=False) +
+                        ': ' + json.dumps(r, ensure_ascii=False))
+                sep = ',\n    '
+            f.write('\n  },\n  "top_words": ')
+            f.write(json.dumps(list(top_words), ensure_ascii=False))
+            f.write(',\n  "len_histogram": ')
+            f.write(json.dumps(len_histogram or {}, ensure_ascii=False))
+            f.write('\n}\n')
+        self._spool.close()
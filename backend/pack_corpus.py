@@ -0,0 +1,41 @@
+"""
+Pack a folder of .txt files into a packed corpus (see modules/pack.py).
+
+The files are concatenated into large segment files with an offset index,
+optionally zlib-compressed per block, so the analyzers can read millions
+of tiny files with a few large reads: pass the result to
+analyze_files.py / analyze_mpi.py with --pack.
+
+Example:
+    python pack_corpus.py --folder data --compress zlib
+    python analyze_files.py --pack data.pack --loader mmap
+"""
+
+import argparse
+
+from modules.pack import CODECS, DEFAULT_BLOCK_BYTES, DEFAULT_SEGMENT_BYTES, pack_corpus
+
+
+def build_parser():
+    p = argparse.ArgumentParser(description='Pack a folder of .txt files into segment files with an offset index')
+    p.add_argument('--folder', default='data',
+                   help='Folder containing .txt files')
+    p.add_argument('--out', default=None,
+                   help='Pack directory to write (default: the folder name plus .pack)')
+    p.add_argument('--compress', choices=CODECS, default='none',
+                   help='Compress every block on its own (zlib) or store the files as they are (none)')
+    p.add_argument('--block-bytes', type=int, default=DEFAULT_BLOCK_BYTES,
+                   help='Target bytes of files per block, the unit handed to the worker processes')
+    p.add_argument('--segment-bytes', type=int, default=DEFAULT_SEGMENT_BYTES,
+                   help='Maximum bytes per segment file')
+    p.add_argument('--limit-data', type=int, default=None,
+                   help='Pack only the first N files')
+    p.add_argument('--io-workers', type=int, default=8,
+                   help='Threads reading the source files')
+    return p
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    pack_corpus(args.folder, args.out, args.compress, args.block_bytes, args.segment_bytes,
+                args.limit_data, args.io_workers)